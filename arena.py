@@ -0,0 +1,333 @@
+from array import array
+
+import lexer
+import parser
+from parser import (
+    Int,
+    Float,
+    Constant,
+    Variable,
+    UnaryOperationExpression,
+    BinaryOperationExpression,
+    IfStatement,
+    Declaration,
+    AssignmentStatement,
+    ExpressionStatement,
+    ReturnStatement,
+    Argument,
+    Function,
+    Call,
+    Program,
+)
+from interning import symbols
+
+# How each node type's attributes are stored: (attribute, column, how).
+#
+#   node      index of a child node
+#   optional  index of a child node, or -1 for None
+#   list      index of a range of child nodes in the list tables
+#   token     index into the token table
+#   value     index into the table of constant values
+#   constant  a child node, or a str constant by symbol id
+#   id        a symbol id, stored as is
+#   name      the name of the symbol id in the same column
+#
+# 'name' fields read the column of an 'id' field, so they are not stored
+# separately and are skipped when a node is added.
+fields = {
+    Int: (('value', 0, 'value'),),
+    Float: (('value', 0, 'value'),),
+    Constant: (('value', 0, 'constant'),),
+    Variable: (('id', 0, 'id'), ('value', 0, 'name')),
+    UnaryOperationExpression: (('operator', 0, 'token'), ('operand', 1, 'node')),
+    BinaryOperationExpression: (('operator', 0, 'token'), ('lhs', 1, 'node'), ('rhs', 2, 'node')),
+    IfStatement: (('condition', 0, 'node'), ('body', 1, 'list'), ('else_body', 2, 'list')),
+    Declaration: (('type_name', 0, 'token'), ('name', 1, 'node'), ('initializer', 2, 'optional')),
+    AssignmentStatement: (('op', 0, 'token'), ('lhs', 1, 'node'), ('rhs', 2, 'node')),
+    ExpressionStatement: (('expression', 0, 'node'),),
+    ReturnStatement: (('expression', 0, 'optional'),),
+    Argument: (('type_name', 0, 'token'), ('name', 1, 'node')),
+    Function: (('return_type', 0, 'token'), ('name', 1, 'token'),
+               ('arguments', 2, 'list'), ('statements', 3, 'list')),
+    Call: (('id', 0, 'id'), ('name', 0, 'name'), ('arguments', 1, 'list')),
+    Program: (('functions', 0, 'list'),),
+}
+
+# Attributes that analysis passes set on nodes, and their values before.
+defaults = {
+    Variable: {'symbol': None},
+    Function: {'frame_size': None, 'symbol_count': None},
+}
+
+node_types = tuple(fields)
+
+COLUMNS = 4
+
+# A constant string is marked in the second column.
+STRING_CONSTANT = 1
+
+class Arena():
+    ''' AST nodes stored column-wise in arrays
+
+    Node i has its type code in kinds[i] and up to four int fields in
+    columns[0..3][i], laid out as in `fields`. Lists of children are ranges
+    of the children array. Tokens, constant values and names are stored
+    once each in tables and referred to by index.
+
+    Nodes are read through views: subclasses of the parser's node classes
+    that fetch each attribute from the columns when it is read, so passes
+    written for the object AST run unchanged. A view is made on each
+    access, so views of the same node are equal in content but not
+    identical. Assigning a node to a view's attribute adds it to the arena.
+    Lists read from a view are fresh; assign a list to change one. Other
+    attributes set on a view, like a Variable's symbol, are kept in a side
+    table.
+    '''
+    def __init__(self):
+        self.kinds = array('b')
+        self.columns = [array('i') for column in range(COLUMNS)]
+        self.children = array('i')
+        self.list_starts = array('i')
+        self.list_lengths = array('i')
+        # The length of each list's range, which a shorter list assigned
+        # in its place may leave partly unused.
+        self.list_capacities = array('i')
+        self.token_kinds = array('b')
+        self.token_texts = array('i')
+        self.token_index = {}
+        self.values = []
+        self.value_index = {}
+        self.extras = {}
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def add_token(self, token):
+        key = (token.kind, symbols.intern(str(token.value)))
+        index = self.token_index.get(key)
+        if index is None:
+            index = self.token_index[key] = len(self.token_kinds)
+            self.token_kinds.append(key[0])
+            self.token_texts.append(key[1])
+        return index
+
+    def token(self, index):
+        tok_type = lexer.all_token_types[self.token_kinds[index]]
+        return lexer.make_token(tok_type, symbols.name(self.token_texts[index]),
+                                None, None, None, None)
+
+    def add_value(self, value):
+        key = (type(value), value)
+        index = self.value_index.get(key)
+        if index is None:
+            index = self.value_index[key] = len(self.values)
+            self.values.append(value)
+        return index
+
+    def new_list(self, length):
+        start = len(self.children)
+        self.children.extend([0] * length)
+        self.list_starts.append(start)
+        self.list_lengths.append(length)
+        self.list_capacities.append(length)
+        return len(self.list_starts) - 1, start
+
+    def add(self, root):
+        '''Copy an object AST into the arena and return its index. Views of
+        this arena are not copied again.'''
+        result = [None]
+        columns = self.columns
+        # Each entry is a node and the array slot its index belongs in.
+        pending = [(root, result, 0)]
+        while pending:
+            node, target, at = pending.pop()
+            if isinstance(node, NodeView) and node.arena is self:
+                target[at] = node.index
+                continue
+            node_type = view_bases.get(type(node), type(node))
+            index = len(self.kinds)
+            target[at] = index
+            self.kinds.append(node_codes[node_type])
+            for column in columns:
+                column.append(0)
+            for name, column, how in fields[node_type]:
+                value = getattr(node, name)
+                if how == 'node':
+                    pending.append((value, columns[column], index))
+                elif how == 'optional':
+                    if value is None:
+                        columns[column][index] = -1
+                    else:
+                        pending.append((value, columns[column], index))
+                elif how == 'list':
+                    number, start = self.new_list(len(value))
+                    columns[column][index] = number
+                    for offset, child in enumerate(value):
+                        pending.append((child, self.children, start + offset))
+                elif how == 'token':
+                    columns[column][index] = self.add_token(value)
+                elif how == 'value':
+                    columns[column][index] = self.add_value(value)
+                elif how == 'constant':
+                    if isinstance(value, str):
+                        columns[column][index] = symbols.intern(value)
+                        columns[column + 1][index] = STRING_CONSTANT
+                    else:
+                        pending.append((value, columns[column], index))
+                elif how == 'id':
+                    columns[column][index] = value
+            for name, default in defaults.get(node_type, {}).items():
+                value = getattr(node, name, default)
+                if value is not default:
+                    self.extras[index, name] = value
+        return result[0]
+
+    def view(self, index):
+        view_type = view_types[self.kinds[index]]
+        view = view_type.__new__(view_type)
+        object.__setattr__(view, 'arena', self)
+        object.__setattr__(view, 'index', index)
+        return view
+
+    def get(self, index, column, how):
+        value = self.columns[column][index]
+        if how == 'node':
+            return self.view(value)
+        if how == 'optional':
+            return None if value < 0 else self.view(value)
+        if how == 'list':
+            start = self.list_starts[value]
+            return [self.view(child)
+                    for child in self.children[start:start + self.list_lengths[value]]]
+        if how == 'token':
+            return self.token(value)
+        if how == 'value':
+            return self.values[value]
+        if how == 'constant':
+            if self.columns[column + 1][index] == STRING_CONSTANT:
+                return symbols.name(value)
+            return self.view(value)
+        if how == 'name':
+            return symbols.name(value)
+        return value
+
+    def set(self, index, column, how, value):
+        columns = self.columns
+        if how in ('node', 'optional', 'constant'):
+            if value is None:
+                columns[column][index] = -1
+            elif isinstance(value, str):
+                columns[column][index] = symbols.intern(value)
+                columns[column + 1][index] = STRING_CONSTANT
+            else:
+                columns[column][index] = self.add(value)
+                if how == 'constant':
+                    columns[column + 1][index] = 0
+        elif how == 'list':
+            children = array('i', [self.add(child) for child in value])
+            number = columns[column][index]
+            if len(children) <= self.list_capacities[number]:
+                # The node's own list; the new one fits in its range.
+                start = self.list_starts[number]
+                self.list_lengths[number] = len(children)
+            else:
+                number, start = self.new_list(len(children))
+                columns[column][index] = number
+            self.children[start:start + len(children)] = children
+        elif how == 'token':
+            columns[column][index] = self.add_token(value)
+        elif how == 'value':
+            columns[column][index] = self.add_value(value)
+        elif how == 'name':
+            columns[column][index] = symbols.intern(value)
+        else:
+            columns[column][index] = value
+
+    def root(self):
+        '''A view of the last node added, the Program when built by
+        parse().'''
+        return self.view(len(self.kinds) - 1)
+
+    def count_kinds(self):
+        '''The number of nodes of each type, read off the kinds column
+        without making views.'''
+        counts = array('i', [0] * len(node_types))
+        for kind in self.kinds:
+            counts[kind] += 1
+        return {node_type.__name__: counts[code] for code, node_type in enumerate(node_types)}
+
+class NodeView():
+    ''' Base of the view classes: keeps attributes that have no column in
+    the arena's side table'''
+    __slots__ = ()
+    stored = frozenset()
+    defaults = {}
+
+    def __getattr__(self, name):
+        # Only called when no column or slot provides the attribute.
+        if name in ('arena', 'index'):
+            raise AttributeError(name)
+        try:
+            return self.arena.extras[self.index, name]
+        except KeyError:
+            pass
+        try:
+            return self.defaults[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __setattr__(self, name, value):
+        if name in self.stored:
+            object.__setattr__(self, name, value)
+        else:
+            self.arena.extras[self.index, name] = value
+
+def field_property(column, how):
+    def get(view):
+        return view.arena.get(view.index, column, how)
+
+    def set(view, value):
+        view.arena.set(view.index, column, how, value)
+
+    return property(get, set)
+
+def make_view_type(node_type):
+    namespace = {
+        '__slots__': ('arena', 'index'),
+        'stored': frozenset(name for name, column, how in fields[node_type]),
+        'defaults': defaults.get(node_type, {}),
+    }
+    for name, column, how in fields[node_type]:
+        namespace[name] = field_property(column, how)
+    return type(node_type.__name__ + 'View', (NodeView, node_type), namespace)
+
+node_codes = {node_type: code for code, node_type in enumerate(node_types)}
+view_types = tuple(make_view_type(node_type) for node_type in node_types)
+# The node class each view class stands for.
+view_bases = {view_type: node_type for view_type, node_type in zip(view_types, node_types)}
+
+def parse(tokens, arena=None):
+    '''Parse a Program straight into an arena and return a view of it.
+
+    Each function is moved into the arena as soon as it is parsed, so only
+    one function at a time exists as objects.
+    '''
+    if arena is None:
+        arena = Arena()
+    if isinstance(tokens, list):
+        tokens = parser.TokenStream(tokens)
+    functions = []
+    while tokens.peek() is not None:
+        functions.append(arena.add(parser.parse_function_declaration(tokens)))
+        tokens.compact()
+    program = parser.Program([])
+    index = arena.add(program)
+    number, start = arena.new_list(len(functions))
+    arena.children[start:start + len(functions)] = array('i', functions)
+    arena.columns[0][index] = number
+    return arena.view(index)
+
+def from_program(program):
+    '''Copy an object AST into a new arena and return a view of its root.'''
+    arena = Arena()
+    return arena.view(arena.add(program))
@@ -0,0 +1,72 @@
+'''Build time, memory and traversal time of the object AST and the arena.
+
+Run from the repository root:
+
+    python -m bench.bench_arena [functions]
+
+The same generated program is parsed into parser node objects and into an
+arena.Arena. Memory is the traced size of the finished tree. Traversal
+visits every node through its attributes, which for the arena means
+making a view per node; the column scan counts node types straight from
+the arena's kinds array.
+'''
+import sys
+import time
+import tracemalloc
+
+import arena
+from lexer import lex
+from parser import parse
+from bench import generator
+
+def walk(root):
+    '''Visit every node below root through its attributes.'''
+    count = 0
+    pending = [root]
+    while pending:
+        node = pending.pop()
+        count += 1
+        for name, column, how in arena.fields[arena.view_bases.get(type(node), type(node))]:
+            if how in ('node', 'optional'):
+                child = getattr(node, name)
+                if child is not None:
+                    pending.append(child)
+            elif how == 'list':
+                pending.extend(getattr(node, name))
+            elif how == 'constant':
+                child = getattr(node, name)
+                if not isinstance(child, str):
+                    pending.append(child)
+    return count
+
+def measure_build(build, tokens):
+    tracemalloc.start()
+    start = time.perf_counter()
+    tree = build(list(tokens))
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # Build again untraced for the time, since tracing slows allocation.
+    start = time.perf_counter()
+    tree = build(list(tokens))
+    elapsed = time.perf_counter() - start
+    return tree, elapsed, size
+
+def main():
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    tokens = lex(generator.generate('functions', functions))
+    print('{0:>8} {1:>10} {2:>10} {3:>12} {4:>14}'.format(
+        'storage', 'nodes', 'build s', 'memory MiB', 'traversal s'))
+    for name, build in (('objects', parse), ('arena', arena.parse)):
+        tree, elapsed, size = measure_build(build, tokens)
+        start = time.perf_counter()
+        nodes = walk(tree)
+        traversal = time.perf_counter() - start
+        print('{0:>8} {1:>10} {2:>10.3f} {3:>12.2f} {4:>14.3f}'.format(
+            name, nodes, elapsed, size / (1 << 20), traversal))
+    start = time.perf_counter()
+    tree.arena.count_kinds()
+    print('column scan of {0} nodes: {1:.4f} s'.format(len(tree.arena), time.perf_counter() - start))
+
+if __name__ == '__main__':
+    main()
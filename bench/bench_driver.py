@@ -0,0 +1,56 @@
+'''Wall-clock time to compile a directory of files with pycc -j N.
+
+Run from the repository root:
+
+    python -m bench.bench_driver [files]
+
+Each run is a fresh pycc process, as a build system would start it. The
+speedup column should approach N up to the number of cores.
+'''
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+FUNCTION = '''int f{0}(int a, int b) {{
+  int c = a * {0} + b - 3;
+  if (c > 10) {{
+    c = c - b * 2;
+  }} else {{
+    c = c + a;
+  }}
+  return c == 42;
+}}
+'''
+
+def write_sources(directory, files, functions=200):
+    body = ''.join(FUNCTION.format(i) for i in range(functions))
+    for index in range(files):
+        with open(os.path.join(directory, 'unit{0}.c'.format(index)), 'w') as f:
+            f.write(body)
+
+def main():
+    files = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    pycc = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pycc.py')
+    directory = tempfile.mkdtemp()
+    try:
+        write_sources(directory, files)
+        cores = os.cpu_count() or 1
+        jobs = [1]
+        while jobs[-1] * 2 <= cores:
+            jobs.append(jobs[-1] * 2)
+        print('{0:>4} {1:>10} {2:>8}'.format('-j', 'seconds', 'speedup'))
+        baseline = None
+        for count in jobs:
+            start = time.perf_counter()
+            subprocess.run([sys.executable, pycc, '-j', str(count), directory], check=True)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            print('{0:>4} {1:>10.3f} {2:>8.2f}'.format(count, elapsed, baseline / elapsed))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
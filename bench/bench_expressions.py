@@ -0,0 +1,36 @@
+'''Expression parsing time for long generated operator chains.
+
+Run from the repository root:
+
+    python -m bench.bench_expressions
+
+Each expression mixes all binary precedence levels. Time per term should
+stay flat, and no size should raise RecursionError.
+'''
+import random
+import time
+
+from lexer import lex
+from parser import parse_expression
+
+OPERATORS = ('+', '-', '*', '/', '%', '<', '>=', '==', '!=', '&&', '||')
+
+def make_expression(terms, seed=0):
+    rng = random.Random(seed)
+    parts = ['x0']
+    for i in range(1, terms):
+        parts.append(rng.choice(OPERATORS))
+        parts.append('x{0}'.format(i) if i % 2 else str(i))
+    return ' '.join(parts)
+
+def main():
+    print('{0:>10} {1:>10} {2:>12}'.format('terms', 'seconds', 'us/term'))
+    for terms in (1000, 10000, 100000, 400000):
+        tokens = lex(make_expression(terms))
+        start = time.perf_counter()
+        parse_expression(tokens)
+        elapsed = time.perf_counter() - start
+        print('{0:>10} {1:>10.4f} {2:>12.2f}'.format(terms, elapsed, elapsed * 1e6 / terms))
+
+if __name__ == '__main__':
+    main()
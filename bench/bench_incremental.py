@@ -0,0 +1,54 @@
+'''Rebuild time after editing one function, against a full compile.
+
+Run from the repository root:
+
+    python -m bench.bench_incremental
+
+Simulates a watch loop: one function body in a file of N functions is
+edited and the file is rebuilt. The full compile grows with N; the
+incremental rebuild should stay nearly flat.
+'''
+import time
+
+from lexer import lex
+from parser import parse
+from codegen import codegen
+import incremental
+
+FUNCTION = '''int f{0}(int a, int b) {{
+  int c = a * {0} + b - 3;
+  if (c > 10) {{
+    c = c - b * 2;
+  }}
+  return c == 42;
+}}
+'''
+
+EDITS = 20
+
+def make_source(functions):
+    return ''.join(FUNCTION.format(i) for i in range(functions))
+
+def main():
+    print('{0:>10} {1:>12} {2:>14} {3:>8}'.format(
+        'functions', 'full ms', 'rebuild ms', 'speedup'))
+    for functions in (100, 200, 400, 800, 1600):
+        source = make_source(functions)
+        start = time.perf_counter()
+        codegen(parse(lex(source)))
+        full = time.perf_counter() - start
+
+        compiler = incremental.IncrementalCompiler(source)
+        middle = source.index('int f{0}('.format(functions // 2))
+        offset = source.index('b - 3', middle)
+        start = time.perf_counter()
+        for edit in range(EDITS):
+            # Alternate the constant so every edit changes the text.
+            compiler.edit(offset, offset + 5, 'b - {0}'.format(edit % 10))
+            compiler.assembly()
+        rebuild = (time.perf_counter() - start) / EDITS
+        print('{0:>10} {1:>12.2f} {2:>14.3f} {3:>8.0f}'.format(
+            functions, full * 1e3, rebuild * 1e3, full / rebuild))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+'''Lexer throughput at increasing input sizes.
+
+Run from the repository root:
+
+    python -m bench.bench_lexer
+
+The time per kilobyte should stay flat as the input grows; a rising column
+means lexing has gone superlinear again.
+'''
+import time
+
+from lexer import lex
+
+FUNCTION = '''int f{0}(int a, int b) {{
+  int c = a * {0} + b - 3;
+  return c == 42;
+}}
+'''
+
+def make_source(functions):
+    return ''.join(FUNCTION.format(i) for i in range(functions))
+
+def time_lex(source, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        tokens = lex(source)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(tokens)
+
+def main():
+    print('{0:>10} {1:>10} {2:>10} {3:>12}'.format('bytes', 'tokens', 'seconds', 'us/KB'))
+    for functions in (250, 500, 1000, 2000, 4000, 8000):
+        source = make_source(functions)
+        elapsed, count = time_lex(source)
+        print('{0:>10} {1:>10} {2:>10.4f} {3:>12.1f}'.format(
+            len(source), count, elapsed, elapsed * 1e6 / (len(source) / 1024)))
+
+if __name__ == '__main__':
+    main()
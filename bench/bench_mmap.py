@@ -0,0 +1,67 @@
+'''Lexing a large file from a str, a text file and a memory map.
+
+Run from the repository root:
+
+    python -m bench.bench_mmap [megabytes]
+
+Every token is produced and dropped, as the streaming parser consumes
+them, so what remains is the cost of getting the text to the lexer. The
+peak column is memory traced by tracemalloc: reading the file whole holds
+it as a str, chunked reading holds one chunk, and a memory map holds
+nothing beyond the tokens in flight. Values of mapped tokens are read
+here, as the parser would, so the decoding is timed too.
+'''
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+
+from lexer import iter_tokens, mapped
+from bench import generator
+
+def consume(tokens):
+    count = 0
+    for token in tokens:
+        token.value
+        count += 1
+    return count
+
+def lex_str(path):
+    with open(path) as f:
+        return consume(iter_tokens(f.read()))
+
+def lex_text_file(path):
+    with open(path) as f:
+        return consume(iter_tokens(f))
+
+def lex_mapped(path):
+    with open(path, 'rb') as f, mapped(f) as data:
+        return consume(iter_tokens(data))
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 2
+    unit = generator.generate('functions', 200).encode()
+    fd, path = tempfile.mkstemp(suffix='.c')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for copy in range(max(1, int(megabytes * (1 << 20) / len(unit)))):
+                f.write(unit)
+        print('{0:>10} {1:>10} {2:>12} {3:>12}'.format('input', 'seconds', 'Mtokens/s', 'peak KiB'))
+        for name, run in (('str', lex_str), ('text file', lex_text_file), ('mmap', lex_mapped)):
+            start = time.perf_counter()
+            count = run(path)
+            elapsed = time.perf_counter() - start
+            # Tracing slows every allocation, so memory is measured in a
+            # second, untimed run.
+            tracemalloc.start()
+            run(path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print('{0:>10} {1:>10.3f} {2:>12.2f} {3:>12.0f}'.format(
+                name, elapsed, count / elapsed / 1e6, peak / 1024))
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+'''Parser throughput at increasing input sizes.
+
+Run from the repository root:
+
+    python -m bench.bench_parser
+
+Tokens are lexed up front so only parse() is timed. The time per thousand
+tokens should stay flat as the input grows.
+'''
+import time
+
+from lexer import lex
+from parser import parse
+
+FUNCTION = '''int f{0}(int a) {{
+  b = a * {0} + 3;
+  return b == 42;
+}}
+'''
+
+def make_source(functions):
+    return ''.join(FUNCTION.format(i) for i in range(functions))
+
+def main():
+    print('{0:>10} {1:>10} {2:>12}'.format('tokens', 'seconds', 'us/Ktoken'))
+    for functions in (250, 500, 1000, 2000, 4000, 8000):
+        tokens = lex(make_source(functions))
+        count = len(tokens)
+        start = time.perf_counter()
+        parse(tokens)
+        elapsed = time.perf_counter() - start
+        print('{0:>10} {1:>10.4f} {2:>12.1f}'.format(
+            count, elapsed, elapsed * 1e6 / (count / 1000)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+'''Size and speed of -O1 code, with and without the peephole optimizer.
+
+Run from the repository root (needs gcc and size from binutils):
+
+    python -m bench.bench_peephole
+
+The corpus is tests/programs and a few generated programs. For each, the
+instructions and the bytes of machine code in the assembled object are
+counted, then the recursive program of bench.bench_regalloc is timed.
+The rewrites of each peephole rule over the corpus are listed last.
+'''
+import os
+import io
+import sys
+import glob
+import shutil
+import tempfile
+import subprocess
+
+import codegen
+import instrument
+from lexer import lex
+from parser import parse
+from optimizer import optimize
+from bench import generator
+from bench.bench_regalloc import SOURCE, DEPTH, run
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'tests', 'programs')
+
+def corpus():
+    for path in sorted(glob.glob(os.path.join(PROGRAMS, '*.c'))):
+        with open(path) as f:
+            yield f.read()
+    for seed in range(4):
+        yield generator.generate('functions', 20, seed)
+
+def assemble(source, peephole, hits):
+    '''-O1 assembly for source, through the peephole optimizer or not.'''
+    program = optimize(parse(lex(source)), 1)
+    if peephole:
+        return codegen.codegen(program, level=1, hits=hits)
+    outfile = io.StringIO()
+    codegen.generate_program(program, codegen.Emitter(outfile))
+    return outfile.getvalue()
+
+def text_size(directory, assembly):
+    path = os.path.join(directory, 'unit')
+    with open(path + '.s', 'w') as f:
+        f.write(assembly)
+    subprocess.run(['gcc', '-c', '-o', path + '.o', path + '.s'], check=True)
+    output = subprocess.run(['size', path + '.o'], check=True, capture_output=True,
+                            text=True).stdout
+    return int(output.splitlines()[1].split()[0])
+
+def build(directory, assembly, name):
+    path = os.path.join(directory, name)
+    with open(path + '.s', 'w') as f:
+        f.write(assembly)
+    subprocess.run(['gcc', '-o', path, path + '.s'], check=True)
+    return path
+
+def main():
+    if not (shutil.which('gcc') and shutil.which('size')):
+        sys.exit('gcc and size are needed to assemble the benchmark')
+    directory = tempfile.mkdtemp()
+    hits = {}
+    try:
+        print('{0:>9} {1:>13} {2:>11} {3:>10} {4:>8}'.format(
+            'peephole', 'instructions', 'text bytes', 'seconds', 'status'))
+        program = SOURCE.replace('DEPTH', str(DEPTH))
+        for peephole in (False, True):
+            instructions = 0
+            size = 0
+            for source in corpus():
+                assembly = assemble(source, peephole, hits if peephole else {})
+                instructions += instrument.count_instructions(assembly)
+                size += text_size(directory, assembly)
+            binary = build(directory, assemble(program, peephole, {}), 'mix')
+            elapsed, status = run(binary)
+            print('{0:>9} {1:>13} {2:>11} {3:>10.3f} {4:>8}'.format(
+                'on' if peephole else 'off', instructions, size, elapsed, status))
+    finally:
+        shutil.rmtree(directory)
+    print()
+    for rule, number in sorted(hits.items(), key=lambda item: -item[1]):
+        print('{0:>17} {1:>7}'.format(rule, number))
+
+if __name__ == '__main__':
+    main()
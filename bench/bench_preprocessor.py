@@ -0,0 +1,62 @@
+'''Preprocessing a unit whose headers all include each other.
+
+Run from the repository root:
+
+    python -m bench.bench_preprocessor [headers]
+
+Header k includes headers 0 to k - 1, and the unit includes every header,
+so the number of #include lines grows with the square of the number of
+headers. Each header is read once; every later #include of it is
+skipped on its include guard without opening the file, so the time
+follows the header count. The unit is preprocessed with a cold cache, a
+warm in-memory cache, and a fresh process's cache read back from disk.
+'''
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+from preprocessor import Preprocessor, HeaderCache
+
+def write_headers(directory, count):
+    for index in range(count):
+        lines = ['#ifndef HEADER_{0}'.format(index), '#define HEADER_{0}'.format(index)]
+        lines.extend('#include "h{0}.h"'.format(other) for other in range(index))
+        lines.append('#define VALUE_{0} {0}'.format(index))
+        lines.append('int f{0}(int a) {{ return a + VALUE_{0}; }}'.format(index))
+        lines.append('#endif')
+        with open(os.path.join(directory, 'h{0}.h'.format(index)), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+    return ''.join('#include "h{0}.h"\n'.format(index) for index in range(count))
+
+def preprocess(unit, path, headers):
+    preprocessor = Preprocessor((), headers)
+    start = time.perf_counter()
+    preprocessor.preprocess(unit, path)
+    return time.perf_counter() - start, preprocessor
+
+def main():
+    largest = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    print('{0:>8} {1:>9} {2:>7} {3:>9} {4:>10} {5:>10} {6:>10}'.format(
+        'headers', 'includes', 'reads', 'skipped', 'cold s', 'memory s', 'disk s'))
+    size = 25
+    while size <= largest:
+        directory = tempfile.mkdtemp()
+        try:
+            unit = write_headers(directory, size)
+            path = os.path.join(directory, 'unit.c')
+            cache_dir = os.path.join(directory, 'cache')
+            headers = HeaderCache(cache_dir)
+            cold, preprocessor = preprocess(unit, path, headers)
+            memory, _ = preprocess(unit, path, headers)
+            disk, _ = preprocess(unit, path, HeaderCache(cache_dir))
+            includes = size + size * (size - 1) // 2
+            print('{0:>8} {1:>9} {2:>7} {3:>9} {4:>10.4f} {5:>10.4f} {6:>10.4f}'.format(
+                size, includes, headers.reads, preprocessor.skipped, cold, memory, disk))
+        finally:
+            shutil.rmtree(directory)
+        size *= 2
+
+if __name__ == '__main__':
+    main()
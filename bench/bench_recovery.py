@@ -0,0 +1,54 @@
+'''Parsing sources dense with syntax errors, recovering from each.
+
+Run from the repository root:
+
+    python -m bench.bench_recovery [statements]
+
+A generated program has a growing share of its statement lines broken,
+either by dropping the semicolon or by cutting the expression short after
+an operator. parser.parse_recovering reports every error in one pass;
+the time per thousand tokens should stay close to that of the clean
+source. There are somewhat fewer errors than broken lines: a statement
+skipped to recover can hide an error in the next one.
+'''
+import sys
+import time
+import random
+
+from lexer import lex
+from parser import TokenStream, parse_recovering
+from bench import generator
+
+def break_lines(source, share, seed=0):
+    '''source with about share of its statement lines made invalid.'''
+    rng = random.Random(seed)
+    lines = source.splitlines()
+    broken = 0
+    for index, line in enumerate(lines):
+        if not line.endswith(';') or rng.random() >= share:
+            continue
+        if rng.random() < 0.5:
+            lines[index] = line[:-1]
+        else:
+            lines[index] = line[:-1] + ' + ;'
+        broken += 1
+    return '\n'.join(lines) + '\n', broken
+
+def main():
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 800
+    source = generator.generate('statements', statements, seed=1)
+    print('{0:>7} {1:>8} {2:>8} {3:>12} {4:>10} {5:>12}'.format(
+        'share', 'broken', 'errors', 'tokens', 'seconds', 'us/Ktoken'))
+    for share in (0, 0.01, 0.1, 0.5, 1):
+        broken_source, broken = break_lines(source, share)
+        tokens = lex(broken_source)
+        count = len(tokens)
+        stream = TokenStream(tokens, max_errors=count + 1)
+        start = time.perf_counter()
+        _, diagnostics = parse_recovering(stream)
+        elapsed = time.perf_counter() - start
+        print('{0:>7} {1:>8} {2:>8} {3:>12} {4:>10.4f} {5:>12.1f}'.format(
+            share, broken, len(diagnostics), count, elapsed, elapsed / count * 1e9))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+'''Run time of generated binaries: the stack machine (-O0), the stack
+machine after the peephole optimizer (-O1) and register allocated (-O2)
+code.
+
+Run from the repository root (needs gcc to assemble and link):
+
+    python -m bench.bench_regalloc
+'''
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from lexer import lex
+from parser import parse
+from codegen import codegen
+from optimizer import optimize
+
+SOURCE = '''
+int mix(int n, int a) {
+  if (n < 2)
+    return a + n;
+  int x = a * 7 + n;
+  int y = x % 13 + x / 5 - n * 3;
+  int z = (x - y) * (n + 1) + (a > y) - (x <= n);
+  int w = ((x + y) * (y - z) + (z + a) * (a - x)) % 97 + (x * y - z * a) % 89;
+  z = z + w * (w % 7) - (w + x) / ((y % 5) * (y % 5) + 1) + (z - w) * (x - a);
+  return (mix(n - 1, y) + mix(n - 2, z)) % 1000;
+}
+
+int main() {
+  return mix(DEPTH, 1) % 256;
+}
+'''
+
+DEPTH = 33
+
+def build(directory, level):
+    source = SOURCE.replace('DEPTH', str(DEPTH))
+    assembly = codegen(optimize(parse(lex(source)), level), level=level)
+    path = os.path.join(directory, 'O{0}'.format(level))
+    with open(path + '.s', 'w') as f:
+        f.write(assembly)
+    subprocess.run(['gcc', '-o', path, path + '.s'], check=True)
+    return path, assembly.count('\n')
+
+def run(path, repeat=3):
+    best = None
+    status = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        status = subprocess.run([path]).returncode
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, status
+
+def main():
+    if not shutil.which('gcc'):
+        sys.exit('gcc is needed to assemble the benchmark')
+    directory = tempfile.mkdtemp()
+    try:
+        print('{0:>6} {1:>8} {2:>10} {3:>8}'.format('level', 'lines', 'seconds', 'status'))
+        for level in (0, 1, 2):
+            path, lines = build(directory, level)
+            elapsed, status = run(path)
+            print('{0:>6} {1:>8} {2:>10.3f} {3:>8}'.format('-O{0}'.format(level), lines, elapsed, status))
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+'''Reloading front end results from a snapshot instead of lexing and
+parsing again.
+
+Run from the repository root:
+
+    python -m bench.bench_snapshot [functions]
+
+For a generated program, times lexing and parsing it against loading
+its snapshot, both untouched and with every node decoded at once and
+printed, and reports the size of the snapshot next to the source.
+'''
+import os
+import sys
+import time
+import tempfile
+
+import snapshot
+from lexer import lex
+from parser import parse
+from bench import generator
+
+def best(function, repeat=5):
+    times = []
+    for attempt in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    functions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    source = generator.generate('functions', functions)
+    fd, path = tempfile.mkstemp(suffix='.snapshot')
+    os.close(fd)
+    try:
+        snapshot.save_program(parse(lex(source)), path)
+
+        def load():
+            with snapshot.load(path) as loaded:
+                loaded.program().functions
+
+        def load_all():
+            with snapshot.load(path) as loaded:
+                str(loaded.program(eager=True))
+
+        def reparse_all():
+            str(parse(lex(source)))
+
+        print('source {0} bytes, snapshot {1} bytes'.format(len(source), os.path.getsize(path)))
+        print('{0:>24} {1:>10}'.format('', 'seconds'))
+        for name, run in (('lex + parse', lambda: parse(lex(source))),
+                          ('load, read functions', load),
+                          ('lex + parse + print', reparse_all),
+                          ('load + print', load_all)):
+            print('{0:>24} {1:>10.4f}'.format(name, best(run)))
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    main()
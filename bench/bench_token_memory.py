@@ -0,0 +1,51 @@
+'''Memory and construction time of tokens, old layout against new.
+
+Run from the repository root:
+
+    python -m bench.bench_token_memory
+
+The old layout is reproduced here as it was before tokens used __slots__:
+an instance __dict__ holding the value, start and end plus the token's own
+compiled pattern. Positions are kept below 256 so that both layouts share
+CPython's cached small ints and only the token objects themselves count.
+'''
+import re
+import time
+import tracemalloc
+
+from lexer import TokenIdentifier, make_token
+
+COUNT = 200000
+
+class DictToken():
+    def __init__(self, pattern, value, start, end):
+        self.pattern = re.compile(pattern)
+        self.value = value
+        self.start = start
+        self.end = end
+
+def build_dict_tokens():
+    return [DictToken(TokenIdentifier.regex, 'name', i % 200, i % 200 + 4)
+            for i in range(COUNT)]
+
+def build_slot_tokens():
+    return [make_token(TokenIdentifier, 'name', i % 200, i % 200 + 4, 1, i % 200 + 1)
+            for i in range(COUNT)]
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    tokens = build()
+    elapsed = time.perf_counter() - start
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, size / len(tokens)
+
+def main():
+    print('{0:>8} {1:>10} {2:>12}'.format('layout', 'seconds', 'bytes/token'))
+    for name, build in (('dict', build_dict_tokens), ('slots', build_slot_tokens)):
+        elapsed, per_token = measure(build)
+        print('{0:>8} {1:>10.4f} {2:>12.1f}'.format(name, elapsed, per_token))
+
+if __name__ == '__main__':
+    main()
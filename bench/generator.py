@@ -0,0 +1,106 @@
+'''Seeded generator of C programs in the subset pycc accepts.
+
+The same seed and size always give the same source, so timings from
+different runs and machines are of the same input. Every program is
+valid: variables are declared before use, and division and remainder are
+only by nonzero constants.
+'''
+import random
+
+ARITHMETIC = ('+', '-', '*', '/', '%')
+COMPARISON = ('<', '>', '<=', '>=', '==', '!=')
+LOGICAL = ('&&', '||')
+COMPOUND = ('=', '+=', '-=', '*=')
+
+class ProgramGenerator():
+    ''' Builds random C sources from a seeded random number generator'''
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    def operator(self):
+        roll = self.rng.random()
+        if roll < 0.7:
+            return self.rng.choice(ARITHMETIC)
+        if roll < 0.9:
+            return self.rng.choice(COMPARISON)
+        return self.rng.choice(LOGICAL)
+
+    def primary(self, variables):
+        if variables and self.rng.random() < 0.6:
+            return self.rng.choice(variables)
+        return str(self.rng.randint(0, 99))
+
+    def expression(self, terms, variables, nesting=2):
+        '''A chain of terms joined by operators of every precedence level,
+        with parenthesised subexpressions up to nesting levels deep.'''
+        parts = [self.primary(variables)]
+        for index in range(1, terms):
+            op = self.operator()
+            parts.append(op)
+            if op in ('/', '%'):
+                parts.append(str(self.rng.randint(1, 9)))
+            elif nesting and self.rng.random() < 0.1:
+                parts.append('({0})'.format(
+                    self.expression(self.rng.randint(2, 4), variables, nesting - 1)))
+            else:
+                parts.append(self.primary(variables))
+        return ' '.join(parts)
+
+    def statements(self, count, variables, terms, indent, nesting=2):
+        lines = []
+        pad = '  ' * indent
+        for statement in range(count):
+            roll = self.rng.random()
+            if roll < 0.4 or not variables:
+                name = 'v{0}'.format(len(variables))
+                lines.append('{0}int {1} = {2};'.format(
+                    pad, name, self.expression(terms, variables)))
+                variables.append(name)
+            elif roll < 0.8 or not nesting:
+                lines.append('{0}{1} {2} {3};'.format(
+                    pad, self.rng.choice(variables), self.rng.choice(COMPOUND),
+                    self.expression(terms, variables)))
+            else:
+                # Declarations inside the arms are out of scope after them.
+                inner = list(variables)
+                lines.append('{0}if ({1}) {{'.format(pad, self.expression(terms, variables)))
+                lines.extend(self.statements(2, inner, terms, indent + 1, nesting - 1))
+                lines.append('{0}}} else {{'.format(pad))
+                inner = list(variables)
+                lines.extend(self.statements(2, inner, terms, indent + 1, nesting - 1))
+                lines.append('{0}}}'.format(pad))
+        return lines
+
+    def function(self, name, statements, terms, callees=()):
+        variables = ['a', 'b']
+        lines = ['int {0}(int a, int b) {{'.format(name)]
+        lines.extend(self.statements(statements, variables, terms, 1))
+        if callees:
+            callee = self.rng.choice(callees)
+            lines.append('  return {0}({1}, {2}) + {3};'.format(
+                callee, self.primary(variables), self.primary(variables),
+                self.expression(terms, variables)))
+        else:
+            lines.append('  return {0};'.format(self.expression(terms, variables)))
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+    def program(self, functions=1, statements=5, terms=4):
+        names = ['f{0}'.format(index) for index in range(functions)]
+        parts = []
+        for index, name in enumerate(names):
+            # Only earlier functions are called, so nothing recurses.
+            parts.append(self.function(name, statements, terms, names[max(0, index - 3):index]))
+        parts.append('int main() {{\n  return {0}(1, 2);\n}}\n'.format(names[-1]))
+        return '\n'.join(parts)
+
+# The shapes of input the suite scales, each as a function from a size to
+# generator arguments.
+SHAPES = {
+    'functions': lambda size: dict(functions=size, statements=6, terms=4),
+    'statements': lambda size: dict(functions=1, statements=size, terms=4),
+    'expressions': lambda size: dict(functions=1, statements=4, terms=size),
+}
+
+def generate(shape, size, seed=0):
+    return ProgramGenerator(seed).program(**SHAPES[shape](size))
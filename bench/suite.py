@@ -0,0 +1,150 @@
+'''Throughput of the lexer, parser and whole compiler on generated programs.
+
+Run from the repository root:
+
+    python -m bench.suite                       # print scaling tables
+    python -m bench.suite --save baseline.json  # record a baseline
+    python -m bench.suite --compare baseline.json --threshold 0.1
+
+Every shape in bench.generator.SHAPES is generated at each size with a
+fixed seed, and measured as tokens/s for lexer.lex, AST nodes/s for
+parser.parse and source lines/s for a whole pycc compile, file to file.
+Each figure is the best of --repeat runs. Throughput that stays flat as
+the size grows means the phase scales linearly.
+
+With --compare, any figure more than --threshold below the baseline's is
+reported as a regression and the exit status is 1.
+'''
+import gc
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import lexer
+import parser
+import pycc
+import instrument
+from bench import generator
+
+SIZES = {
+    'functions': (25, 50, 100, 200, 400),
+    'statements': (50, 100, 200, 400, 800),
+    'expressions': (100, 200, 400, 800, 1600),
+}
+
+QUICK_SIZES = {shape: sizes[:2] for shape, sizes in SIZES.items()}
+
+METRICS = ('lex tokens/s', 'parse nodes/s', 'compile lines/s')
+
+def best_time(function, repeat):
+    best = None
+    # As timeit does, keep collections out of the timings; they depend on
+    # what ran before more than on the code being measured.
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for run in range(repeat):
+            start = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        if enabled:
+            gc.enable()
+    return best
+
+def measure(source, directory, repeat):
+    tokens = lexer.lex(source)
+    nodes = instrument.count_nodes(parser.parse(list(tokens)))
+    lines = source.count('\n')
+    source_path = os.path.join(directory, 'bench.c')
+    with open(source_path, 'w') as f:
+        f.write(source)
+    assembly_path = pycc.assembly_path(source_path)
+    return {
+        'lex tokens/s': len(tokens) / best_time(lambda: lexer.lex(source), repeat),
+        # parse() consumes the list it is given, so each run gets a copy.
+        'parse nodes/s': nodes / best_time(lambda: parser.parse(list(tokens)), repeat),
+        'compile lines/s': lines / best_time(
+            lambda: pycc.compile_file(source_path, assembly_path), repeat),
+    }
+
+def run(sizes, seed=0, repeat=3):
+    '''Measure every shape at every size. Returns results keyed by
+    "shape/size".'''
+    results = {}
+    directory = tempfile.mkdtemp()
+    try:
+        for shape, shape_sizes in sizes.items():
+            for size in shape_sizes:
+                source = generator.generate(shape, size, seed)
+                results['{0}/{1}'.format(shape, size)] = measure(source, directory, repeat)
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+def compare(baseline, results, threshold):
+    '''Figures that fell more than threshold, as a fraction, below the
+    baseline: a list of (key, metric, baseline value, new value).'''
+    regressions = []
+    for key, metrics in sorted(results.items()):
+        for metric, value in sorted(metrics.items()):
+            before = baseline.get(key, {}).get(metric)
+            if before and value < before * (1 - threshold):
+                regressions.append((key, metric, before, value))
+    return regressions
+
+def format_results(results, sizes):
+    lines = []
+    for shape, shape_sizes in sizes.items():
+        lines.append('{0:<12} {1:>14} {2:>14} {3:>16}'.format(shape, *METRICS))
+        for size in shape_sizes:
+            metrics = results['{0}/{1}'.format(shape, size)]
+            lines.append('{0:>12} {1:>14,.0f} {2:>14,.0f} {3:>16,.0f}'.format(
+                size, *(metrics[metric] for metric in METRICS)))
+        lines.append('')
+    return '\n'.join(lines)
+
+def main(argv=None):
+    argument_parser = argparse.ArgumentParser(prog='python -m bench.suite')
+    argument_parser.add_argument('--seed', type=int, default=0)
+    argument_parser.add_argument('--repeat', type=int, default=3)
+    argument_parser.add_argument('--quick', action='store_true',
+                                 help='only the two smallest sizes of each shape')
+    argument_parser.add_argument('--save', metavar='FILE',
+                                 help='write the results as a JSON baseline')
+    argument_parser.add_argument('--compare', metavar='FILE',
+                                 help='compare the results with a JSON baseline')
+    argument_parser.add_argument('--threshold', type=float, default=0.1,
+                                 help='fraction of throughput lost that counts as a regression')
+    args = argument_parser.parse_args(argv)
+
+    sizes = QUICK_SIZES if args.quick else SIZES
+    results = run(sizes, args.seed, args.repeat)
+    print(format_results(results, sizes))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'seed': args.seed, 'results': results}, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('seed') != args.seed:
+            print('warning: baseline was generated with seed {0}'.format(baseline.get('seed')),
+                  file=sys.stderr)
+        regressions = compare(baseline['results'], results, args.threshold)
+        for key, metric, before, after in regressions:
+            print('regression: {0} {1} {2:,.0f} -> {3:,.0f} ({4:+.1%})'.format(
+                key, metric, before, after, after / before - 1))
+        if regressions:
+            return 1
+        print('no regressions beyond {0:.0%}'.format(args.threshold))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import os
+import shutil
+import hashlib
+import tempfile
+
+# Sources whose contents decide what the compiler emits. Editing any of
+# them changes the fingerprint and so invalidates every cached entry.
+COMPILER_MODULES = (
+    'lexer.py',
+    'parser.py',
+    'preprocessor.py',
+    'semantic.py',
+    'visitor.py',
+    'optimizer.py',
+    'ir.py',
+    'regalloc.py',
+    'peephole.py',
+    'codegen.py',
+)
+
+# Bump when the layout of the cache directory changes.
+CACHE_FORMAT = 1
+
+DEFAULT_MAX_BYTES = 256 << 20
+
+_fingerprint = None
+
+def compiler_fingerprint():
+    '''A hash of the compiler's own source, standing in for its version.'''
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256()
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in COMPILER_MODULES:
+            with open(os.path.join(here, name), 'rb') as f:
+                digest.update(name.encode())
+                digest.update(f.read())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+class CacheStats():
+    ''' Hit and miss counts for one run'''
+    def __init__(self, hits=0, misses=0):
+        self.hits = hits
+        self.misses = misses
+
+    def record(self, status):
+        if status == 'hit':
+            self.hits += 1
+        elif status == 'miss':
+            self.misses += 1
+
+    def __str__(self):
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return "{0} hits, {1} misses ({2:.1f}% hit rate)".format(self.hits, self.misses, rate)
+
+class CompileCache():
+    ''' Assembly output stored on disk under a hash of its inputs
+
+    Entries are files named by key, spread over 256 subdirectories. New
+    entries are written to a temporary file and renamed into place, so
+    processes sharing the directory never see a partial entry. A hit
+    refreshes the entry's mtime, and evict() removes the least recently used
+    entries once the cache grows past max_bytes.
+    '''
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, source, options):
+        digest = hashlib.sha256()
+        digest.update('{0}\0{1}\0{2!r}\0'.format(
+            CACHE_FORMAT, compiler_fingerprint(), options).encode())
+        digest.update(source)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:] + '.s')
+
+    def fetch(self, key, destination):
+        '''Copy the entry for key to destination. Returns False on a miss.'''
+        path = self.path(key)
+        try:
+            shutil.copyfile(path, destination)
+            os.utime(path)
+        except FileNotFoundError:
+            # Never stored, or evicted by another process meanwhile.
+            return False
+        return True
+
+    def store(self, key, source_path):
+        '''Add the file at source_path as the entry for key.'''
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as outfile, open(source_path, 'rb') as infile:
+                shutil.copyfileobj(infile, outfile)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+    def entries(self):
+        '''(mtime, size, path) of every entry.'''
+        found = []
+        if not os.path.isdir(self.directory):
+            return found
+        for subdirectory in os.scandir(self.directory):
+            if not subdirectory.is_dir():
+                continue
+            for entry in os.scandir(subdirectory.path):
+                if entry.name.startswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((stat.st_mtime, stat.st_size, entry.path))
+        return found
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        '''Remove least recently used entries until the cache fits in
+        max_bytes. Returns the number removed.'''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        return removed
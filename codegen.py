@@ -1,6 +1,639 @@
-def generate_return_statement(stmt):
-    stmt.expression
-    return "movl    ${0}, %eax\nret".format()
+import io
 
-def codegen(ast):
-    return ast
+import ir
+import peephole
+import regalloc
+import semantic
+from parser import Int
+from visitor import Visitor
+
+# Integer argument registers of the System V AMD64 calling convention, in
+# order. Arguments past the sixth are passed on the stack.
+argument_registers = regalloc.argument_registers
+argument_registers_64 = ('%rdi', '%rsi', '%rdx', '%rcx', '%r8', '%r9')
+
+SLOT_SIZE = semantic.SLOT_SIZE
+
+arithmetic_instructions = {
+    '+': 'addl',
+    '-': 'subl',
+    '*': 'imull',
+    '&': 'andl',
+    '|': 'orl',
+    '^': 'xorl',
+}
+
+comparison_instructions = {
+    '==': 'sete',
+    '!=': 'setne',
+    '<': 'setl',
+    '>': 'setg',
+    '<=': 'setle',
+    '>=': 'setge',
+}
+
+class Emitter():
+    ''' Writes AT&T syntax assembly, one line at a time, to a file object'''
+    def __init__(self, outfile):
+        self.write = outfile.write
+
+    def instruction(self, op, *operands):
+        if operands:
+            self.write("    {0} {1}\n".format(op, ", ".join(operands)))
+        else:
+            self.write("    {0}\n".format(op))
+
+    def label(self, name):
+        self.write("{0}:\n".format(name))
+
+    def directive(self, text):
+        self.write("    {0}\n".format(text))
+
+    def flush(self):
+        # Called at the end of each function; lines are written as they come.
+        pass
+
+class FunctionGenerator(Visitor):
+    ''' Emits one function as a stack machine over %eax
+
+    Expression results are left in %eax. The left operand of a binary
+    operator is pushed while the right one is evaluated. Locals live in
+    %rbp-relative slots, which semantic analysis has already assigned.
+    Statements and expressions are visited without recursion, so nesting
+    depth is not limited by the Python stack.
+    '''
+    def __init__(self, emitter):
+        self.emit = emitter
+        self.name = None
+        self.label_count = 0
+        # 8 byte words pushed below the aligned frame, for call alignment.
+        self.depth = 0
+
+    def new_label(self):
+        # Labels are numbered per function, so that a function's assembly
+        # does not depend on the functions before it.
+        self.label_count += 1
+        return '.L{0}_{1}'.format(self.name, self.label_count)
+
+    def slot(self, variable):
+        return '{0}(%rbp)'.format(variable.symbol.offset)
+
+    def push(self):
+        self.emit.instruction('pushq', '%rax')
+        self.depth += 1
+
+    def pop(self, register):
+        self.emit.instruction('popq', register)
+        self.depth -= 1
+
+    def generate(self, function):
+        name = function.name.value
+        self.name = name
+        emit = self.emit
+        emit.directive('.globl {0}'.format(name))
+        emit.directive('.type {0}, @function'.format(name))
+        emit.label(name)
+        emit.instruction('pushq', '%rbp')
+        emit.instruction('movq', '%rsp', '%rbp')
+        if function.frame_size is None:
+            semantic.analyse_function(function)
+        if function.frame_size:
+            emit.instruction('subq', '${0}'.format(function.frame_size), '%rsp')
+
+        # Stack arguments already sit above the return address and saved %rbp.
+        for register, argument in zip(argument_registers, function.arguments):
+            emit.instruction('movl', register, self.slot(argument.name))
+        self.generate_statements(function.statements)
+
+        # Falling off the end of a function returns 0, as main must.
+        emit.instruction('movl', '$0', '%eax')
+        self.generate_epilogue()
+
+    def generate_epilogue(self):
+        self.emit.instruction('leave')
+        self.emit.instruction('ret')
+
+    def generate_statements(self, statements):
+        for stmt in statements:
+            self.visit(stmt)
+
+    def generate_expression(self, expr):
+        self.visit(expr)
+
+    def generic_visit(self, node):
+        raise Exception("Cannot generate code for {0}".format(node))
+
+    def visit_ReturnStatement(self, stmt):
+        if stmt.expression is not None:
+            yield stmt.expression
+        self.generate_epilogue()
+
+    def visit_Declaration(self, stmt):
+        if stmt.initializer is not None:
+            yield stmt.initializer
+            self.emit.instruction('movl', '%eax', self.slot(stmt.name))
+
+    def visit_AssignmentStatement(self, stmt):
+        offset = self.slot(stmt.lhs)
+        op = stmt.op.value
+        yield stmt.rhs
+        if op != '=':
+            self.emit.instruction('movl', '%eax', '%ecx')
+            self.emit.instruction('movl', offset, '%eax')
+            self.generate_operator(op[:-1])
+        self.emit.instruction('movl', '%eax', offset)
+
+    def visit_IfStatement(self, stmt):
+        else_label = self.new_label()
+        end_label = self.new_label()
+        yield stmt.condition
+        self.emit.instruction('cmpl', '$0', '%eax')
+        self.emit.instruction('je', else_label)
+        for body_stmt in stmt.body:
+            yield body_stmt
+        self.emit.instruction('jmp', end_label)
+        self.emit.label(else_label)
+        for body_stmt in stmt.else_body:
+            yield body_stmt
+        self.emit.label(end_label)
+
+    def visit_ExpressionStatement(self, stmt):
+        yield stmt.expression
+
+    def visit_Constant(self, expr):
+        if not isinstance(expr.value, Int):
+            raise Exception("Only int constants are supported, got {0}".format(expr))
+        self.emit.instruction('movl', '${0}'.format(expr.value.value), '%eax')
+
+    def visit_Variable(self, expr):
+        self.emit.instruction('movl', self.slot(expr), '%eax')
+
+    def visit_UnaryOperationExpression(self, expr):
+        emit = self.emit
+        yield expr.operand
+        op = expr.operator.value
+        if op == '-':
+            emit.instruction('negl', '%eax')
+        elif op == '!':
+            emit.instruction('cmpl', '$0', '%eax')
+            emit.instruction('sete', '%al')
+            emit.instruction('movzbl', '%al', '%eax')
+
+    def visit_BinaryOperationExpression(self, expr):
+        op = expr.operator.value
+        if op in ('&&', '||'):
+            yield from self.generate_logical(expr)
+            return
+        yield expr.lhs
+        self.push()
+        yield expr.rhs
+        self.emit.instruction('movl', '%eax', '%ecx')
+        self.pop('%rax')
+        self.generate_operator(op)
+
+    def generate_operator(self, op):
+        # Applies op to %eax (left) and %ecx (right), leaving the result in %eax.
+        emit = self.emit
+        if op in arithmetic_instructions:
+            emit.instruction(arithmetic_instructions[op], '%ecx', '%eax')
+        elif op in ('/', '%'):
+            emit.instruction('cltd')
+            emit.instruction('idivl', '%ecx')
+            if op == '%':
+                emit.instruction('movl', '%edx', '%eax')
+        elif op == '<<':
+            emit.instruction('sall', '%cl', '%eax')
+        elif op == '>>':
+            emit.instruction('sarl', '%cl', '%eax')
+        elif op in comparison_instructions:
+            emit.instruction('cmpl', '%ecx', '%eax')
+            emit.instruction(comparison_instructions[op], '%al')
+            emit.instruction('movzbl', '%al', '%eax')
+        else:
+            raise Exception("Unknown operator {0}".format(op))
+
+    def generate_logical(self, expr):
+        # && and || evaluate their right operand only when it decides the result.
+        emit = self.emit
+        short_label = self.new_label()
+        end_label = self.new_label()
+        jump = 'je' if expr.operator.value == '&&' else 'jne'
+        yield expr.lhs
+        emit.instruction('cmpl', '$0', '%eax')
+        emit.instruction(jump, short_label)
+        yield expr.rhs
+        emit.instruction('cmpl', '$0', '%eax')
+        emit.instruction('setne', '%al')
+        emit.instruction('movzbl', '%al', '%eax')
+        emit.instruction('jmp', end_label)
+        emit.label(short_label)
+        emit.instruction('movl', '$0' if jump == 'je' else '$1', '%eax')
+        emit.label(end_label)
+
+    def visit_Call(self, call):
+        emit = self.emit
+        stack_arguments = max(0, len(call.arguments) - len(argument_registers))
+        # %rsp must be 16 byte aligned at the call instruction.
+        padding = (self.depth + stack_arguments) % 2
+        if padding:
+            emit.instruction('subq', '$8', '%rsp')
+            self.depth += 1
+        # Arguments are pushed last to first, so the first ends up on top
+        # and the stack arguments are left in order for the callee.
+        for argument in reversed(call.arguments):
+            yield argument
+            self.push()
+        for register in argument_registers_64[:len(call.arguments)]:
+            self.pop(register)
+        emit.instruction('call', '{0}@PLT'.format(call.name))
+        cleanup = stack_arguments + padding
+        if cleanup:
+            emit.instruction('addq', '${0}'.format(cleanup * SLOT_SIZE), '%rsp')
+            self.depth -= cleanup
+
+def generate_function(function, emitter):
+    FunctionGenerator(emitter).generate(function)
+    emitter.flush()
+
+def generate_program(program, emitter):
+    emitter.directive('.text')
+    for function in program.functions:
+        generate_function(function, emitter)
+    emitter.directive('.section .note.GNU-stack,"",@progbits')
+    emitter.flush()
+
+ir_arithmetic_instructions = {
+    'add': 'addl',
+    'sub': 'subl',
+    'mul': 'imull',
+    'and': 'andl',
+    'or': 'orl',
+    'xor': 'xorl',
+}
+
+commutative_opcodes = frozenset(('add', 'mul', 'and', 'or', 'xor'))
+
+# The condition code each comparison tests, for setcc and jcc.
+ir_condition_codes = {
+    'eq': 'e',
+    'ne': 'ne',
+    'lt': 'l',
+    'gt': 'g',
+    'le': 'le',
+    'ge': 'ge',
+}
+
+# The comparison that holds when a comparison does not.
+negated_comparisons = {'eq': 'ne', 'ne': 'eq', 'lt': 'ge', 'ge': 'lt', 'gt': 'le', 'le': 'gt'}
+
+# The comparison that holds with its operands swapped.
+swapped_comparisons = {'eq': 'eq', 'ne': 'ne', 'lt': 'gt', 'gt': 'lt', 'le': 'ge', 'ge': 'le'}
+
+def is_memory(location):
+    return location.endswith('(%rbp)')
+
+def is_immediate(location):
+    return location.startswith('$')
+
+def select_operands(function):
+    '''Find the temporaries codegen keeps out of registers altogether.
+
+    Returns immediates, mapping each temporary defined once, by a const, to
+    its value as an immediate operand, and fused, mapping each branch to
+    the comparison it tests when that comparison directly precedes it and
+    is used by nothing else. A fused comparison becomes a cmpl and a
+    conditional jump.
+    '''
+    definitions = {}
+    uses = {}
+    for instruction in function.instructions():
+        if instruction.dest is not None:
+            definitions[instruction.dest] = definitions.get(instruction.dest, 0) + 1
+        for temp in instruction.uses():
+            uses[temp] = uses.get(temp, 0) + 1
+    immediates = {}
+    for instruction in function.instructions():
+        if instruction.op == 'const' and definitions[instruction.dest] == 1:
+            immediates[instruction.dest] = '${0}'.format(instruction.args[0])
+    fused = {}
+    for block in function.blocks:
+        branch = block.instructions[-1]
+        if branch.op != 'branch' or len(block.instructions) < 2:
+            continue
+        # Adjacent, so the operands' registers are still theirs at the branch.
+        comparison = block.instructions[-2]
+        condition = branch.args[0]
+        if (comparison.dest == condition and comparison.op in ir_condition_codes
+                and uses[condition] == 1 and definitions[condition] == 1):
+            fused[branch] = comparison
+    return immediates, fused
+
+class IRFunctionGenerator():
+    ''' Emits one ir.IRFunction using the locations chosen by regalloc
+
+    Blocks are laid out in order, and jumps to the block that follows are
+    left out. Each temporary lives in a register or, if spilled, in a
+    %rbp-relative slot; constants are used as immediate operands, and a
+    comparison only tested by a branch is emitted with it as a cmpl and a
+    conditional jump. Instructions compute straight into their
+    destination register where they can. %eax, %ecx and %edx are scratch.
+    '''
+    def __init__(self, emitter, function, allocation, immediates=None, fused=None):
+        self.emit = emitter
+        self.function = function
+        self.allocation = allocation
+        self.fused = {} if fused is None else fused
+        self.fused_comparisons = set(map(id, self.fused.values()))
+        self.epilogue_label = '.Lret_{0}'.format(function.name)
+        # Saved callee-saved registers take the first slots, spills follow.
+        saved = len(allocation.used_callee_saved)
+        self.saved_slots = [
+            '{0}(%rbp)'.format(-(index + 1) * SLOT_SIZE) for index in range(saved)]
+        self.locations = dict(immediates or {})
+        for temp, interval in allocation.intervals.items():
+            if interval.register is not None:
+                self.locations[temp] = interval.register
+            else:
+                self.locations[temp] = '{0}(%rbp)'.format(-(saved + interval.slot) * SLOT_SIZE)
+        self.frame = (saved + allocation.spill_count) * SLOT_SIZE
+        self.frame += -self.frame % 16
+
+    def move(self, source, destination):
+        if source == destination:
+            return
+        if is_memory(source) and is_memory(destination):
+            self.emit.instruction('movl', source, '%eax')
+            source = '%eax'
+        self.emit.instruction('movl', source, destination)
+
+    def parallel_move(self, moves):
+        '''Emit moves, pairs of source and destination locations, as if
+        every source were read before any destination is written. A cycle
+        of registers is broken through %eax.'''
+        pending = [(source, destination) for source, destination in moves
+                   if source != destination]
+        while pending:
+            sources = set(source for source, destination in pending)
+            for index, (source, destination) in enumerate(pending):
+                if destination not in sources:
+                    self.move(source, destination)
+                    del pending[index]
+                    break
+            else:
+                parked = pending[0][0]
+                self.emit.instruction('movl', parked, '%eax')
+                pending = [('%eax' if source == parked else source, destination)
+                           for source, destination in pending]
+
+    def generate(self):
+        emit = self.emit
+        name = self.function.name
+        emit.directive('.globl {0}'.format(name))
+        emit.directive('.type {0}, @function'.format(name))
+        emit.label(name)
+        emit.instruction('pushq', '%rbp')
+        emit.instruction('movq', '%rsp', '%rbp')
+        if self.frame:
+            emit.instruction('subq', '${0}'.format(self.frame), '%rsp')
+        for register, slot in zip(self.allocation.used_callee_saved, self.saved_slots):
+            emit.instruction('movq', regalloc.registers_64[register], slot)
+        blocks = self.function.blocks
+        # The arguments are read in from where the caller left them before
+        # any of them is overwritten.
+        moves = []
+        for instruction in blocks[0].instructions:
+            if instruction.op == 'arg' and instruction.dest in self.locations:
+                moves.append((self.argument_location(instruction.args[0]),
+                              self.locations[instruction.dest]))
+        self.parallel_move(moves)
+        for number, block in enumerate(blocks):
+            # The label control falls through to, if this block is last in
+            # line to jump somewhere.
+            self.next_label = blocks[number + 1].label if number + 1 < len(blocks) else self.epilogue_label
+            emit.label(block.label)
+            for instruction in block.instructions:
+                self.generate_instruction(instruction)
+        emit.label(self.epilogue_label)
+        for register, slot in zip(self.allocation.used_callee_saved, self.saved_slots):
+            emit.instruction('movq', slot, regalloc.registers_64[register])
+        emit.instruction('leave')
+        emit.instruction('ret')
+
+    def argument_location(self, index):
+        if index < len(argument_registers):
+            return argument_registers[index]
+        return '{0}(%rbp)'.format(16 + (index - len(argument_registers)) * SLOT_SIZE)
+
+    def generate_instruction(self, instruction):
+        emit = self.emit
+        op = instruction.op
+        args = instruction.args
+        location = self.locations
+        dest = location.get(instruction.dest)
+        if op in ('const', 'arg'):
+            # Arguments are read in by generate().
+            if op == 'const' and not is_immediate(dest):
+                emit.instruction('movl', '${0}'.format(args[0]), dest)
+        elif op == 'copy':
+            self.move(location[args[0]], dest)
+        elif op in ir_arithmetic_instructions:
+            self.arithmetic(op, location[args[0]], location[args[1]], dest)
+        elif op in ('div', 'mod'):
+            self.move(location[args[0]], '%eax')
+            emit.instruction('cltd')
+            divisor = location[args[1]]
+            if is_immediate(divisor):
+                emit.instruction('movl', divisor, '%ecx')
+                divisor = '%ecx'
+            emit.instruction('idivl', divisor)
+            self.move('%eax' if op == 'div' else '%edx', dest)
+        elif op in ('shl', 'sar'):
+            count = location[args[1]]
+            if not is_immediate(count):
+                emit.instruction('movl', count, '%ecx')
+                count = '%cl'
+            target = '%eax' if is_memory(dest) else dest
+            self.move(location[args[0]], target)
+            emit.instruction('sall' if op == 'shl' else 'sarl', count, target)
+            self.move(target, dest)
+        elif op in ir_condition_codes:
+            if id(instruction) in self.fused_comparisons:
+                # Emitted with the branch that tests it.
+                return
+            op = self.compare(op, location[args[0]], location[args[1]])
+            self.set_flag(ir_condition_codes[op], dest)
+        elif op == 'neg':
+            source = location[args[0]]
+            if is_memory(dest) and dest != source:
+                self.move(source, '%eax')
+                emit.instruction('negl', '%eax')
+                self.move('%eax', dest)
+            else:
+                self.move(source, dest)
+                emit.instruction('negl', dest)
+        elif op == 'not':
+            source = location[args[0]]
+            if is_immediate(source):
+                emit.instruction('movl', '${0}'.format(int(source == '$0')), dest)
+            else:
+                emit.instruction('cmpl', '$0', source)
+                self.set_flag('e', dest)
+        elif op == 'branch':
+            self.generate_branch(instruction)
+        elif op == 'jump':
+            if args[0] != self.next_label:
+                emit.instruction('jmp', args[0])
+        elif op == 'call':
+            self.generate_call(args[0], args[1:], dest)
+        elif op == 'ret':
+            if args[0] is not None:
+                emit.instruction('movl', location[args[0]], '%eax')
+            if self.next_label != self.epilogue_label:
+                emit.instruction('jmp', self.epilogue_label)
+        else:
+            raise Exception("Unknown IR instruction {0}".format(instruction))
+
+    def arithmetic(self, op, lhs, rhs, dest):
+        emit = self.emit
+        name = ir_arithmetic_instructions[op]
+        if op in commutative_opcodes and (dest == rhs or is_immediate(lhs)):
+            lhs, rhs = rhs, lhs
+        if not is_memory(dest):
+            if dest == rhs and dest != lhs:
+                # dest = lhs - dest, the one case that cannot swap.
+                emit.instruction('negl', dest)
+                emit.instruction('addl', lhs, dest)
+                return
+            self.move(lhs, dest)
+            emit.instruction(name, rhs, dest)
+        elif dest == lhs and op != 'mul' and not is_memory(rhs):
+            emit.instruction(name, rhs, dest)
+        else:
+            self.move(lhs, '%eax')
+            emit.instruction(name, rhs, '%eax')
+            self.move('%eax', dest)
+
+    def compare(self, op, lhs, rhs):
+        '''Emit the cmpl for comparison op of lhs and rhs, returning the
+        comparison its flags are to be tested for.'''
+        if is_immediate(lhs) and not is_immediate(rhs):
+            lhs, rhs = rhs, lhs
+            op = swapped_comparisons[op]
+        elif is_immediate(lhs) or (is_memory(lhs) and is_memory(rhs)):
+            self.move(lhs, '%eax')
+            lhs = '%eax'
+        self.emit.instruction('cmpl', rhs, lhs)
+        return op
+
+    def set_flag(self, condition, dest):
+        # dest = 1 if condition holds, else 0.
+        self.emit.instruction('set' + condition, '%al')
+        if is_memory(dest):
+            self.emit.instruction('movzbl', '%al', '%eax')
+            self.move('%eax', dest)
+        else:
+            self.emit.instruction('movzbl', '%al', dest)
+
+    def generate_branch(self, instruction):
+        emit = self.emit
+        condition, true_label, false_label = instruction.args
+        comparison = self.fused.get(instruction)
+        if comparison is not None:
+            op = self.compare(comparison.op, self.locations[comparison.args[0]],
+                              self.locations[comparison.args[1]])
+        else:
+            tested = self.locations[condition]
+            if is_immediate(tested):
+                target = false_label if tested == '$0' else true_label
+                if target != self.next_label:
+                    emit.instruction('jmp', target)
+                return
+            if is_memory(tested):
+                emit.instruction('cmpl', '$0', tested)
+            else:
+                emit.instruction('testl', tested, tested)
+            op = 'ne'
+        if false_label == self.next_label:
+            emit.instruction('j' + ir_condition_codes[op], true_label)
+        elif true_label == self.next_label:
+            emit.instruction('j' + ir_condition_codes[negated_comparisons[op]], false_label)
+        else:
+            emit.instruction('j' + ir_condition_codes[op], true_label)
+            emit.instruction('jmp', false_label)
+
+    def generate_call(self, name, arguments, dest):
+        emit = self.emit
+        stack_arguments = arguments[len(argument_registers):]
+        # The frame keeps %rsp 16 byte aligned, so only the stack arguments
+        # can misalign it.
+        padding = len(stack_arguments) % 2
+        if padding:
+            emit.instruction('subq', '$8', '%rsp')
+        for temp in reversed(stack_arguments):
+            location = self.locations[temp]
+            emit.instruction('pushq', regalloc.registers_64.get(location, location))
+        self.parallel_move([(self.locations[temp], register)
+                            for temp, register in zip(arguments, argument_registers)])
+        emit.instruction('call', '{0}@PLT'.format(name))
+        cleanup = len(stack_arguments) + padding
+        if cleanup:
+            emit.instruction('addq', '${0}'.format(cleanup * SLOT_SIZE), '%rsp')
+        if dest is not None:
+            self.move('%eax', dest)
+
+def generate_ir_function(function, emitter):
+    ir.remove_unreachable_blocks(function)
+    immediates, fused = select_operands(function)
+    exclude = set(immediates)
+    exclude.update(comparison.dest for comparison in fused.values())
+    allocation = regalloc.linear_scan(function, exclude=exclude)
+    IRFunctionGenerator(emitter, function, allocation, immediates, fused).generate()
+    emitter.flush()
+
+def generate_ir_program(program, emitter):
+    emitter.directive('.text')
+    for function in program.functions:
+        generate_ir_function(function, emitter)
+    emitter.directive('.section .note.GNU-stack,"",@progbits')
+    emitter.flush()
+
+def make_emitter(outfile, level, hits):
+    # From level 1, each function's instructions pass through the peephole
+    # optimizer before they are written.
+    emitter = Emitter(outfile)
+    if level >= 1:
+        emitter = peephole.PeepholeEmitter(emitter, hits)
+    return emitter
+
+def codegen_function(function, outfile=None, level=0, hits=None):
+    '''Generate the assembly for one parser.Function, without the section
+    directives that codegen() puts around a whole program.'''
+    if outfile is None:
+        buffer = io.StringIO()
+        codegen_function(function, buffer, level, hits)
+        return buffer.getvalue()
+    emitter = make_emitter(outfile, level, hits)
+    if level >= 2:
+        generate_ir_function(ir.lower_function(function), emitter)
+    else:
+        generate_function(function, emitter)
+
+def codegen(ast, outfile=None, level=0, hits=None):
+    '''Generate x86-64 assembly for a Program.
+
+    At level 2 the program is lowered to IR and temporaries are kept in
+    registers; below that expressions are evaluated on the stack. From
+    level 1 the instructions of each function are rewritten by
+    peephole.optimize, counting the rewrites of each rule in the hits
+    dict if one is given. The assembly is written to outfile a function at
+    a time. Without an outfile it is collected and returned as a string.
+    '''
+    if outfile is None:
+        buffer = io.StringIO()
+        codegen(ast, buffer, level, hits)
+        return buffer.getvalue()
+    emitter = make_emitter(outfile, level, hits)
+    if level >= 2:
+        generate_ir_program(ir.lower(ast), emitter)
+    else:
+        generate_program(ast, emitter)
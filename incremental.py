@@ -0,0 +1,191 @@
+import lexer
+import parser
+import interning
+import codegen
+import optimizer
+
+HEADER = '    .text\n'
+TRAILER = '    .section .note.GNU-stack,"",@progbits\n'
+
+class Unit():
+    ''' One top-level function: its source span, token count, AST and
+    assembly'''
+    __slots__ = ('start', 'end', 'token_count', 'function', 'assembly')
+
+    def __init__(self, start, end, token_count, function, assembly):
+        self.start = start
+        self.end = end
+        self.token_count = token_count
+        self.function = function
+        self.assembly = assembly
+
+    def __str__(self):
+        return "(Unit {0} {1}-{2})".format(self.function.name.value, self.start, self.end)
+
+    def __repr__(self):
+        return str(self)
+
+def split_functions(tokens):
+    '''Group tokens into top-level functions at the braces that close them.
+
+    Returns the groups, or None if the tokens do not end on a closing brace
+    at depth zero, meaning the text continues into what follows.
+    '''
+    groups = []
+    depth = 0
+    start = 0
+    for index, token in enumerate(tokens):
+        if isinstance(token, lexer.TokenOpenBrace):
+            depth += 1
+        elif isinstance(token, lexer.TokenCloseBrace):
+            depth -= 1
+            if depth < 0:
+                return None
+            if depth == 0:
+                groups.append(tokens[start:index + 1])
+                start = index + 1
+    if start != len(tokens):
+        return None
+    return groups
+
+def changed_range(old, new):
+    '''The edit turning old into new, as (start, end, text) with start and
+    end offsets into old. The common prefix and suffix are found by binary
+    search over slice comparisons, which run at C speed.'''
+    limit = min(len(old), len(new))
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[:middle] == new[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    prefix = low
+    low, high = 0, limit - prefix
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[len(old) - middle:] == new[len(new) - middle:]:
+            low = middle
+        else:
+            high = middle - 1
+    suffix = low
+    return prefix, len(old) - suffix, new[prefix:len(new) - suffix]
+
+def lex_region(source, start, end):
+    '''Lex source[start:end], placing the tokens where they are in source.
+    Lines and offsets are shifted by the region's start, and so are the
+    columns of tokens on the region's first line.'''
+    tokens = list(lexer.iter_tokens(source[start:end]))
+    lines = source.count('\n', 0, start)
+    columns = start - (source.rfind('\n', 0, start) + 1)
+    for token in tokens:
+        if token.line == 1:
+            token.column += columns
+        token.line += lines
+        token.offset += start
+        token.end += start
+    return tokens
+
+class IncrementalCompiler():
+    ''' Keeps the AST and assembly of each top-level function of a source
+
+    An edit re-lexes and re-parses only the functions it touches, between
+    the closing braces of the untouched functions around it. If the new text
+    does not close its last brace there, as when a brace was deleted, the
+    region grows a function at a time until it does. Only functions whose
+    text changed are generated again; the rest keep their assembly.
+    '''
+    def __init__(self, source='', level=0):
+        self.level = level
+        # The names of this compiler's ASTs, which are dropped with it.
+        self.symbols = interning.SymbolTable()
+        self.source = ''
+        self.units = []
+        self.reparsed = 0
+        self.edit(0, 0, source)
+
+    def compile_function(self, function):
+        if self.level:
+            optimizer.optimize(parser.Program([function]), self.level)
+        return codegen.codegen_function(function, level=self.level)
+
+    def edit(self, start, end, text):
+        '''Replace source[start:end] with text. Returns the number of
+        functions that were parsed and generated again.'''
+        with interning.scope(self.symbols):
+            return self.edit_region(start, end, text)
+
+    def edit_region(self, start, end, text):
+        source = self.source[:start] + text + self.source[end:]
+        delta = len(text) - (end - start)
+        units = self.units
+
+        # Untouched units are those ending before the edit and those
+        # starting after it; everything between them is parsed again.
+        first = 0
+        while first < len(units) and units[first].end < start:
+            first += 1
+        last = first
+        while last < len(units) and units[last].start <= end:
+            last += 1
+        region_start = units[first - 1].end if first else 0
+
+        while True:
+            region_end = units[last].start + delta if last < len(units) else len(source)
+            tokens = lex_region(source, region_start, region_end)
+            groups = split_functions(tokens)
+            if groups is not None or last == len(units):
+                break
+            last += 1
+        if groups is None:
+            # The text never closes its braces; the parser says where.
+            groups = [tokens]
+
+        # A function whose text is unchanged, but fell inside the region,
+        # keeps its AST and assembly.
+        previous = {}
+        for unit in units[first:last]:
+            previous[self.source[unit.start:unit.end]] = unit
+
+        new_units = []
+        moved = []
+        reparsed = 0
+        for group in groups:
+            unit_start = group[0].offset
+            unit_end = group[-1].end
+            unit_text = source[unit_start:unit_end]
+            unit = previous.get(unit_text)
+            if unit is None:
+                stream = parser.TokenStream(group)
+                function = parser.parse_function_declaration(stream)
+                if stream.peek() is not None:
+                    raise Exception("Expected end of function")
+                unit = Unit(unit_start, unit_end, len(group), function,
+                            self.compile_function(function))
+                reparsed += 1
+            else:
+                moved.append((unit, unit_start, unit_end))
+            new_units.append(unit)
+
+        # Nothing is changed until the edit is known to parse.
+        for unit, unit_start, unit_end in moved:
+            unit.start = unit_start
+            unit.end = unit_end
+        for unit in units[last:]:
+            unit.start += delta
+            unit.end += delta
+        units[first:last] = new_units
+        self.source = source
+        self.reparsed += reparsed
+        return reparsed
+
+    def update(self, source):
+        '''Bring the compiler up to date with a new version of the whole
+        source, as a watch loop would read it.'''
+        return self.edit(*changed_range(self.source, source))
+
+    def program(self):
+        return parser.Program([unit.function for unit in self.units])
+
+    def assembly(self):
+        return ''.join([HEADER] + [unit.assembly for unit in self.units] + [TRAILER])
@@ -0,0 +1,148 @@
+import json
+import time
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+from visitor import walk
+
+# Nothing here runs unless a report or profile is asked for: the compiler
+# takes its uninstrumented path when handed no Report.
+
+class Phase():
+    ''' Totals for one compiler phase, over every file it ran on'''
+    __slots__ = ('name', 'wall', 'cpu', 'peak_memory', 'counts')
+
+    def __init__(self, name, wall=0.0, cpu=0.0, peak_memory=0, counts=None):
+        self.name = name
+        self.wall = wall
+        self.cpu = cpu
+        self.peak_memory = peak_memory
+        self.counts = counts or {}
+
+    def count(self, what, number):
+        self.counts[what] = self.counts.get(what, 0) + number
+
+    def merge(self, other):
+        self.wall += other.wall
+        self.cpu += other.cpu
+        self.peak_memory = max(self.peak_memory, other.peak_memory)
+        for what, number in other.counts.items():
+            self.count(what, number)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'wall': self.wall,
+            'cpu': self.cpu,
+            'peak_memory': self.peak_memory,
+            'counts': dict(self.counts),
+        }
+
+class Report():
+    ''' Wall time, CPU time, peak traced memory and counts per phase
+
+    Peak memory is the most allocated during a phase beyond what was
+    allocated when it began. It is only measured while tracemalloc is
+    tracing, which tracing() arranges.
+    '''
+    def __init__(self):
+        self.phases = {}
+        self.files = 0
+
+    def get(self, name):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = Phase(name)
+        return phase
+
+    @contextmanager
+    def phase(self, name):
+        '''Time the body as one run of the named phase, and yield a Phase
+        to add its counts to.'''
+        measured = Phase(name)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield measured
+        finally:
+            measured.cpu = time.process_time() - cpu
+            measured.wall = time.perf_counter() - wall
+            if tracing:
+                measured.peak_memory = max(0, tracemalloc.get_traced_memory()[1] - base)
+            self.get(name).merge(measured)
+
+    def merge(self, other):
+        self.files += other.files
+        for phase in other.phases.values():
+            self.get(phase.name).merge(phase)
+
+    def total(self):
+        total = Phase('total')
+        for phase in self.phases.values():
+            total.wall += phase.wall
+            total.cpu += phase.cpu
+            total.peak_memory = max(total.peak_memory, phase.peak_memory)
+        return total
+
+    def to_dict(self):
+        return {
+            'files': self.files,
+            'phases': [phase.to_dict() for phase in self.phases.values()],
+            'total': self.total().to_dict(),
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def __str__(self):
+        lines = ['{0:<10} {1:>10} {2:>10} {3:>10}  {4}'.format(
+            'phase', 'wall ms', 'cpu ms', 'peak KiB', 'counts')]
+        for phase in list(self.phases.values()) + [self.total()]:
+            counts = ' '.join('{0}={1}'.format(what, number)
+                              for what, number in sorted(phase.counts.items()))
+            lines.append('{0:<10} {1:>10.2f} {2:>10.2f} {3:>10.1f}  {4}'.format(
+                phase.name, phase.wall * 1e3, phase.cpu * 1e3,
+                phase.peak_memory / 1024, counts).rstrip())
+        lines.append('{0} files'.format(self.files))
+        return '\n'.join(lines)
+
+@contextmanager
+def tracing():
+    '''Trace allocations for the body, unless something already is.'''
+    if tracemalloc.is_tracing():
+        yield
+        return
+    tracemalloc.start()
+    try:
+        yield
+    finally:
+        tracemalloc.stop()
+
+@contextmanager
+def profiled(path):
+    '''Run the body under cProfile and write the stats to path, for
+    python -m pstats or snakeviz.'''
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
+
+def count_nodes(root):
+    '''The number of AST nodes below and including root.'''
+    return sum(1 for node in walk(root))
+
+def count_instructions(assembly):
+    '''The number of instructions, not labels or directives, in assembly.'''
+    count = 0
+    for line in assembly.splitlines():
+        if line.startswith('    ') and not line.startswith('    .'):
+            count += 1
+    return count
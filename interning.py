@@ -0,0 +1,84 @@
+import sys
+import threading
+from contextlib import contextmanager
+
+class SymbolTable():
+    ''' Every distinct identifier and string literal, numbered from 0
+
+    Each name is stored once. Tokens and AST nodes that mention it hold the
+    same str and its id, so names compare as ints and scopes can be keyed
+    by id.
+    '''
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def intern(self, text):
+        '''The id of text, added to the table if it is new.'''
+        symbol = self.ids.get(text)
+        if symbol is None:
+            text = sys.intern(text)
+            symbol = self.ids[text] = len(self.names)
+            self.names.append(text)
+        return symbol
+
+    def canonical(self, text):
+        '''The one str the table keeps equal to text.'''
+        return self.names[self.intern(text)]
+
+    def name(self, symbol):
+        return self.names[symbol]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, text):
+        return text in self.ids
+
+class ScopedSymbols(threading.local):
+    ''' The SymbolTable in use by the current thread, with its methods
+
+    Tokens and nodes hold ids into the table they were made under, so a
+    unit of work that outlives no other, such as a compile request, runs
+    in a scope() of its own, and its names are freed with it. A thread
+    outside any scope has a table of its own for its lifetime.
+    '''
+    def __init__(self):
+        self.table = SymbolTable()
+
+    @property
+    def ids(self):
+        return self.table.ids
+
+    @property
+    def names(self):
+        return self.table.names
+
+    def intern(self, text):
+        return self.table.intern(text)
+
+    def canonical(self, text):
+        return self.table.canonical(text)
+
+    def name(self, symbol):
+        return self.table.names[symbol]
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, text):
+        return text in self.table
+
+# The table shared by the lexer, parser and code generators.
+symbols = ScopedSymbols()
+
+@contextmanager
+def scope(table=None):
+    '''Use table, or a new SymbolTable, as this thread's symbol table for
+    the body. Yields the table.'''
+    previous = symbols.table
+    symbols.table = SymbolTable() if table is None else table
+    try:
+        yield symbols.table
+    finally:
+        symbols.table = previous
@@ -0,0 +1,391 @@
+from parser import Int
+from visitor import Visitor
+import semantic
+
+# Binary operators and the IR opcode each one lowers to.
+binary_opcodes = {
+    '+': 'add',
+    '-': 'sub',
+    '*': 'mul',
+    '/': 'div',
+    '%': 'mod',
+    '&': 'and',
+    '|': 'or',
+    '^': 'xor',
+    '<<': 'shl',
+    '>>': 'sar',
+    '==': 'eq',
+    '!=': 'ne',
+    '<': 'lt',
+    '>': 'gt',
+    '<=': 'le',
+    '>=': 'ge',
+}
+
+unary_opcodes = {
+    '-': 'neg',
+    '!': 'not',
+}
+
+# Instructions that end a basic block. Every block ends with exactly one.
+terminators = ('jump', 'branch', 'ret')
+
+class Instruction():
+    ''' A three-address instruction
+
+    dest is the temporary the instruction defines, or None. args holds its
+    operands: temporaries are ints, while the constant of a const, the index
+    of an arg, block labels and call names are kept as they are.
+
+        t = const value      t = arg index        t = copy a
+        t = add a, b  (and the other binary_opcodes)
+        t = neg a            t = not a
+        t = call name, a, b, ...
+        jump label           branch a, true_label, false_label
+        ret a                (a may be None)
+    '''
+    __slots__ = ('op', 'dest', 'args')
+
+    def __init__(self, op, dest=None, args=()):
+        self.op = op
+        self.dest = dest
+        self.args = args
+
+    def uses(self):
+        '''The temporaries this instruction reads.'''
+        op = self.op
+        if op in ('const', 'arg', 'jump'):
+            return ()
+        if op == 'branch':
+            return self.args[:1]
+        if op == 'call':
+            return self.args[1:]
+        if op == 'ret':
+            return tuple(arg for arg in self.args if arg is not None)
+        return self.args
+
+    def targets(self):
+        '''The labels this instruction can transfer control to.'''
+        if self.op == 'jump':
+            return self.args
+        if self.op == 'branch':
+            return self.args[1:]
+        return ()
+
+    def __str__(self):
+        op = self.op
+        if op in ('const', 'arg', 'jump'):
+            operands = [str(arg) for arg in self.args]
+        elif op == 'branch':
+            operands = ['t{0}'.format(self.args[0])] + list(self.args[1:])
+        elif op == 'call':
+            operands = [self.args[0]] + ['t{0}'.format(arg) for arg in self.args[1:]]
+        else:
+            operands = ['t{0}'.format(arg) for arg in self.args if arg is not None]
+        text = '{0} {1}'.format(op, ', '.join(operands)).rstrip()
+        if self.dest is not None:
+            text = 't{0} = {1}'.format(self.dest, text)
+        return text
+
+    def __repr__(self):
+        return str(self)
+
+class BasicBlock():
+    ''' A label, a run of instructions ending in a terminator, and the
+    indexes of the blocks control can come from and go to'''
+    def __init__(self, label):
+        self.label = label
+        self.instructions = []
+        self.predecessors = []
+        self.successors = []
+
+    def terminator(self):
+        if self.instructions and self.instructions[-1].op in terminators:
+            return self.instructions[-1]
+        return None
+
+    def __str__(self):
+        lines = ['{0}:  ; preds {1} succs {2}'.format(
+            self.label, self.predecessors, self.successors)]
+        lines.extend('    {0}'.format(instruction) for instruction in self.instructions)
+        return '\n'.join(lines)
+
+class IRFunction():
+    ''' A function as a control-flow graph of basic blocks
+
+    blocks[0] is the entry block. Blocks are kept in the order lowering
+    created them, which is also the order code is emitted in.
+    '''
+    def __init__(self, name, arguments):
+        self.name = name
+        self.arguments = arguments
+        self.blocks = []
+        self.temp_count = 0
+
+    def block_index(self):
+        return {block.label: index for index, block in enumerate(self.blocks)}
+
+    def instructions(self):
+        '''Every instruction, block by block.'''
+        for block in self.blocks:
+            for instruction in block.instructions:
+                yield instruction
+
+    def __str__(self):
+        lines = ['function {0}({1})'.format(self.name, ', '.join(self.arguments))]
+        for number, block in enumerate(self.blocks):
+            lines.append('; block {0}'.format(number))
+            lines.append(str(block))
+        return '\n'.join(lines)
+
+class IRProgram():
+    ''' The IR of every function in a Program'''
+    def __init__(self, functions):
+        self.functions = functions
+
+    def __str__(self):
+        return '\n\n'.join(str(function) for function in self.functions)
+
+def build_cfg(function):
+    '''Fill in the predecessor and successor lists of every block.'''
+    index = function.block_index()
+    for block in function.blocks:
+        block.predecessors = []
+        block.successors = []
+    for number, block in enumerate(function.blocks):
+        for label in block.terminator().targets():
+            target = index[label]
+            if target not in block.successors:
+                block.successors.append(target)
+                function.blocks[target].predecessors.append(number)
+    return function
+
+def remove_unreachable_blocks(function):
+    '''Drop blocks control can never reach from the entry block.'''
+    reachable = set()
+    pending = [0]
+    while pending:
+        number = pending.pop()
+        if number not in reachable:
+            reachable.add(number)
+            pending.extend(function.blocks[number].successors)
+    function.blocks = [block for number, block in enumerate(function.blocks)
+                       if number in reachable]
+    return build_cfg(function)
+
+def verify(function):
+    '''Check the structural invariants of an IRFunction, raising an
+    Exception describing the first one broken.'''
+    index = function.block_index()
+    if len(index) != len(function.blocks):
+        raise Exception("Duplicate block label in {0}".format(function.name))
+    defined = set()
+    for block in function.blocks:
+        if block.terminator() is None:
+            raise Exception("Block {0} does not end in a terminator".format(block.label))
+        for instruction in block.instructions[:-1]:
+            if instruction.op in terminators:
+                raise Exception("Terminator inside block {0}: {1}".format(block.label, instruction))
+        for instruction in block.instructions:
+            if instruction.dest is not None:
+                defined.add(instruction.dest)
+            for label in instruction.targets():
+                if label not in index:
+                    raise Exception("Jump to unknown block {0}".format(label))
+    for block in function.blocks:
+        for instruction in block.instructions:
+            for temp in instruction.uses():
+                if temp not in defined:
+                    raise Exception("t{0} is used but never defined: {1}".format(temp, instruction))
+    for number, block in enumerate(function.blocks):
+        for successor in block.successors:
+            if number not in function.blocks[successor].predecessors:
+                raise Exception("CFG edge {0} -> {1} has no matching predecessor".format(
+                    block.label, function.blocks[successor].label))
+    return function
+
+class Lowering(Visitor):
+    ''' Lowers one parser.Function to an IRFunction
+
+    Every local variable becomes a temporary of its own. Temporaries are not
+    in SSA form: assigning to a variable redefines its temporary.
+    '''
+    def __init__(self, function):
+        self.function = IRFunction(
+            function.name.value,
+            [argument.name.value for argument in function.arguments])
+        self.source = function
+        if function.frame_size is None:
+            semantic.analyse_function(function)
+        # The temporary of each declaration, by its symbol index.
+        self.temps = {}
+        self.labels = 0
+        self.block = None
+
+    def new_label(self):
+        self.labels += 1
+        return '.L{0}_{1}'.format(self.function.name, self.labels)
+
+    def start_block(self, label):
+        self.block = BasicBlock(label)
+        self.function.blocks.append(self.block)
+
+    def emit(self, op, dest=None, args=()):
+        if self.block is None:
+            # Code after a terminator gets a block of its own, which nothing
+            # jumps to.
+            self.start_block(self.new_label())
+        self.block.instructions.append(Instruction(op, dest, args))
+
+    def terminate(self, op, args):
+        if self.block is not None:
+            self.emit(op, None, args)
+            self.block = None
+
+    def new_temp(self):
+        temp = self.function.temp_count
+        self.function.temp_count += 1
+        return temp
+
+    def lookup(self, variable):
+        return self.temps[variable.symbol.index]
+
+    def declare(self, variable):
+        temp = self.temps[variable.symbol.index] = self.new_temp()
+        return temp
+
+    def lower(self):
+        self.start_block('.L{0}_entry'.format(self.function.name))
+        for index, argument in enumerate(self.source.arguments):
+            self.emit('arg', self.declare(argument.name), (index,))
+        self.lower_statements(self.source.statements)
+        if self.block is not None:
+            # Falling off the end of a function returns 0, as main must.
+            zero = self.new_temp()
+            self.emit('const', zero, (0,))
+            self.terminate('ret', (zero,))
+        return build_cfg(self.function)
+
+    def lower_statements(self, statements):
+        for stmt in statements:
+            self.visit(stmt)
+
+    def lower_expression(self, expr):
+        '''Emit the instructions computing expr and return its temporary.'''
+        return self.visit(expr)
+
+    def generic_visit(self, node):
+        raise Exception("Cannot lower {0}".format(node))
+
+    def visit_ReturnStatement(self, stmt):
+        if stmt.expression is None:
+            self.terminate('ret', (None,))
+        else:
+            self.terminate('ret', ((yield stmt.expression),))
+
+    def visit_Declaration(self, stmt):
+        if stmt.initializer is not None:
+            value = yield stmt.initializer
+            self.emit('copy', self.declare(stmt.name), (value,))
+        else:
+            self.declare(stmt.name)
+
+    def visit_AssignmentStatement(self, stmt):
+        target = self.lookup(stmt.lhs)
+        value = yield stmt.rhs
+        op = stmt.op.value
+        if op == '=':
+            self.emit('copy', target, (value,))
+        else:
+            self.emit(binary_opcodes[op[:-1]], target, (target, value))
+
+    def visit_IfStatement(self, stmt):
+        then_label = self.new_label()
+        end_label = self.new_label()
+        else_label = self.new_label() if stmt.else_body else end_label
+        condition = yield stmt.condition
+        self.terminate('branch', (condition, then_label, else_label))
+        yield from self.lower_branch(then_label, stmt.body, end_label)
+        if stmt.else_body:
+            yield from self.lower_branch(else_label, stmt.else_body, end_label)
+        self.start_block(end_label)
+
+    def lower_branch(self, label, statements, end_label):
+        self.start_block(label)
+        for stmt in statements:
+            yield stmt
+        self.terminate('jump', (end_label,))
+
+    def visit_ExpressionStatement(self, stmt):
+        yield stmt.expression
+
+    def visit_Constant(self, expr):
+        if not isinstance(expr.value, Int):
+            raise Exception("Only int constants are supported, got {0}".format(expr))
+        temp = self.new_temp()
+        self.emit('const', temp, (expr.value.value,))
+        return temp
+
+    def visit_Variable(self, expr):
+        return self.lookup(expr)
+
+    def visit_UnaryOperationExpression(self, expr):
+        operand = yield expr.operand
+        op = expr.operator.value
+        if op == '+':
+            return operand
+        temp = self.new_temp()
+        self.emit(unary_opcodes[op], temp, (operand,))
+        return temp
+
+    def visit_BinaryOperationExpression(self, expr):
+        op = expr.operator.value
+        if op in ('&&', '||'):
+            return (yield from self.lower_logical(expr))
+        lhs = yield expr.lhs
+        rhs = yield expr.rhs
+        temp = self.new_temp()
+        self.emit(binary_opcodes[op], temp, (lhs, rhs))
+        return temp
+
+    def visit_Call(self, expr):
+        arguments = []
+        for argument in expr.arguments:
+            arguments.append((yield argument))
+        temp = self.new_temp()
+        self.emit('call', temp, (expr.name,) + tuple(arguments))
+        return temp
+
+    def lower_logical(self, expr):
+        # The result starts out as the value a short circuit produces and is
+        # overwritten only when the right operand decides otherwise.
+        is_and = expr.operator.value == '&&'
+        rhs_label = self.new_label()
+        set_label = self.new_label()
+        end_label = self.new_label()
+        result = self.new_temp()
+        # Set before the left operand, so its test directly follows it.
+        self.emit('const', result, (0 if is_and else 1,))
+        lhs = yield expr.lhs
+        if is_and:
+            self.terminate('branch', (lhs, rhs_label, end_label))
+        else:
+            self.terminate('branch', (lhs, end_label, rhs_label))
+        self.start_block(rhs_label)
+        rhs = yield expr.rhs
+        if is_and:
+            self.terminate('branch', (rhs, set_label, end_label))
+        else:
+            self.terminate('branch', (rhs, end_label, set_label))
+        self.start_block(set_label)
+        self.emit('const', result, (1 if is_and else 0,))
+        self.terminate('jump', (end_label,))
+        self.start_block(end_label)
+        return result
+
+def lower_function(function):
+    return Lowering(function).lower()
+
+def lower(program):
+    '''Lower a parser.Program to an IRProgram.'''
+    return IRProgram([lower_function(function) for function in program.functions])
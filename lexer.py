@@ -1,10 +1,29 @@
 import os
 import sys
 import re
+import mmap
+from contextlib import contextmanager
+
+from interning import symbols
 
 class Token():
-    def __init__(self, pattern, value=None):
-        self.pattern = re.compile(pattern)
+    # Each token type compiles its pattern once, at class level. The master
+    # pattern used by lex() is assembled from these same strings.
+    regex = None
+    pattern = None
+    # Small integer identifying the token type, assigned below.
+    kind = None
+    # Whether values of this type go in the symbol table, in which case the
+    # token also has an id slot holding the value's symbol id.
+    interned = False
+
+    # A token holds only its value and where it came from: the absolute
+    # offsets of its first and one-past-last characters, and the 1-based line
+    # and column it starts on. Subclasses declare empty __slots__ so no token
+    # carries an instance __dict__.
+    __slots__ = ('value', 'offset', 'end', 'line', 'column')
+
+    def __init__(self, value=None):
         if value:
             self.lex(str(value))
         else:
@@ -13,133 +32,387 @@ class Token():
     def lex(self, string):
         matched = self.pattern.match(string)
         if matched:
-            self.value = matched.group()
-            self.start = matched.start()
+            if self.interned:
+                self.id = symbols.intern(matched.group())
+                self.value = symbols.name(self.id)
+            else:
+                self.value = self.convert(matched.group())
+            self.offset = matched.start()
             self.end = matched.end()
         else:
             self.value = None
-            self.start = None
+            self.offset = None
             self.end = None
+        self.line = None
+        self.column = None
+
+    @staticmethod
+    def convert(text):
+        return text
 
     def __str__(self):
         return "{0} {1}".format(self.__class__.__name__, self.value)
 
 class TokenKeyword(Token):
-    def __init__(self, value=None):
-        super().__init__(
-            (
-            "auto|break|case|char|const|continue|default|do|"
-            "double|else|enum|extern|float|for|goto|if|int|"
-            "long|register|return|short|signed|sizeof|static|"
-            "struct|switch|typedef|union|unsigned|void|volatile|while"
-            ),
-            value
-        )
+    __slots__ = ()
+    regex = (
+        r"(?:auto|break|case|char|const|continue|default|do|"
+        r"double|else|enum|extern|float|for|goto|if|int|"
+        r"long|register|return|short|signed|sizeof|static|"
+        r"struct|switch|typedef|union|unsigned|void|volatile|while)\b"
+    )
+    pattern = re.compile(regex)
 
 class TokenOpenBrace(Token):
+    __slots__ = ()
+    regex = r'{'
+    pattern = re.compile(regex)
+
     def __init__(self, value='{'):
-        super().__init__('{', value)
+        super().__init__(value)
 
 class TokenCloseBrace(Token):
+    __slots__ = ()
+    regex = r'}'
+    pattern = re.compile(regex)
+
     def __init__(self, value='}'):
-        super().__init__('}', value)
+        super().__init__(value)
 
 class TokenOpenParen(Token):
-    def __init__(self, value='\('):
-        super().__init__('\(', value)
+    __slots__ = ()
+    regex = r'\('
+    pattern = re.compile(regex)
+
+    def __init__(self, value='('):
+        super().__init__(value)
 
 class TokenCloseParen(Token):
-    def __init__(self, value='\)'):
-        super().__init__('\)', value)
+    __slots__ = ()
+    regex = r'\)'
+    pattern = re.compile(regex)
+
+    def __init__(self, value=')'):
+        super().__init__(value)
 
 class TokenSemicolon(Token):
+    __slots__ = ()
+    regex = r';'
+    pattern = re.compile(regex)
+
     def __init__(self, value=';'):
-        super().__init__(';', value)
+        super().__init__(value)
+
+class TokenComma(Token):
+    __slots__ = ()
+    regex = r','
+    pattern = re.compile(regex)
+
+    def __init__(self, value=','):
+        super().__init__(value)
 
 class TokenAssignmentOperator(Token):
-    def __init__(self, value=None):
-        super().__init__('[<]{2}=|[>]{2}=|[\+\-\*\/%\&\^\!\|]?[=](?!=)', value)
+    __slots__ = ()
+    regex = r'[<]{2}=|[>]{2}=|[\+\-\*\/%\&\^\|]?[=](?!=)'
+    pattern = re.compile(regex)
 
 class TokenAdditionOperator(Token):
-    def __init__(self, value=None):
-        super().__init__('[\+\-]', value)
+    __slots__ = ()
+    regex = r'[\+\-]'
+    pattern = re.compile(regex)
 
 class TokenMultiplicationOperator(Token):
-    def __init__(self, value=None):
-        super().__init__('[\*\/%]', value)
+    __slots__ = ()
+    regex = r'[\*\/%]'
+    pattern = re.compile(regex)
 
 class TokenIncrementOperator(Token):
-    def __init__(self, value=None):
-        super().__init__('[+]{2}|[-]{2}', value)
+    __slots__ = ()
+    regex = r'[+]{2}|[-]{2}'
+    pattern = re.compile(regex)
 
 class TokenEqualityOperator(Token):
-    def __init__(self, value=None):
-        super().__init__('[=\!][=]', value)
+    __slots__ = ()
+    regex = r'[=\!][=]'
+    pattern = re.compile(regex)
 
 class TokenInequalityOperator(Token):
-    def __init__(self, value=None):
-        super().__init__('[\>\<][=]|[<>]', value)
+    __slots__ = ()
+    regex = r'[\>\<][=]|[<>]'
+    pattern = re.compile(regex)
 
 class TokenLogicalOperator(Token):
-    def __init__(self, value=None):
-        super().__init__('&{2}|\|{2}|\!(?!=)', value)
+    __slots__ = ()
+    regex = r'&{2}|\|{2}|\!(?!=)'
+    pattern = re.compile(regex)
 
 class TokenIdentifier(Token):
-    def __init__(self, value=None):
-        super().__init__('[a-zA-Z_][a-zA-Z0-9_]*', value)
+    __slots__ = ('id',)
+    interned = True
+    regex = r'[a-zA-Z_][a-zA-Z0-9_]*'
+    pattern = re.compile(regex)
 
 class TokenInteger(Token):
-    def __init__(self, value=None):
-        super().__init__('[0-9]+(?!\.)', value)
+    __slots__ = ()
+    regex = r'[0-9]+(?![\.0-9])'
+    pattern = re.compile(regex)
 
-    def lex(self, string):
-        super().lex(string)
-        if self.value:
-            self.value = int(self.value)
+    @staticmethod
+    def convert(text):
+        return int(text)
 
 class TokenFloat(Token):
-    def __init__(self, value=None):
-        super().__init__('[0-9]*\.?[0-9]+', value)
+    __slots__ = ()
+    regex = r'[0-9]*\.?[0-9]+'
+    pattern = re.compile(regex)
 
-    def lex(self, string):
-        super().lex(string)
-        if self.value:
-            self.value = float(self.value)
+    @staticmethod
+    def convert(text):
+        return float(text)
 
 class TokenString(Token):
-    def __init__(self, value=None):
-        super().__init__('"\w+"', value)
+    __slots__ = ('id',)
+    interned = True
+    regex = r'"\w+"'
+    pattern = re.compile(regex)
 
-def lex(input_string):
-    token_types = (
-        TokenKeyword,
-        TokenOpenBrace,
-        TokenCloseBrace,
-        TokenOpenParen,
-        TokenCloseParen,
-        TokenSemicolon,
-        TokenAssignmentOperator,
-        TokenAdditionOperator,
-        TokenMultiplicationOperator,
-        TokenEqualityOperator,
-        TokenInequalityOperator,
-        TokenLogicalOperator,
-        TokenIdentifier,
-        TokenInteger,
-        TokenFloat,
-        TokenString,
-    )
+all_token_types = (
+    TokenKeyword,
+    TokenOpenBrace,
+    TokenCloseBrace,
+    TokenOpenParen,
+    TokenCloseParen,
+    TokenSemicolon,
+    TokenAssignmentOperator,
+    TokenAdditionOperator,
+    TokenMultiplicationOperator,
+    TokenIncrementOperator,
+    TokenEqualityOperator,
+    TokenInequalityOperator,
+    TokenLogicalOperator,
+    TokenIdentifier,
+    TokenInteger,
+    TokenFloat,
+    TokenString,
+    TokenComma,
+)
+
+for kind, tok_type in enumerate(all_token_types):
+    tok_type.kind = kind
+
+# The token types lex() recognizes, in priority order.
+token_types = (
+    TokenKeyword,
+    TokenOpenBrace,
+    TokenCloseBrace,
+    TokenOpenParen,
+    TokenCloseParen,
+    TokenSemicolon,
+    TokenComma,
+    TokenAssignmentOperator,
+    TokenAdditionOperator,
+    TokenMultiplicationOperator,
+    TokenEqualityOperator,
+    TokenInequalityOperator,
+    TokenLogicalOperator,
+    TokenIdentifier,
+    TokenInteger,
+    TokenFloat,
+    TokenString,
+)
+
+# All token patterns joined into one alternation, in the same priority order
+# as token_types. Group i + 1 belongs to token_types[i], so the class of a
+# match is found from match.lastindex without trying each pattern in turn.
+# Anything no token matches (whitespace, stray characters) is skipped.
+master_pattern = re.compile(
+    '|'.join('({0})'.format(tok_type.regex) for tok_type in token_types)
+    + r'|\s+|.',
+    re.DOTALL,
+)
+
+def make_token(tok_type, text, offset, end, line, column):
+    token = tok_type.__new__(tok_type)
+    if tok_type.interned:
+        table = symbols.table
+        token.id = table.intern(text)
+        token.value = table.names[token.id]
+    else:
+        token.value = tok_type.convert(text)
+    token.offset = offset
+    token.end = end
+    token.line = line
+    token.column = column
+    return token
 
-    tokens = []
-    while len(input_string) > 0:
-        for tok_type in token_types:
-            token = tok_type()
-            token.lex(input_string)
-            if token.value:
-                tokens.append(token)
-                end = token.end
+# How much text iter_tokens() reads from a file at a time.
+CHUNK_SIZE = 1 << 16
+
+# How many characters past the end of a match the master pattern may need to
+# see before the match is final: "12." only becomes a float once the digit
+# after the dot is known.
+LOOKAHEAD = 2
+
+def iter_tokens(source, chunk_size=CHUNK_SIZE):
+    '''Yield tokens from a string, a text file object, or bytes.
+
+    Files are read chunk_size characters at a time. A match that ends within
+    LOOKAHEAD characters of the buffered text is held back until the next
+    chunk arrives, since the token may continue past the chunk boundary. So
+    is an opening quote until its closing quote has been read, as string
+    literals can be of any length.
+    Bytes, including a memory map, are lexed in place by iter_bytes_tokens.
+    '''
+    if isinstance(source, (bytes, bytearray, mmap.mmap)):
+        yield from iter_bytes_tokens(source)
+        return
+    if isinstance(source, str):
+        read = None
+        buffer = source
+    else:
+        read = source.read
+        buffer = ''
+    match = master_pattern.match
+    offset = 0
+    pos = 0
+    line = 1
+    line_start = 0
+    eof = read is None
+    while True:
+        length = len(buffer)
+        limit = length if eof else length - LOOKAHEAD
+        while pos < length:
+            matched = match(buffer, pos)
+            end = matched.end()
+            if end > limit:
                 break
+            index = matched.lastindex
+            if (not index and not eof and buffer[pos] == '"'
+                    and buffer.find('"', end) == -1):
+                # A stray quote, but only because the rest of the string
+                # has not been read yet.
+                break
+            if index:
+                start = offset + pos
+                yield make_token(token_types[index - 1], matched.group(),
+                                 start, offset + end, line, start - line_start + 1)
+            else:
+                # No token spans a newline, so only skipped text moves the
+                # line count forward.
+                newlines = buffer.count('\n', pos, end)
+                if newlines:
+                    line += newlines
+                    line_start = offset + buffer.rindex('\n', pos, end) + 1
+            pos = end
+        if eof:
+            return
+        chunk = read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        offset += pos
+        pos = 0
+
+# The master pattern again, over bytes. C source is ASCII, where \s and \w
+# match the same characters as they do in a str pattern.
+master_bytes_pattern = re.compile(master_pattern.pattern.encode('ascii'), re.DOTALL)
+
+class ByteSource():
+    ''' Bytes being lexed, and the token values decoded from them so far
+
+    values holds a dict per token kind from the raw bytes of a token to its
+    value, so each distinct spelling is decoded and converted once.
+    Identifiers and strings take their value from the symbol table.
+    '''
+    __slots__ = ('data', 'values')
+
+    def __init__(self, data):
+        self.data = data
+        self.values = [{} for tok_type in all_token_types]
+
+def lazy_value(token):
+    value = token.cached
+    if value is None:
+        source = token.source
+        raw = source.data[token.offset:token.end]
+        values = source.values[token.kind]
+        value = values.get(raw)
+        if value is None:
+            text = raw.decode('utf-8')
+            if token.interned:
+                value = symbols.canonical(text)
             else:
-                end = 1
-        input_string = input_string[end:]
-    return tokens
+                value = token.convert(sys.intern(text))
+            values[raw] = value
+        token.cached = value
+    return value
+
+def lazy_id(token):
+    return symbols.ids[token.value]
+
+def make_lazy_type(tok_type):
+    '''A subclass of tok_type whose value is decoded from its ByteSource
+    when first read, rather than when the token is made. It keeps the name
+    of tok_type, so tokens print the same whichever way they were lexed.'''
+    namespace = {
+        '__slots__': ('source', 'cached'),
+        'value': property(lazy_value),
+    }
+    if tok_type.interned:
+        namespace['id'] = property(lazy_id)
+    return type(tok_type.__name__, (tok_type,), namespace)
+
+# Lazy counterparts of token_types, in the same order.
+lazy_token_types = tuple(make_lazy_type(tok_type) for tok_type in token_types)
+
+def iter_bytes_tokens(data):
+    '''Yield tokens from bytes or a memory map without copying the text.
+
+    Tokens record only their type and position; the value is decoded on
+    first use. Tokens refer to data, which must stay open until their values
+    have been read. Offsets and columns count bytes.
+    '''
+    source = ByteSource(data)
+    match = master_bytes_pattern.match
+    length = len(data)
+    pos = 0
+    line = 1
+    line_start = 0
+    while pos < length:
+        matched = match(data, pos)
+        end = matched.end()
+        index = matched.lastindex
+        if index:
+            tok_type = lazy_token_types[index - 1]
+            token = tok_type.__new__(tok_type)
+            token.source = source
+            token.cached = None
+            token.offset = pos
+            token.end = end
+            token.line = line
+            token.column = pos - line_start + 1
+            yield token
+        else:
+            newline = data.rfind(b'\n', pos, end)
+            if newline >= 0:
+                # Memory maps have no count(), so the run is copied; it is
+                # only whitespace or one stray byte.
+                line += data[pos:end].count(b'\n')
+                line_start = newline + 1
+        pos = end
+
+@contextmanager
+def mapped(binary_file):
+    '''Memory map a file opened in binary mode, for iter_tokens. An empty
+    file, which cannot be mapped, gives empty bytes.'''
+    if os.fstat(binary_file.fileno()).st_size == 0:
+        yield b''
+        return
+    data = mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield data
+    finally:
+        data.close()
+
+def lex(input_string):
+    return list(iter_tokens(input_string))
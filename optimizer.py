@@ -0,0 +1,298 @@
+from parser import (
+    Int,
+    Constant,
+    Variable,
+    Call,
+    Declaration,
+    ExpressionStatement,
+)
+from visitor import Visitor, Transformer, walk
+import semantic
+
+INT_BITS = 32
+
+def wrap(value):
+    '''Reduce value to a 32 bit two's complement int.'''
+    value &= (1 << INT_BITS) - 1
+    if value >= 1 << (INT_BITS - 1):
+        value -= 1 << INT_BITS
+    return value
+
+def divide(lhs, rhs):
+    '''C division: the quotient is truncated toward zero.'''
+    quotient = abs(lhs) // abs(rhs)
+    if (lhs < 0) != (rhs < 0):
+        quotient = -quotient
+    return quotient
+
+def fold_binary(op, lhs, rhs):
+    '''The value of lhs op rhs on ints, or None if it must not be folded.'''
+    if op == '+':
+        return wrap(lhs + rhs)
+    if op == '-':
+        return wrap(lhs - rhs)
+    if op == '*':
+        return wrap(lhs * rhs)
+    if op in ('/', '%'):
+        # Division by zero and INT_MIN / -1 are undefined; leave them to run.
+        if rhs == 0 or (lhs == -(1 << (INT_BITS - 1)) and rhs == -1):
+            return None
+        quotient = divide(lhs, rhs)
+        return quotient if op == '/' else lhs - rhs * quotient
+    if op == '==':
+        return int(lhs == rhs)
+    if op == '!=':
+        return int(lhs != rhs)
+    if op == '<':
+        return int(lhs < rhs)
+    if op == '>':
+        return int(lhs > rhs)
+    if op == '<=':
+        return int(lhs <= rhs)
+    if op == '>=':
+        return int(lhs >= rhs)
+    if op == '&&':
+        return int(bool(lhs) and bool(rhs))
+    if op == '||':
+        return int(bool(lhs) or bool(rhs))
+    return None
+
+def fold_unary(op, operand):
+    if op == '-':
+        return wrap(-operand)
+    if op == '+':
+        return operand
+    if op == '!':
+        return int(not operand)
+    return None
+
+def int_constant(value):
+    return Constant(Int(value))
+
+def constant_value(expr):
+    '''The int value of a constant expression node, or None.'''
+    if isinstance(expr, Constant) and isinstance(expr.value, Int):
+        return expr.value.value
+    return None
+
+def has_side_effects(expr):
+    '''Whether evaluating expr can do anything besides produce a value.'''
+    return any(isinstance(node, Call) for node in walk(expr))
+
+def simplify_binary(expr, lhs_value, rhs_value):
+    '''Apply algebraic identities where one operand is constant.'''
+    op = expr.operator.value
+    lhs = expr.lhs
+    rhs = expr.rhs
+    if op == '+':
+        if rhs_value == 0:
+            return lhs
+        if lhs_value == 0:
+            return rhs
+    elif op == '-':
+        if rhs_value == 0:
+            return lhs
+    elif op == '*':
+        if rhs_value == 1:
+            return lhs
+        if lhs_value == 1:
+            return rhs
+        if rhs_value == 0 and not has_side_effects(lhs):
+            return int_constant(0)
+        if lhs_value == 0 and not has_side_effects(rhs):
+            return int_constant(0)
+    elif op == '/':
+        if rhs_value == 1:
+            return lhs
+    elif op == '&&':
+        # The right operand of a false && or a true || is never evaluated.
+        if lhs_value == 0:
+            return int_constant(0)
+    elif op == '||':
+        if lhs_value is not None and lhs_value != 0:
+            return int_constant(1)
+    return expr
+
+class ConstantFolder(Transformer):
+    ''' Replaces constant subexpressions by their values, children first'''
+    def visit_BinaryOperationExpression(self, expr):
+        expr.lhs = yield expr.lhs
+        expr.rhs = yield expr.rhs
+        lhs_value = constant_value(expr.lhs)
+        rhs_value = constant_value(expr.rhs)
+        if lhs_value is not None and rhs_value is not None:
+            value = fold_binary(expr.operator.value, lhs_value, rhs_value)
+            if value is not None:
+                return int_constant(value)
+        return simplify_binary(expr, lhs_value, rhs_value)
+
+    def visit_UnaryOperationExpression(self, expr):
+        expr.operand = yield expr.operand
+        operand_value = constant_value(expr.operand)
+        if operand_value is not None:
+            value = fold_unary(expr.operator.value, operand_value)
+            if value is not None:
+                return int_constant(value)
+        return expr
+
+    def visit_Constant(self, expr):
+        return expr
+
+    def visit_Variable(self, expr):
+        return expr
+
+def fold_expression(expr):
+    '''Return expr with every constant subexpression folded.'''
+    return ConstantFolder().visit(expr)
+
+def fold_statements(statements):
+    folder = ConstantFolder()
+    for stmt in statements:
+        folder.visit(stmt)
+    return statements
+
+def fold_constants(program):
+    '''Fold constant int arithmetic in a Program, in place, following C int
+    semantics: 32 bit wraparound and division truncated toward zero.'''
+    for function in program.functions:
+        fold_statements(function.statements)
+    return program
+
+class UnreachableCodeRemover(Visitor):
+    ''' Drops the statements after a return and the arms of ifs whose
+    condition is constant
+
+    Statement methods return the statements to put in place of the one
+    visited, and whether they always return.
+    '''
+    def block(self, statements):
+        reachable = []
+        for stmt in statements:
+            replacement, returns = yield stmt
+            reachable.extend(replacement)
+            if returns:
+                return reachable, True
+        return reachable, False
+
+    def visit_Function(self, function):
+        function.statements, _ = yield from self.block(function.statements)
+
+    def generic_visit(self, stmt):
+        return [stmt], False
+
+    def visit_ReturnStatement(self, stmt):
+        return [stmt], True
+
+    def visit_IfStatement(self, stmt):
+        value = constant_value(stmt.condition)
+        if value is None:
+            stmt.body, body_returns = yield from self.block(stmt.body)
+            stmt.else_body, else_returns = yield from self.block(stmt.else_body)
+            return [stmt], body_returns and else_returns
+        taken, returns = yield from self.block(stmt.body if value else stmt.else_body)
+        if any(isinstance(taken_stmt, Declaration) for taken_stmt in taken):
+            # The arm's block keeps its declarations out of the enclosing
+            # scope, so it stays, behind a true condition.
+            stmt.condition = int_constant(1)
+            stmt.body = taken
+            stmt.else_body = []
+            return [stmt], returns
+        return taken, returns
+
+class DeadStoreRemover(Visitor):
+    ''' Drops assignments and initializers whose value is never read
+
+    Statements are visited last to first, keeping the set of variables
+    live after each: those that are read before they are assigned again.
+    There are no loops, so one backward pass finds them exactly. Statement
+    methods return the statements to put in place of the one visited. A
+    store whose value has a call in it leaves the call behind.
+    '''
+    def __init__(self):
+        self.live = set()
+
+    def use(self, expr):
+        for node in walk(expr):
+            if isinstance(node, Variable):
+                self.live.add(node.symbol)
+
+    def block(self, statements):
+        kept = []
+        for stmt in reversed(statements):
+            replacement = yield stmt
+            kept.extend(reversed(replacement))
+        kept.reverse()
+        return kept
+
+    def visit_Function(self, function):
+        # Falling off the end returns 0, so nothing is live there.
+        self.live = set()
+        function.statements = yield from self.block(function.statements)
+
+    def side_effects(self, expr):
+        if has_side_effects(expr):
+            self.use(expr)
+            return [ExpressionStatement(expr)]
+        return []
+
+    def visit_ReturnStatement(self, stmt):
+        self.live = set()
+        if stmt.expression is not None:
+            self.use(stmt.expression)
+        return [stmt]
+
+    def visit_ExpressionStatement(self, stmt):
+        self.use(stmt.expression)
+        return [stmt]
+
+    def visit_AssignmentStatement(self, stmt):
+        symbol = stmt.lhs.symbol
+        if symbol not in self.live:
+            return self.side_effects(stmt.rhs)
+        if stmt.op.value == '=':
+            self.live.discard(symbol)
+        self.use(stmt.rhs)
+        return [stmt]
+
+    def visit_Declaration(self, stmt):
+        symbol = stmt.name.symbol
+        initializer = stmt.initializer
+        if initializer is None or symbol in self.live:
+            self.live.discard(symbol)
+            if initializer is not None:
+                self.use(initializer)
+            return [stmt]
+        stmt.initializer = None
+        return [stmt] + self.side_effects(initializer)
+
+    def visit_IfStatement(self, stmt):
+        live_after = self.live
+        self.live = set(live_after)
+        stmt.body = yield from self.block(stmt.body)
+        body_live = self.live
+        self.live = set(live_after)
+        stmt.else_body = yield from self.block(stmt.else_body)
+        self.live |= body_live
+        if not stmt.body and not stmt.else_body:
+            return self.side_effects(stmt.condition)
+        self.use(stmt.condition)
+        return [stmt]
+
+def eliminate_dead_code(program):
+    '''Remove unreachable statements and dead stores from a Program, in
+    place. Runs after fold_constants, so that constant conditions are
+    already folded.'''
+    for function in program.functions:
+        # Liveness follows variables by the symbols analysis resolves them to.
+        if function.frame_size is None:
+            semantic.analyse_function(function)
+        UnreachableCodeRemover().visit(function)
+        DeadStoreRemover().visit(function)
+    return program
+
+def optimize(program, level=1):
+    '''Run the AST passes enabled at an -O level.'''
+    if level >= 1:
+        fold_constants(program)
+        eliminate_dead_code(program)
+    return program
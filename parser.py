@@ -1,3 +1,5 @@
+from functools import wraps
+
 from lexer import (
     TokenKeyword,
     TokenOpenBrace,
@@ -5,6 +7,7 @@ from lexer import (
     TokenOpenParen,
     TokenCloseParen,
     TokenSemicolon,
+    TokenComma,
     TokenAssignmentOperator,
     TokenAdditionOperator,
     TokenMultiplicationOperator,
@@ -17,6 +20,8 @@ from lexer import (
     TokenFloat,
     TokenString,
 )
+from interning import symbols
+from visitor import format_tree
 
 class Int():
     '''An integer literal'''
@@ -24,7 +29,21 @@ class Int():
         self.value = value
 
     def __str__(self):
-        return "(Int {0})".format(self.value)
+        return format_tree(self)
+
+    def __repr__(self):
+        return str(self)
+
+class Float():
+    '''A floating point literal'''
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return format_tree(self)
+
+    def __repr__(self):
+        return str(self)
 
 class Constant():
     '''A constant value'''
@@ -32,15 +51,24 @@ class Constant():
         self.value = value
 
     def __str__(self):
-        return "(Constant {0})".format(self.value)
+        return format_tree(self)
+
+    def __repr__(self):
+        return str(self)
 
 class Variable():
-    '''A variable'''
-    def __init__(self, value):
-        self.value = value
+    '''A variable, named by its symbol id and canonical name'''
+    def __init__(self, value, id=None):
+        self.id = symbols.intern(value) if id is None else id
+        self.value = symbols.name(self.id)
+        # The declaration this refers to, set by semantic analysis.
+        self.symbol = None
 
     def __str__(self):
-        return "(Variable {0})".format(self.value)
+        return format_tree(self)
+
+    def __repr__(self):
+        return str(self)
 
 class UnaryOperationExpression():
     '''A prefix expression'''
@@ -49,7 +77,10 @@ class UnaryOperationExpression():
         self.operand = operand
 
     def __str__(self):
-        return "(UnaryOp {0} {1})".format(self.operator.value, self.operand)
+        return format_tree(self)
+
+    def __repr__(self):
+        return str(self)
 
 class BinaryOperationExpression():
     ''' An infix expression'''
@@ -59,7 +90,10 @@ class BinaryOperationExpression():
         self.rhs = rhs
 
     def __str__(self):
-        return "(BinaryOp {0} {1} {2})".format(self.operator.value, self.lhs, self.rhs)
+        return format_tree(self)
+
+    def __repr__(self):
+        return str(self)
 
 class IfStatement():
     ''' An if statement'''
@@ -69,7 +103,23 @@ class IfStatement():
         self.else_body = else_body
 
     def __str__(self):
-        return "(IfStatement {0} {1} {2})".format(self.condition, self.body, self.else_body)
+        return format_tree(self)
+
+    def __repr__(self):
+        return str(self)
+
+class Declaration():
+    ''' A local variable declaration, with an optional initializer'''
+    def __init__(self, type_name, name, initializer=None):
+        self.type_name = type_name
+        self.name = name
+        self.initializer = initializer
+
+    def __str__(self):
+        return format_tree(self)
+
+    def __repr__(self):
+        return str(self)
 
 class AssignmentStatement():
     ''' An assignment statement'''
@@ -79,7 +129,19 @@ class AssignmentStatement():
         self.rhs = rhs
 
     def __str__(self):
-        return "(AssignmentStatement {0} {1} {2})".format(self.op.value, self.lhs, self.rhs)
+        return format_tree(self)
+
+    def __repr__(self):
+        return str(self)
+
+class ExpressionStatement():
+    ''' An expression evaluated for its side effects, like a call'''
+    def __init__(self, expression):
+        self.expression = expression
+
+    def __str__(self):
+        return format_tree(self)
+
     def __repr__(self):
         return str(self)
 
@@ -89,7 +151,7 @@ class ReturnStatement():
         self.expression = expression
 
     def __str__(self):
-        return "(ReturnStatement {0})".format(self.expression)
+        return format_tree(self)
 
     def __repr__(self):
         return str(self)
@@ -101,7 +163,10 @@ class Argument():
         self.name = name
 
     def __str__(self):
-        return "(Argument {0} {1})".format(self.type_name, self.name)
+        return format_tree(self)
+
+    def __repr__(self):
+        return str(self)
 
 class Function():
     ''' A function contains a list of statements'''
@@ -110,22 +175,28 @@ class Function():
         self.name = name
         self.arguments = arguments
         self.statements = statements
+        # Set by semantic analysis.
+        self.frame_size = None
+        self.symbol_count = None
 
     def __str__(self):
-        return "(Function {0} {1} ({2}) {3})".format(
-            self.return_type,
-            self.name,
-            self.arguments,
-            str(self.statements))
+        return format_tree(self)
+
+    def __repr__(self):
+        return str(self)
 
 class Call():
     ''' A function call contains a function name and a list of arguments'''
-    def __init__(self, name, arguments = []):
-        self.name = name
+    def __init__(self, name, arguments = [], id=None):
+        self.id = symbols.intern(name) if id is None else id
+        self.name = symbols.name(self.id)
         self.arguments = arguments
 
     def __str__(self):
-        return "(Call {0} ({1}))".format(self.name, self.arguments)
+        return format_tree(self)
+
+    def __repr__(self):
+        return str(self)
 
 class Program():
     ''' A Program contains a list of functions'''
@@ -133,222 +204,646 @@ class Program():
         self.functions = functions
 
     def __str__(self):
-        return "(Program {0})".format(str(self.functions))
+        return format_tree(self)
+
+    def __repr__(self):
+        return str(self)
+
+# Errors reported by one parse before it gives up on the rest of the input.
+MAX_ERRORS = 20
+
+def token_length(token):
+    if token.offset is not None and token.end is not None:
+        return token.end - token.offset
+    # Made by the preprocessor, with no place in a source.
+    return len(str(token.value))
+
+class Diagnostic():
+    ''' A syntax error, and the line and column of the token it was found at
 
-def parse_constant(tokens):
-    if (isinstance(peek(tokens), TokenInteger)):
-        current_token = accept(TokenInteger, tokens)
+    With after set, the column is the one just past the token, as for an
+    error at the end of input following it.
+    '''
+    def __init__(self, message, token=None, after=False):
+        self.message = message
+        self.line = None if token is None else token.line
+        self.column = None if token is None else token.column
+        if after and self.column is not None:
+            self.column += token_length(token)
+
+    def __str__(self):
+        if self.line is None:
+            return self.message
+        return '{0}:{1}: {2}'.format(self.line, self.column, self.message)
+
+    def __repr__(self):
+        return 'Diagnostic({0!r}, line={1}, column={2})'.format(
+            self.message, self.line, self.column)
+
+class ParseError(Exception):
+    ''' Raised with the Diagnostics of one or more syntax errors'''
+    def __init__(self, diagnostics):
+        super().__init__('\n'.join(str(diagnostic) for diagnostic in diagnostics))
+        self.diagnostics = diagnostics
+
+class TokenStream():
+    ''' A cursor over a token list or a lazily consumed token iterator
+
+    Advancing moves an integer cursor instead of removing the head of a list,
+    so every operation is O(1). Tokens from an iterator are buffered only as
+    far as the parser has peeked; compact() drops the consumed prefix.
+
+    While diagnostics is a list, the statement and function parsers record
+    their syntax errors in it and carry on, as parse_recovering arranges;
+    otherwise the first error is raised.
+    '''
+    def __init__(self, tokens, max_errors=MAX_ERRORS):
+        if isinstance(tokens, list):
+            self.tokens = tokens
+            self.source = None
+        else:
+            self.tokens = []
+            self.source = iter(tokens)
+        self.pos = 0
+        # The last token consumed before compact() dropped it.
+        self.last = None
+        self.diagnostics = None
+        self.max_errors = max_errors
+
+    def fill(self, k):
+        tokens = self.tokens
+        while self.source is not None and len(tokens) <= self.pos + k:
+            token = next(self.source, None)
+            if token is None:
+                self.source = None
+            else:
+                tokens.append(token)
+
+    def peek(self, k=0):
+        index = self.pos + k
+        if index >= len(self.tokens):
+            self.fill(k)
+            if index >= len(self.tokens):
+                return None
+        return self.tokens[index]
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise ParseError([Diagnostic("Unexpected end of input", self.last_consumed(),
+                                         after=True)])
+        self.pos += 1
+        return token
+
+    def accept(self, tok_type):
+        token = self.peek()
+        if isinstance(token, tok_type):
+            self.pos += 1
+            return token
+        return None
+
+    def accept_value(self, tok_type, tok_value):
+        token = self.peek()
+        if isinstance(token, tok_type) and token.value == tok_value:
+            self.pos += 1
+            return token
+        return None
+
+    def expect(self, tok_type):
+        match = self.accept(tok_type)
+        if not match:
+            tok_instance = tok_type()
+            if hasattr(tok_instance, 'value'):
+                raise self.error("Expected token {0}".format(tok_instance.value))
+            else:
+                raise self.error("Expected token {0}".format(tok_type.__name__))
+        return match
+
+    def last_consumed(self):
+        if self.pos:
+            return self.tokens[self.pos - 1]
+        return self.last
+
+    def error(self, message, token=None):
+        '''A ParseError located at token, or else at the next token, or at
+        the end of the last one when the input has run out.'''
+        if token is None:
+            token = self.peek()
+            if token is None:
+                message += " at end of input"
+                return ParseError([Diagnostic(message, self.last_consumed(), after=True)])
+        return ParseError([Diagnostic(message, token)])
+
+    def recover(self, error, start):
+        '''Record the syntax errors of a statement or function that began at
+        start, and skip it.
+
+        Raises error instead unless diagnostics are being collected. Once
+        max_errors are recorded, the rest of the input is dropped unread, so
+        every parse loop ends and later errors are not reported.
+        '''
+        if self.diagnostics is None:
+            raise error
+        if len(self.diagnostics) > self.max_errors:
+            # Stopped already; these are errors of the unread input.
+            return
+        self.diagnostics.extend(error.diagnostics)
+        if len(self.diagnostics) >= self.max_errors:
+            self.diagnostics.append(Diagnostic(
+                "Too many errors, stopping after {0}".format(self.max_errors)))
+            self.tokens = []
+            self.pos = 0
+            self.source = None
+            return
+        self.pos = start
+        self.synchronize()
+        if self.pos == start:
+            # Nothing was skipped; step over the first token so the parse
+            # moves on.
+            self.pos += 1
+
+    def synchronize(self):
+        '''Panic mode: skip tokens to the end of the statement or function
+        starting here, just past a ; or a braced block, or to a } that
+        closes an enclosing block.'''
+        depth = 0
+        while True:
+            token = self.peek()
+            if token is None:
+                return
+            if isinstance(token, TokenOpenBrace):
+                depth += 1
+            elif isinstance(token, TokenCloseBrace):
+                if depth == 0:
+                    return
+                depth -= 1
+                if depth == 0:
+                    self.pos += 1
+                    # An if statement goes on past its first block.
+                    if not self.accept_value(TokenKeyword, 'else'):
+                        return
+                    continue
+            elif isinstance(token, TokenSemicolon) and depth == 0:
+                self.pos += 1
+                return
+            self.pos += 1
+
+    def mark(self):
+        return self.pos
+
+    def reset(self, mark):
+        self.pos = mark
+
+    def compact(self):
+        '''Forget consumed tokens. Invalidates any outstanding marks.'''
+        if self.source is not None and self.pos:
+            self.last = self.tokens[self.pos - 1]
+            del self.tokens[:self.pos]
+            self.pos = 0
+
+def streaming(function):
+    '''Let a parse function take a plain token list as its last argument.
+
+    The list is wrapped in a TokenStream for the duration of the call and the
+    tokens consumed are then removed from it, as if they had been popped.
+    Only the entry points are wrapped: the parse functions pass their
+    TokenStream to one another directly, so recursion pays no extra frame.
+    '''
+    @wraps(function)
+    def wrapper(*args):
+        tokens = args[-1]
+        if type(tokens) is TokenStream:
+            return function(*args)
+        stream = TokenStream(tokens)
+        try:
+            return function(*args[:-1], stream)
+        finally:
+            del tokens[:stream.pos]
+    return wrapper
+
+@streaming
+def peek(tokens):
+    return tokens.peek()
+
+@streaming
+def next_token(tokens):
+    return tokens.next()
+
+@streaming
+def accept(tok_type, tokens):
+    return tokens.accept(tok_type)
+
+@streaming
+def accept_value(tok_type, tok_value, tokens):
+    return tokens.accept_value(tok_type, tok_value)
+
+@streaming
+def expect(tok, tokens):
+    return tokens.expect(tok)
+
+def _parse_constant(tokens):
+    if (isinstance(tokens.peek(), TokenInteger)):
+        current_token = tokens.accept(TokenInteger)
         node = Constant(Int(current_token.value))
-    elif (isinstance(peek(tokens), TokenFloat)):
-        current_token = accept(TokenFloat, tokens)
+    elif (isinstance(tokens.peek(), TokenFloat)):
+        current_token = tokens.accept(TokenFloat)
         node = Constant(Float(current_token.value))
-    elif (isinstance(peek(tokens), TokenFloat)):
-        current_token = accept(TokenString, tokens)
+    elif (isinstance(tokens.peek(), TokenString)):
+        current_token = tokens.accept(TokenString)
         node = Constant(current_token.value)
     else:
         node = None
     return node
 
-def parse_variable(tokens):
-    if isinstance(peek(tokens), TokenIdentifier):
-        current_token = tokens.pop(0)
-        node = Variable(current_token.value)
+def _parse_variable(tokens):
+    current_token = tokens.accept(TokenIdentifier)
+    if current_token:
+        node = Variable(current_token.value, current_token.id)
     else:
         node = None
     return node
 
-def parse_primary(tokens):
-    expr = parse_constant(tokens) or parse_variable(tokens)
+def _parse_primary(tokens):
+    if (isinstance(tokens.peek(), TokenIdentifier)
+            and isinstance(tokens.peek(1), TokenOpenParen)):
+        return _parse_function_call(tokens)
+    expr = _parse_constant(tokens) or _parse_variable(tokens)
     if expr:
         return expr
-    open_paren = accept(TokenOpenParen, tokens)
+    open_paren = tokens.accept(TokenOpenParen)
     if open_paren:
-        expr = parse_expression(tokens)
-        expect(TokenCloseParen, tokens)
+        expr = _parse_expression(tokens)
+        tokens.expect(TokenCloseParen)
         return expr
 
-def parse_unary(tokens):
-    if any(isinstance(peek(tokens), x) for x in (
-            TokenLogicalOperator,
-            TokenAdditionOperator,
-    )):
-        operator = (accept(TokenLogicalOperator, tokens)
-                    or accept(TokenAdditionOperator, tokens))
-        rhs = parse_unary(tokens)
-        return UnaryOperationExpression(operator, rhs)
-    else:
-        return parse_primary(tokens)
-
-def parse_multiplication(tokens):
-    expr = parse_unary(tokens)
-    while isinstance(peek(tokens), TokenMultiplicationOperator):
-        operator = accept(TokenMultiplicationOperator, tokens)
-        rhs = parse_multiplication(tokens)
-        expr = BinaryOperationExpression(operator, expr, rhs)
-    return expr
+# Binary operator precedence levels, loosest binding first. Every binary
+# operator is left associative.
+LOGICAL_OR = 1
+LOGICAL_AND = 2
+EQUALITY = 3
+COMPARISON = 4
+ADDITION = 5
+MULTIPLICATION = 6
+
+binary_precedence = {
+    '||': LOGICAL_OR,
+    '&&': LOGICAL_AND,
+    '==': EQUALITY,
+    '!=': EQUALITY,
+    '<': COMPARISON,
+    '>': COMPARISON,
+    '<=': COMPARISON,
+    '>=': COMPARISON,
+    '+': ADDITION,
+    '-': ADDITION,
+    '*': MULTIPLICATION,
+    '/': MULTIPLICATION,
+    '%': MULTIPLICATION,
+}
+
+binary_operator_types = (
+    TokenLogicalOperator,
+    TokenEqualityOperator,
+    TokenInequalityOperator,
+    TokenAdditionOperator,
+    TokenMultiplicationOperator,
+)
 
-def parse_addition(tokens):
-    expr = parse_multiplication(tokens)
-    while isinstance(peek(tokens), TokenAdditionOperator):
-        operator = accept(TokenAdditionOperator, tokens)
-        rhs = parse_addition(tokens)
-        expr = BinaryOperationExpression(operator, expr, rhs)
+def is_unary_operator(token):
+    return (isinstance(token, TokenAdditionOperator)
+            or (isinstance(token, TokenLogicalOperator) and token.value == '!'))
+
+def _parse_unary(tokens):
+    # Collect the prefix operators first and wrap the operand afterwards, so
+    # long runs like - - - x do not recurse.
+    operators = []
+    while is_unary_operator(tokens.peek()):
+        operators.append(tokens.next())
+    expr = _parse_primary(tokens)
+    for operator in reversed(operators):
+        expr = UnaryOperationExpression(operator, expr)
     return expr
 
-def parse_comparison(tokens):
-    expr = parse_addition(tokens)
-    while isinstance(peek(tokens), TokenInequalityOperator):
-        operator = accept(TokenInequalityOperator, tokens)
-        rhs = parse_comparison(tokens)
-        expr = BinaryOperationExpression(operator, expr, rhs)
-    return expr
+def binary_operator_precedence(token):
+    if isinstance(token, binary_operator_types):
+        return binary_precedence.get(token.value)
+    return None
 
-def parse_equality(tokens):
-    expr = parse_comparison(tokens)
-    while isinstance(peek(tokens), TokenEqualityOperator):
-        operator = accept(TokenEqualityOperator, tokens)
-        rhs = parse_equality(tokens)
-        expr = BinaryOperationExpression(operator, expr, rhs)
-        next_token = peek(tokens)
-    return expr
+# Markers kept on parse_binary's operator stack below every binary operator,
+# so that reducing stops at them: a prefix operator waiting for its operand,
+# and an open parenthesis waiting for its ).
+UNARY = -1
+GROUP = 0
+
+def parse_binary(tokens, min_precedence):
+    '''Parse a chain of binary operators binding at least as tightly as
+    min_precedence.
+
+    Operands and pending operators are kept on explicit stacks. Before an
+    operator is pushed, every pending operator of the same or tighter
+    precedence is reduced into a BinaryOperationExpression, which makes the
+    tree left associative and keeps the call depth constant however long the
+    chain is. Prefix operators and parentheses go on the operator stack as
+    markers, so neither - - - x nor ((((x)))) recurses either.
+    '''
+    operands = []
+    operators = []
+    # Open parentheses on the operator stack.
+    groups = 0
+    while True:
+        token = tokens.peek()
+        if is_unary_operator(token):
+            operators.append((UNARY, tokens.next()))
+            continue
+        if isinstance(token, TokenOpenParen):
+            operators.append((GROUP, tokens.next()))
+            groups += 1
+            continue
+        operand = _parse_primary(tokens)
+        if operand is None:
+            if not operators:
+                # Not an expression; the caller decides what it is.
+                return None
+            if operators[-1][0] != GROUP:
+                raise tokens.error("Expected expression after {0}".format(
+                    operators[-1][1].value))
+            raise tokens.error("Expected expression")
+        operands.append(operand)
+        while True:
+            reduce_unary(operators, operands)
+            if not (groups and isinstance(tokens.peek(), TokenCloseParen)):
+                break
+            tokens.next()
+            while operators[-1][0] != GROUP:
+                reduce_binary(operators, operands)
+            operators.pop()
+            groups -= 1
+        precedence = binary_operator_precedence(tokens.peek())
+        if precedence is None or precedence < (LOGICAL_OR if groups else min_precedence):
+            if groups:
+                tokens.expect(TokenCloseParen)
+            break
+        operator = tokens.next()
+        while operators and operators[-1][0] >= precedence:
+            reduce_binary(operators, operands)
+        operators.append((precedence, operator))
+    while operators:
+        reduce_binary(operators, operands)
+    return operands[0]
+
+def reduce_unary(operators, operands):
+    while operators and operators[-1][0] == UNARY:
+        _, operator = operators.pop()
+        operands.append(UnaryOperationExpression(operator, operands.pop()))
+
+def reduce_binary(operators, operands):
+    _, operator = operators.pop()
+    rhs = operands.pop()
+    lhs = operands.pop()
+    operands.append(BinaryOperationExpression(operator, lhs, rhs))
+
+def _parse_multiplication(tokens):
+    return parse_binary(tokens, MULTIPLICATION)
+
+def _parse_addition(tokens):
+    return parse_binary(tokens, ADDITION)
+
+def _parse_comparison(tokens):
+    return parse_binary(tokens, COMPARISON)
+
+def _parse_equality(tokens):
+    return parse_binary(tokens, EQUALITY)
+
+def _parse_expression(tokens):
+    return parse_binary(tokens, LOGICAL_OR)
+
+def _parse_return(tokens):
+    if tokens.accept_value(TokenKeyword, 'return'):
+        expr = _parse_expression(tokens)
+        tokens.expect(TokenSemicolon)
+        return ReturnStatement(expr)
 
-def parse_expression(tokens):
-    return parse_equality(tokens)
+def _parse_assignment(tokens):
+    # An identifier not followed by an assignment operator is left unconsumed
+    # for the statement parsers tried after this one.
+    mark = tokens.mark()
+    lhs = _parse_variable(tokens)
+    if lhs:
+        if isinstance(tokens.peek(), TokenAssignmentOperator):
+            op = tokens.accept(TokenAssignmentOperator)
+            rhs = _parse_expression(tokens)
+            if rhs is None:
+                raise tokens.error("Expected expression after {0}".format(op.value))
+            tokens.expect(TokenSemicolon)
+            return AssignmentStatement(op, lhs, rhs)
+    tokens.reset(mark)
+    return None
 
-def parse_return(tokens):
-    if accept_value(TokenKeyword, 'return', tokens):
-        expr = parse_expression(tokens)
-        expect(TokenSemicolon, tokens)
-        return ReturnStatement(expr)
+# Keywords that can begin a declaration.
+type_names = ('char', 'double', 'float', 'int', 'long', 'short', 'signed', 'unsigned', 'void')
 
-def peek(tokens):
-    if len(tokens) < 1:
+def _parse_initializing_assignment(tokens):
+    # int a;
+    # int a = 1;
+    token = tokens.peek()
+    if not (isinstance(token, TokenKeyword) and token.value in type_names):
         return None
-    else:
-        return tokens[0]
-
-def accept(tok_type, tokens):
-    if isinstance(peek(tokens), tok_type):
-        return tokens.pop(0)
-    else:
+    type_name = tokens.next()
+    name = _parse_variable(tokens)
+    if name is None:
+        raise tokens.error("Expected identifier in declaration")
+    initializer = None
+    if tokens.accept_value(TokenAssignmentOperator, '='):
+        initializer = _parse_expression(tokens)
+        if initializer is None:
+            raise tokens.error("Expected expression after =")
+    tokens.expect(TokenSemicolon)
+    return Declaration(type_name, name, initializer)
+
+def _parse_function_call(tokens):
+    name = tokens.expect(TokenIdentifier)
+    tokens.expect(TokenOpenParen)
+    args = []
+    if not tokens.accept(TokenCloseParen):
+        while True:
+            arg = _parse_expression(tokens)
+            if arg is None:
+                raise tokens.error("Expected argument")
+            args.append(arg)
+            if not tokens.accept(TokenComma):
+                break
+        tokens.expect(TokenCloseParen)
+    return Call(name.value, args, name.id)
+
+def _parse_statements(tokens):
+    # The statements of a block, after its {, up to and including its }.
+    # A statement with a syntax error is skipped when the stream collects
+    # diagnostics.
+    statements = []
+    while True:
+        token = tokens.peek()
+        if isinstance(token, TokenCloseBrace):
+            tokens.next()
+            return statements
+        if token is None:
+            raise tokens.error("Expected token }")
+        start = tokens.mark()
+        try:
+            statements.append(_parse_statement(tokens))
+        except ParseError as error:
+            tokens.recover(error, start)
+
+def _parse_block(tokens):
+    # A braced list of statements, or a single statement
+    if tokens.accept(TokenOpenBrace):
+        return _parse_statements(tokens)
+    return [_parse_statement(tokens)]
+
+def _parse_if(tokens):
+    if not tokens.accept_value(TokenKeyword, 'if'):
         return None
-
-def accept_value(tok_type, tok_value, tokens):
-    if isinstance(peek(tokens), tok_type) and peek(tokens).value == tok_value:
-        return tokens.pop(0)
-    else:
+    tokens.expect(TokenOpenParen)
+    condition = _parse_expression(tokens)
+    tokens.expect(TokenCloseParen)
+    body = _parse_block(tokens)
+    else_body = []
+    if tokens.accept_value(TokenKeyword, 'else'):
+        else_body = _parse_block(tokens)
+    return IfStatement(condition, body, else_body)
+
+def _parse_expression_statement(tokens):
+    expr = _parse_expression(tokens)
+    if expr is None:
         return None
+    tokens.expect(TokenSemicolon)
+    return ExpressionStatement(expr)
 
-def expect(tok, tokens):
-    match = accept(tok, tokens)
-    if not match:
-        tok_instance = tok()
-        if hasattr(tok_instance, 'value'):
-            raise Exception("Expected token {0}".format(tok_instance.value))
-        else:
-            raise Exception("Expected token {0}".format(tok.__name__))
-    return match
-
-def parse_assignment(tokens):
-    lhs = parse_variable(tokens)
-    if lhs:
-        if isinstance(peek(tokens), TokenAssignmentOperator):
-            op = accept(TokenAssignmentOperator, tokens)
-            rhs = parse_expression(tokens)
-            expect(TokenSemicolon, tokens)
-            return AssignmentStatement(op, lhs, rhs)
-    return None
-
-def parse_initializing_assignment(tokens):
-    # handle initializing assignment statement
-    if accept(TokenKeyword, tokens):
-        if accept(TokenIdentifier, tokens):
-            if accept(TokenAssignmentOperator, tokens):
-                expr = parse_expression(tokens)
-                expect(TokenSemicolon, tokens)
-                return AssignmentStatement(expr)
-
-def parse_function_call(tokens):
-    if accept(TokenOpenParen, tokens):
-        # handle function call
-        args = []
-        while not accept(TokenCloseParen, tokens):
-            args.append(parse_function_argument(tokens))
-            expect(TokenSemicolon, tokens)
-        return Call()
-
-def parse_statement(tokens):
+def _parse_statement(tokens):
     # Declarations
     # int a;
+    # int a = 1;
     # Assignment statements:
     # a = 1;
-    # int a = 1;
+    # a += 1;
     # Return statements:
     # return a;
     # return a + 1;
-    # Other keyword statements:
-    # break;
-    # continue;
-    # check if first token is keyword or identifier name
-    stmt = (parse_return(tokens)
-            or parse_assignment(tokens)
-            or parse_init(tokens)
-            or parse_call(tokens))
+    # If statements:
+    # if (a) return 1; else { a = 2; }
+    # Expression statements:
+    # f(a);
+    stmt = (_parse_return(tokens)
+            or _parse_if(tokens)
+            or _parse_initializing_assignment(tokens)
+            or _parse_assignment(tokens)
+            or _parse_expression_statement(tokens))
+    if stmt is None:
+        raise tokens.error("Expected statement")
 
     return stmt
 
-def parse_function_argument(tokens):
+def _parse_function_argument(tokens):
     # does not handle * pointer yet
-    current_token = tokens.pop(0)
+    current_token = tokens.next()
     if not isinstance(current_token, TokenKeyword):
-        raise Exception("Expected argument type declaration")
+        raise tokens.error("Expected argument type declaration", current_token)
 
     type_name = current_token
 
-    if not(isinstance(peek(tokens), TokenIdentifier)):
-        raise Exception("Expected identifier for argument name")
+    if not(isinstance(tokens.peek(), TokenIdentifier)):
+        raise tokens.error("Expected identifier for argument name")
 
-    name = parse_variable(tokens)
+    name = _parse_variable(tokens)
 
     return Argument(type_name, name)
 
-def parse_function_declaration(tokens):
-    current_token = tokens.pop(0)
+def _parse_function_declaration(tokens):
+    current_token = tokens.next()
 
     if isinstance(current_token, TokenKeyword):
         return_type = current_token
     else:
-        raise Exception("Expected return type declaration")
+        raise tokens.error("Expected return type declaration", current_token)
 
-    current_token = tokens.pop(0)
+    current_token = tokens.next()
     if isinstance(current_token, TokenIdentifier):
         name = current_token
     else:
-        raise Exception("Expected identifier for function name")
+        raise tokens.error("Expected identifier for function name", current_token)
 
-    current_token = tokens.pop(0)
+    current_token = tokens.next()
     args = []
     if isinstance(current_token, TokenOpenParen):
-        while not isinstance(peek(tokens), TokenCloseParen):
-            args.append(parse_function_argument(tokens))
+        if (isinstance(tokens.peek(1), TokenCloseParen)
+                and tokens.accept_value(TokenKeyword, 'void')):
+            pass
+        while not isinstance(tokens.peek(), TokenCloseParen):
+            args.append(_parse_function_argument(tokens))
+            if not tokens.accept(TokenComma):
+                break
     else:
-        raise Exception("Expected token (")
+        raise tokens.error("Expected token (", current_token)
 
-    tokens.pop(0) # swallow )
-    statements = []
-    current_token = tokens.pop(0) # should be {
-    if isinstance(current_token, TokenOpenBrace):
-        while not isinstance(peek(tokens), TokenCloseBrace):
-            statements.append(parse_statement(tokens))
-    else:
-        raise Exception("Expected token {")
+    tokens.expect(TokenCloseParen)
+    tokens.expect(TokenOpenBrace)
+    statements = _parse_statements(tokens)
 
     return Function(return_type, name, args, statements)
 
-
-def parse(tokens):
+def _parse_recovering(tokens):
+    '''Parse a Program, recovering from syntax errors to find as many as
+    possible in one pass.
+
+    A statement with an error is skipped up to the next ; or }, and a
+    function whose header has one up to the end of its body. Returns the
+    Program of what parsed and the list of Diagnostics, in source order,
+    which is empty if there were no errors. After tokens.max_errors errors
+    the rest of the input is ignored.
+    '''
+    tokens.diagnostics = []
     functions = []
-    while len(tokens) > 0:
-        functions.append(parse_function(tokens))
-
-    return Program(functions)
+    while tokens.peek() is not None:
+        start = tokens.mark()
+        try:
+            functions.append(_parse_function_declaration(tokens))
+        except ParseError as error:
+            tokens.recover(error, start)
+        # Nothing is backtracked across function boundaries, so tokens of
+        # finished functions can be released.
+        tokens.compact()
+    diagnostics = tokens.diagnostics
+    tokens.diagnostics = None
+    return Program(functions), diagnostics
+
+@streaming
+def parse(tokens):
+    '''Parse a Program, raising a ParseError with every syntax error found
+    by parse_recovering.'''
+    program, diagnostics = _parse_recovering(tokens)
+    if diagnostics:
+        raise ParseError(diagnostics)
+    return program
+
+# The parse functions above take a TokenStream and call one another
+# directly. Under their public names they also take a plain token list.
+parse_constant = streaming(_parse_constant)
+parse_variable = streaming(_parse_variable)
+parse_primary = streaming(_parse_primary)
+parse_unary = streaming(_parse_unary)
+parse_multiplication = streaming(_parse_multiplication)
+parse_addition = streaming(_parse_addition)
+parse_comparison = streaming(_parse_comparison)
+parse_equality = streaming(_parse_equality)
+parse_expression = streaming(_parse_expression)
+parse_return = streaming(_parse_return)
+parse_assignment = streaming(_parse_assignment)
+parse_initializing_assignment = streaming(_parse_initializing_assignment)
+parse_function_call = streaming(_parse_function_call)
+parse_statements = streaming(_parse_statements)
+parse_block = streaming(_parse_block)
+parse_if = streaming(_parse_if)
+parse_expression_statement = streaming(_parse_expression_statement)
+parse_statement = streaming(_parse_statement)
+parse_function_argument = streaming(_parse_function_argument)
+parse_function_declaration = streaming(_parse_function_declaration)
+parse_recovering = streaming(_parse_recovering)
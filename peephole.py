@@ -0,0 +1,205 @@
+'''Peephole optimization of the assembly codegen emits for a function.
+
+The function's lines are kept as tuples rather than text: an instruction
+is its mnemonic followed by its operands, ('movl', '$0', '%eax'), and
+labels and directives are tagged with LABEL and DIRECTIVE. Each rule
+looks at the lines starting at one position and may replace some of
+them. The rules are tried at every position in turn, and whole passes
+are repeated until one changes nothing, since one rewrite often makes
+room for another.
+
+The rules rely on one property of pycc's code generators: every
+instruction that reads the flags directly follows the compare that sets
+them, so no flags are live across a label, jump or call.
+'''
+
+LABEL = '<label>'
+DIRECTIVE = '<directive>'
+
+# Instructions that set or clobber the flags.
+flag_writers = frozenset((
+    'addl', 'subl', 'imull', 'andl', 'orl', 'xorl', 'negl', 'sall', 'sarl',
+    'cmpl', 'testl', 'idivl', 'addq', 'subq',
+))
+
+registers_32 = frozenset((
+    '%eax', '%ebx', '%ecx', '%edx', '%esi', '%edi',
+    '%r8d', '%r9d', '%r10d', '%r11d', '%r12d', '%r13d', '%r14d', '%r15d',
+))
+
+def is_register(operand):
+    return operand.startswith('%')
+
+def reads_flags(op):
+    return ((op.startswith('j') and op != 'jmp') or op.startswith('set')
+            or op.startswith('cmov'))
+
+def flags_dead(lines, index):
+    '''Whether the flags are set again, or never read, before anything from
+    lines[index] on reads them.'''
+    for index in range(index, len(lines)):
+        op = lines[index][0]
+        if reads_flags(op):
+            return False
+        if op in flag_writers or op in ('jmp', 'call', 'ret', LABEL):
+            return True
+    return True
+
+def push_pop(lines, index):
+    # pushq X; popq R -> movq X, R, or nothing when X is R.
+    if index + 1 >= len(lines):
+        return None
+    pop = lines[index + 1]
+    if pop[0] != 'popq' or not is_register(pop[1]):
+        return None
+    source = lines[index][1]
+    if source == pop[1]:
+        return 2, []
+    return 2, [('movq', source, pop[1])]
+
+def push_operand_pop(lines, index):
+    # The right operand of a binary operator, when it is a constant or a
+    # local: pushq %rax; movl X, %eax; movl %eax, %ecx; popq %rax
+    # -> movl X, %ecx
+    window = lines[index:index + 4]
+    if (len(window) < 4 or window[0] != ('pushq', '%rax')
+            or window[2] != ('movl', '%eax', '%ecx') or window[3] != ('popq', '%rax')):
+        return None
+    load = window[1]
+    if load[0] != 'movl' or load[2] != '%eax':
+        return None
+    operand = load[1]
+    if not (operand.startswith('$') or operand.endswith('(%rbp)')):
+        return None
+    return 4, [('movl', operand, '%ecx')]
+
+def self_move(lines, index):
+    # movl R, R -> nothing. Only ints are kept in registers, so the upper
+    # half that movl would clear is never read.
+    line = lines[index]
+    if len(line) == 3 and line[1] == line[2]:
+        return 1, []
+    return None
+
+def move_back(lines, index):
+    # movl A, B; movl B, A -> movl A, B, as a store followed by a reload.
+    if index + 1 >= len(lines):
+        return None
+    line = lines[index]
+    following = lines[index + 1]
+    if len(line) == 3 and following == (line[0], line[2], line[1]):
+        return 2, [line]
+    return None
+
+def zero_register(lines, index):
+    # movl $0, R -> xorl R, R, which is shorter but sets the flags.
+    line = lines[index]
+    if (len(line) == 3 and line[1] == '$0' and line[2] in registers_32
+            and flags_dead(lines, index + 1)):
+        return 1, [('xorl', line[2], line[2])]
+    return None
+
+def jump_to_next(lines, index):
+    # jmp L, or a conditional jump, to a label that directly follows it.
+    target = lines[index][1]
+    for index in range(index + 1, len(lines)):
+        line = lines[index]
+        if line[0] != LABEL:
+            return None
+        if line[1] == target:
+            return 1, []
+    return None
+
+def unreachable(lines, index):
+    # Instructions after a jmp or ret are never run until the next label.
+    end = index + 1
+    while end < len(lines) and lines[end][0] not in (LABEL, DIRECTIVE):
+        end += 1
+    if end == index + 1:
+        return None
+    return end - index, [lines[index]]
+
+# The rules tried at a line, by its mnemonic, in order.
+rules = {
+    'pushq': (('push-pop', push_pop), ('push-operand-pop', push_operand_pop)),
+    'movl': (('self-move', self_move), ('move-back', move_back), ('zero-register', zero_register)),
+    'movq': (('self-move', self_move), ('move-back', move_back)),
+    'jmp': (('unreachable', unreachable), ('jump-to-next', jump_to_next)),
+    'ret': (('unreachable', unreachable),),
+}
+for op in ('je', 'jne', 'jl', 'jg', 'jle', 'jge'):
+    rules[op] = (('jump-to-next', jump_to_next),)
+
+def rewrite(lines, hits):
+    '''One pass of the rules over lines. Returns the new lines, or None if
+    no rule applied.'''
+    result = []
+    append = result.append
+    rules_for = rules.get
+    changed = False
+    index = 0
+    end = len(lines)
+    while index < end:
+        line = lines[index]
+        candidates = rules_for(line[0])
+        if candidates is not None:
+            for name, rule in candidates:
+                rewritten = rule(lines, index)
+                if rewritten is not None:
+                    count, replacement = rewritten
+                    result.extend(replacement)
+                    index += count
+                    hits[name] = hits.get(name, 0) + 1
+                    changed = True
+                    break
+            else:
+                append(line)
+                index += 1
+        else:
+            append(line)
+            index += 1
+    return result if changed else None
+
+def optimize(lines, hits=None):
+    '''Rewrite lines until no rule applies, counting each rule's rewrites
+    in hits.'''
+    if hits is None:
+        hits = {}
+    while True:
+        rewritten = rewrite(lines, hits)
+        if rewritten is None:
+            return lines
+        lines = rewritten
+
+class PeepholeEmitter():
+    ''' Collects a function's lines for the peephole rules, then passes the
+    result on to an emitter
+
+    It has codegen.Emitter's methods; flush() is called at the end of each
+    function. hits counts the rewrites of each rule over every function.
+    '''
+    def __init__(self, emitter, hits=None):
+        self.emitter = emitter
+        self.lines = []
+        self.hits = {} if hits is None else hits
+
+    def instruction(self, op, *operands):
+        self.lines.append((op,) + operands)
+
+    def label(self, name):
+        self.lines.append((LABEL, name))
+
+    def directive(self, text):
+        self.lines.append((DIRECTIVE, text))
+
+    def flush(self):
+        emitter = self.emitter
+        for line in optimize(self.lines, self.hits):
+            if line[0] == LABEL:
+                emitter.label(line[1])
+            elif line[0] == DIRECTIVE:
+                emitter.directive(line[1])
+            else:
+                emitter.instruction(*line)
+        self.lines = []
+        emitter.flush()
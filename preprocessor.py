@@ -0,0 +1,620 @@
+'''The C preprocessor, run on a source before it is parsed.
+
+Supports #include, #define of object-like and function-like macros,
+#undef, #if, #ifdef, #ifndef, #elif, #else, #endif, #error and
+#pragma once. The # and ## operators are not supported.
+
+Each file is scanned once into runs of tokens and the directives between
+them. Scanned headers are cached by path, mtime and size, in memory and
+optionally on disk. A header wrapped in an include guard, or marked with
+#pragma once, is skipped without being read again when it is included a
+second time. A unit that includes many headers over and over then costs
+time for each distinct header, not for each #include.
+'''
+import os
+import re
+import json
+import mmap
+import hashlib
+import tempfile
+
+import cache
+import lexer
+import parser
+import optimizer
+from interning import symbols
+from lexer import (
+    TokenIdentifier,
+    TokenInteger,
+    TokenOpenParen,
+    TokenCloseParen,
+    TokenComma,
+)
+
+# Bump when the layout of cached headers changes.
+HEADER_FORMAT = 2
+
+# As in GCC, deeper nesting is taken to be an include cycle.
+MAX_INCLUDE_DEPTH = 200
+
+# Comments, and the literals a comment marker may appear in.
+comment_pattern = re.compile(
+    r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'', re.DOTALL)
+
+directive_pattern = re.compile(r'[ \t]*#[ \t]*(\w*)[ \t]*(.*)')
+
+# A function-like macro has its ( right after the name.
+define_pattern = re.compile(r'([A-Za-z_]\w*)(?:\(([^)]*)\))?\s*(.*)')
+
+include_pattern = re.compile(r'"([^"]+)"|<([^>]+)>')
+
+conditional_directives = ('if', 'ifdef', 'ifndef')
+
+class Directive():
+    ''' A preprocessing directive: its name, the text after the name, the
+    tokens of that text, and the line it is on
+
+    For #define, text is the macro name, tokens its replacement list and
+    parameters the names of its parameters, or None for an object-like
+    macro.
+    '''
+    __slots__ = ('name', 'text', 'tokens', 'line', 'parameters')
+
+    def __init__(self, name, text, tokens, line, parameters=None):
+        self.name = name
+        self.text = text
+        self.tokens = tokens
+        self.line = line
+        self.parameters = parameters
+
+class Macro():
+    ''' A defined macro: its parameter names, None unless function-like,
+    and replacement tokens'''
+    __slots__ = ('parameters', 'body')
+
+    def __init__(self, parameters, body):
+        self.parameters = parameters
+        self.body = body
+
+class Header():
+    ''' A scanned file: its items, and the macro guarding it, if any
+
+    Items are lists of tokens and Directives, in order. key is the path,
+    mtime and size the items were scanned from.
+    '''
+    __slots__ = ('path', 'key', 'items', 'guard', 'table')
+
+    def __init__(self, path, key, items):
+        self.path = path
+        self.key = key
+        self.items = items
+        self.guard = find_guard(items)
+        # The symbol table the tokens' ids belong to.
+        self.table = symbols.table
+
+def location(path, line):
+    return '{0}:{1}'.format(path or '<source>', line)
+
+def strip_comment(match):
+    text = match.group()
+    if text.startswith('//'):
+        return ''
+    if text.startswith('/*'):
+        # Keep the newlines, so lines after the comment keep their numbers.
+        return ' ' + '\n' * text.count('\n')
+    return text
+
+def lex_line(text, line):
+    tokens = lexer.lex(text)
+    for token in tokens:
+        token.line = line
+    return tokens
+
+def make_directive(name, text, line, path):
+    if name == 'define':
+        match = define_pattern.match(text)
+        if match is None:
+            raise Exception("{0}: Expected macro name after #define".format(location(path, line)))
+        parameters = match.group(2)
+        if parameters is not None:
+            parameters = tuple(name.strip() for name in parameters.split(',') if name.strip())
+        return Directive(name, match.group(1), lex_line(match.group(3), line), line, parameters)
+    if name == 'include':
+        return Directive(name, text, None, line)
+    return Directive(name, text, lex_line(text, line), line)
+
+def scan(text, path=None):
+    '''Split source text into a list of token runs and Directives.'''
+    text = comment_pattern.sub(strip_comment, text)
+    lines = text.split('\n')
+    items = []
+    # The lines of the token run being collected, and its first line number.
+    run = []
+    run_line = 1
+    number = 0
+    while number < len(lines):
+        line = lines[number]
+        start = number + 1
+        number += 1
+        while line.endswith('\\') and number < len(lines):
+            line = line[:-1] + lines[number]
+            number += 1
+        match = directive_pattern.match(line)
+        if match is None:
+            if not run:
+                run_line = start
+            run.append(line)
+            # Continued lines count, so later tokens keep their line numbers.
+            run.extend([''] * (number - start))
+            continue
+        if run:
+            tokens = lexer.lex('\n'.join(run))
+            for token in tokens:
+                token.line += run_line - 1
+            if tokens:
+                items.append(tokens)
+            run = []
+        items.append(make_directive(match.group(1), match.group(2).strip(), start, path))
+    if run:
+        tokens = lexer.lex('\n'.join(run))
+        for token in tokens:
+            token.line += run_line - 1
+        if tokens:
+            items.append(tokens)
+    return items
+
+def guard_name(directive):
+    '''The macro an #ifndef X or #if !defined(X) tests, or None.'''
+    if directive.name not in ('ifndef', 'if'):
+        return None
+    values = [token.value for token in directive.tokens]
+    if directive.name == 'ifndef' and len(values) == 1:
+        return values[0]
+    if directive.name == 'if' and values[:2] == ['!', 'defined']:
+        if len(values) == 3:
+            return values[2]
+        if len(values) == 5 and values[2] == '(' and values[4] == ')':
+            return values[3]
+    return None
+
+def find_guard(items):
+    '''The guard macro if the whole of items is one #ifndef block, else
+    None.'''
+    if not items or not isinstance(items[0], Directive):
+        return None
+    guard = guard_name(items[0])
+    if guard is None:
+        return None
+    depth = 0
+    for index, item in enumerate(items):
+        if not isinstance(item, Directive):
+            continue
+        if item.name in conditional_directives:
+            depth += 1
+        elif item.name in ('elif', 'else') and depth == 1:
+            return None
+        elif item.name == 'endif':
+            depth -= 1
+            if depth == 0:
+                return guard if index == len(items) - 1 else None
+    return None
+
+def encode_tokens(tokens):
+    return [(token.kind, token.value if token.interned else str(token.value),
+             token.line, token.column) for token in tokens]
+
+def decode_tokens(encoded):
+    types = lexer.all_token_types
+    return [lexer.make_token(types[kind], text, None, None, line, column)
+            for kind, text, line, column in encoded]
+
+def encode_items(items):
+    '''items as plain lists and dicts for JSON. Token ids are only valid in
+    the process that made them, so tokens are stored by kind and text.'''
+    encoded = []
+    for item in items:
+        if isinstance(item, Directive):
+            tokens = None if item.tokens is None else encode_tokens(item.tokens)
+            encoded.append({'name': item.name, 'text': item.text, 'tokens': tokens,
+                            'line': item.line, 'parameters': item.parameters})
+        else:
+            encoded.append(encode_tokens(item))
+    return encoded
+
+def decode_items(encoded):
+    items = []
+    for item in encoded:
+        if isinstance(item, dict):
+            tokens = item['tokens']
+            if tokens is not None:
+                tokens = decode_tokens(tokens)
+            items.append(Directive(item['name'], item['text'], tokens, item['line'],
+                                   item['parameters']))
+        else:
+            items.append(decode_tokens(item))
+    return items
+
+class HeaderCache():
+    ''' Scanned headers by path, checked against the file's mtime and size
+
+    Headers are kept in memory for the life of the process, so a worker
+    or compile server scans each header once. With a directory, they are
+    also stored there as JSON, to be reused by later runs. The files sit
+    among the compile cache's entries and share its size limit; a hit
+    refreshes the file's mtime, so a header in use is not evicted first.
+    '''
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.headers = {}
+        # Files read and scanned, rather than found in the cache.
+        self.reads = 0
+
+    def load(self, path):
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        header = self.headers.get(path)
+        if header is None or header.key != key:
+            header = self.fetch(key)
+            if header is None:
+                with open(path) as infile:
+                    text = infile.read()
+                self.reads += 1
+                header = Header(path, key, scan(text, path))
+                self.store(header)
+            self.headers[path] = header
+        elif header.table is not symbols.table:
+            # Scanned during another compile, whose symbol table the
+            # tokens' ids belong to.
+            header = Header(path, key, decode_items(encode_items(header.items)))
+            self.headers[path] = header
+        return header
+
+    def entry_path(self, key):
+        digest = hashlib.sha256('{0}\0{1}\0{2!r}'.format(
+            HEADER_FORMAT, cache.compiler_fingerprint(), key).encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:] + '.tokens')
+
+    def fetch(self, key):
+        if self.directory is None:
+            return None
+        path = self.entry_path(key)
+        try:
+            with open(path, 'rb') as infile:
+                items = decode_items(json.load(infile))
+            os.utime(path)
+        except FileNotFoundError:
+            # Never stored, or evicted by another process meanwhile.
+            return None
+        except (ValueError, LookupError, TypeError):
+            # Not written by this version, or damaged: scan the header again.
+            return None
+        return Header(key[0], key, items)
+
+    def store(self, header):
+        if self.directory is None:
+            return
+        path = self.entry_path(header.key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as outfile:
+                json.dump(encode_items(header.items), outfile, separators=(',', ':'))
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+
+# One HeaderCache per cache directory, shared by every unit this process
+# preprocesses.
+header_caches = {}
+
+def header_cache(directory=None):
+    headers = header_caches.get(directory)
+    if headers is None:
+        headers = header_caches[directory] = HeaderCache(directory)
+    return headers
+
+class Frame():
+    ''' A file being preprocessed: its items, the next one to process, and
+    its open conditionals
+
+    Each conditional is [enclosing block active, a branch already taken,
+    this branch active].
+    '''
+    __slots__ = ('path', 'items', 'index', 'conditions', 'active')
+
+    def __init__(self, path, items):
+        self.path = path
+        self.items = items
+        self.index = 0
+        self.conditions = []
+        self.active = True
+
+class Preprocessor():
+    ''' Preprocesses one translation unit into a list of tokens
+
+    Included files are entered on an explicit stack of Frames. The
+    headers found, as (path, mtime, size), are listed in dependencies,
+    for keying compile caches.
+    '''
+    def __init__(self, include_paths=(), headers=None):
+        self.include_paths = list(include_paths)
+        self.headers = header_cache() if headers is None else headers
+        self.macros = {}
+        # Headers that said #pragma once, and the guard macro of each
+        # guarded header, by path.
+        self.once = set()
+        self.guards = {}
+        self.resolved = {}
+        self.dependencies = []
+        # Includes skipped because of a guard or #pragma once.
+        self.skipped = 0
+
+    def preprocess(self, text, path=None):
+        output = []
+        frames = [Frame(path, scan(text, path))]
+        while frames:
+            frame = frames[-1]
+            if frame.index == len(frame.items):
+                if frame.conditions:
+                    raise Exception("{0}: Unterminated conditional directive".format(
+                        frame.path or '<source>'))
+                frames.pop()
+                continue
+            item = frame.items[frame.index]
+            frame.index += 1
+            if not isinstance(item, Directive):
+                if frame.active:
+                    output.extend(self.expand(item))
+                continue
+            header = self.directive(frame, item)
+            if header is not None:
+                if len(frames) > MAX_INCLUDE_DEPTH:
+                    raise Exception("{0}: #include nested too deeply".format(
+                        location(frame.path, item.line)))
+                if header.guard is not None:
+                    self.guards[header.path] = header.guard
+                frames.append(Frame(header.path, header.items))
+        return output
+
+    def directive(self, frame, directive):
+        '''Carry out directive. Returns the Header to enter for an #include
+        that is not skipped.'''
+        name = directive.name
+        conditions = frame.conditions
+        if name in conditional_directives:
+            if frame.active:
+                value = self.condition(frame, directive)
+                conditions.append([True, value, value])
+            else:
+                conditions.append([False, True, False])
+        elif name in ('elif', 'else', 'endif'):
+            if not conditions:
+                raise Exception("{0}: #{1} without #if".format(
+                    location(frame.path, directive.line), name))
+            condition = conditions[-1]
+            if name == 'endif':
+                conditions.pop()
+            elif name == 'else':
+                condition[2] = condition[0] and not condition[1]
+                condition[1] = True
+            elif condition[0] and not condition[1]:
+                condition[2] = condition[1] = self.evaluate(frame, directive)
+            else:
+                condition[2] = False
+        elif not frame.active:
+            return None
+        elif name == 'define':
+            self.macros[directive.text] = Macro(directive.parameters, directive.tokens)
+        elif name == 'undef':
+            for token in directive.tokens[:1]:
+                self.macros.pop(token.value, None)
+        elif name == 'include':
+            return self.include(frame, directive)
+        elif name == 'pragma':
+            if frame.path is not None and directive.text == 'once':
+                self.once.add(frame.path)
+        elif name == 'error':
+            raise Exception("{0}: #error {1}".format(
+                location(frame.path, directive.line), directive.text))
+        elif name not in ('', 'line'):
+            raise Exception("{0}: Unknown directive #{1}".format(
+                location(frame.path, directive.line), name))
+        frame.active = conditions[-1][2] if conditions else True
+        return None
+
+    def condition(self, frame, directive):
+        if directive.name == 'if':
+            return self.evaluate(frame, directive)
+        if not directive.tokens:
+            raise Exception("{0}: Expected macro name after #{1}".format(
+                location(frame.path, directive.line), directive.name))
+        defined = directive.tokens[0].value in self.macros
+        return defined if directive.name == 'ifdef' else not defined
+
+    def evaluate(self, frame, directive):
+        '''The truth of an #if or #elif expression.'''
+        line = directive.line
+        tokens = directive.tokens
+        replaced = []
+        index = 0
+        while index < len(tokens):
+            token = tokens[index]
+            if isinstance(token, TokenIdentifier) and token.value == 'defined':
+                if index + 1 < len(tokens) and isinstance(tokens[index + 1], TokenOpenParen):
+                    operand = tokens[index + 2:index + 3]
+                    index += 4
+                else:
+                    operand = tokens[index + 1:index + 2]
+                    index += 2
+                if not operand:
+                    raise Exception("{0}: Expected macro name after defined".format(
+                        location(frame.path, line)))
+                replaced.append(integer_token(int(operand[0].value in self.macros), line))
+            else:
+                replaced.append(token)
+                index += 1
+        # Names left after expansion are not macros, and count as 0.
+        expanded = [integer_token(0, line) if isinstance(token, TokenIdentifier) else token
+                    for token in self.expand(replaced)]
+        stream = parser.TokenStream(expanded)
+        expr = parser.parse_expression(stream)
+        value = None
+        if expr is not None and stream.peek() is None:
+            value = optimizer.constant_value(optimizer.fold_expression(expr))
+        if value is None:
+            raise Exception("{0}: #{1} needs a constant expression".format(
+                location(frame.path, line), directive.name))
+        return value != 0
+
+    def include(self, frame, directive):
+        match = include_pattern.match(directive.text)
+        if match is None:
+            raise Exception('{0}: #include expects "FILE" or <FILE>'.format(
+                location(frame.path, directive.line)))
+        quoted, name = match.group(1) is not None, match.group(1) or match.group(2)
+        path = self.resolve(name, frame.path if quoted else None, quoted)
+        if path is None:
+            raise Exception("{0}: Cannot find include file {1}".format(
+                location(frame.path, directive.line), name))
+        guard = self.guards.get(path)
+        if path in self.once or (guard is not None and guard in self.macros):
+            self.skipped += 1
+            return None
+        header = self.headers.load(path)
+        self.dependencies.append(header.key)
+        return header
+
+    def resolve(self, name, including, quoted):
+        '''The path of the file #include name refers to, or None. A quoted
+        name is looked for next to the including file first.'''
+        directory = None
+        if quoted:
+            directory = os.path.dirname(including) if including else '.'
+        key = (name, directory)
+        if key in self.resolved:
+            return self.resolved[key]
+        directories = [directory] if quoted else []
+        path = None
+        for directory in directories + self.include_paths:
+            candidate = os.path.normpath(os.path.join(directory, name))
+            if os.path.isfile(candidate):
+                path = candidate
+                break
+        self.resolved[key] = path
+        return path
+
+    def expand(self, tokens, hidden=frozenset()):
+        '''tokens with every macro replaced, rescanning each replacement.
+
+        Each pending token carries the set of macros it came out of, which
+        are not expanded again within it, so recursive macros stop.
+        '''
+        macros = self.macros
+        if not macros:
+            return tokens
+        output = []
+        pending = [(token, hidden) for token in reversed(tokens)]
+        while pending:
+            token, hide = pending.pop()
+            macro = None
+            if isinstance(token, TokenIdentifier) and token.value not in hide:
+                macro = macros.get(token.value)
+            if macro is None:
+                output.append(token)
+                continue
+            if macro.parameters is None:
+                body = macro.body
+            elif pending and isinstance(pending[-1][0], TokenOpenParen):
+                body = self.substitute(token.value, macro, pending, hide)
+            else:
+                # A function-like macro name without arguments is left alone.
+                output.append(token)
+                continue
+            inner = hide | {token.value}
+            pending.extend((replacement, inner) for replacement in reversed(body))
+        return output
+
+    def substitute(self, name, macro, pending, hide):
+        '''Take the arguments of a call of macro off pending and return its
+        body with each parameter replaced by its expanded argument.'''
+        arguments = [[]]
+        depth = 0
+        while True:
+            if not pending:
+                raise Exception("Unterminated call of macro {0}".format(name))
+            token, _ = pending.pop()
+            if isinstance(token, TokenOpenParen):
+                depth += 1
+                if depth == 1:
+                    continue
+            elif isinstance(token, TokenCloseParen):
+                depth -= 1
+                if depth == 0:
+                    break
+            elif isinstance(token, TokenComma) and depth == 1:
+                arguments.append([])
+                continue
+            arguments[-1].append(token)
+        if not macro.parameters and arguments == [[]]:
+            arguments = []
+        if len(arguments) != len(macro.parameters):
+            raise Exception("Macro {0} takes {1} arguments, got {2}".format(
+                name, len(macro.parameters), len(arguments)))
+        values = {parameter: self.expand(argument, hide)
+                  for parameter, argument in zip(macro.parameters, arguments)}
+        body = []
+        for token in macro.body:
+            if isinstance(token, TokenIdentifier) and token.value in values:
+                body.extend(values[token.value])
+            else:
+                body.append(token)
+        return body
+
+def integer_token(value, line):
+    return lexer.make_token(TokenInteger, str(value), None, None, line, None)
+
+def needs_preprocessing(text):
+    '''Whether text, a str, bytes or memory map, has directives or comments
+    for the preprocessor to handle.'''
+    if isinstance(text, str):
+        return '#' in text or '//' in text or '/*' in text
+    return text.find(b'#') >= 0 or text.find(b'//') >= 0 or text.find(b'/*') >= 0
+
+def file_needs_preprocessing(infile, chunk_size=lexer.CHUNK_SIZE):
+    '''needs_preprocessing for a seekable text file, read a chunk at a time
+    and then rewound to where it was.'''
+    start = infile.tell()
+    # The last character of a chunk, which may start a // or /*.
+    carry = ''
+    try:
+        while True:
+            chunk = infile.read(chunk_size)
+            if not chunk:
+                return False
+            text = carry + chunk
+            if needs_preprocessing(text):
+                return True
+            carry = text[-1:]
+    finally:
+        infile.seek(start)
+
+def source_tokens(source, source_file=None, include_paths=(), cache_dir=None):
+    '''The tokens of a source for the parser: a str, bytes, memory map or
+    text file. Sources the preprocessor has nothing to do for are lexed as
+    they are read, or in place. The others are read and decoded whole, as
+    the preprocessor works on the text of the file.'''
+    if not isinstance(source, (str, bytes, bytearray, mmap.mmap)):
+        if source.seekable() and not file_needs_preprocessing(source):
+            return lexer.iter_tokens(source)
+        source = source.read()
+    if not needs_preprocessing(source):
+        return lexer.iter_tokens(source)
+    return preprocess(source, source_file, include_paths, cache_dir)
+
+def preprocess(source, source_file=None, include_paths=(), cache_dir=None):
+    '''Preprocess source, a str, bytes or memory map, and return its tokens.'''
+    if not isinstance(source, str):
+        source = source[:].decode('utf-8')
+    return Preprocessor(include_paths, header_cache(cache_dir)).preprocess(source, source_file)
@@ -1,14 +1,305 @@
 import os
 import sys
-import lexer
-import parser
-import codegen
+import argparse
+import contextlib
+import cache
 
-if __name__ == '__main__':
-    source_file = sys.argv[1]
-    assembly_file = os.path.splitext(source_file)[0] + '.s'
+# The compiler modules and the process pool are imported where they are
+# first used, so that pycc --connect starts as a thin client and leaves
+# the compiling to a warm server.
+
+# Assembly is written through a buffer of this many bytes.
+OUTPUT_BUFFER_SIZE = 1 << 16
+
+SOURCE_EXTENSION = '.c'
+
+def assembly_path(source_file):
+    return os.path.splitext(source_file)[0] + '.s'
+
+def error_message(source_file, error):
+    '''The report of a failed compile: a line per line of the error, so a
+    parser.ParseError gives one for each syntax error.'''
+    return '\n'.join('{0}: error: {1}'.format(source_file, line)
+                     for line in str(error).splitlines() or [''])
+
+def compile_stream(infile, outfile, optimize=0, report=None, source_file=None,
+                   include_paths=(), cache_dir=None, tokens=None):
+    '''Compile infile to outfile. tokens, if given, are infile's tokens
+    already preprocessed, and infile is not read.'''
+    import parser
+    import codegen
+    import optimizer
+    import semantic
+    import preprocessor
+    if report is not None:
+        return compile_stream_timed(infile, outfile, optimize, report, source_file,
+                                    include_paths, cache_dir, tokens)
+    # A source without directives or comments is lexed from the file a
+    # chunk at a time, or in place from a memory map, and consumed by the
+    # parser as it is produced, so the source is never held whole.
+    if tokens is None:
+        tokens = preprocessor.source_tokens(infile, source_file, include_paths, cache_dir)
+    tokens = parser.TokenStream(tokens)
+    ast = semantic.analyse(parser.parse(tokens))
+    if optimize:
+        ast = optimizer.optimize(ast, optimize)
+    codegen.codegen(ast, outfile, optimize)
+
+def compile_stream_timed(infile, outfile, optimize, report, source_file=None,
+                         include_paths=(), cache_dir=None, tokens=None):
+    '''compile_stream, recording each phase into an instrument.Report.
+
+    The phases are run one after another rather than interleaved, lexing
+    the whole source before parsing it, so that each can be timed alone.
+    Preprocessing counts as lexing.
+    '''
+    import preprocessor
+    import parser
+    import codegen
+    import optimizer
+    import semantic
+    import instrument
+    report.files += 1
+    with report.phase('lex') as phase:
+        if tokens is None:
+            tokens = preprocessor.source_tokens(infile, source_file, include_paths, cache_dir)
+        tokens = list(tokens)
+        phase.count('tokens', len(tokens))
+    with report.phase('parse') as phase:
+        ast = parser.parse(tokens)
+        phase.count('nodes', instrument.count_nodes(ast))
+    with report.phase('analyse') as phase:
+        semantic.analyse(ast)
+        phase.count('symbols', sum(function.symbol_count for function in ast.functions))
+    if optimize:
+        with report.phase('optimize') as phase:
+            ast = optimizer.optimize(ast, optimize)
+            phase.count('nodes', instrument.count_nodes(ast))
+    with report.phase('codegen') as phase:
+        hits = {}
+        assembly = codegen.codegen(ast, level=optimize, hits=hits)
+        phase.count('instructions', instrument.count_instructions(assembly))
+        for rule, number in hits.items():
+            phase.count('peephole:' + rule, number)
+    with report.phase('write'):
+        outfile.write(assembly)
+
+def compile_file(source_file, assembly_file, optimize=0, report=None, include_paths=(),
+                 cache_dir=None, tokens=None):
+    import lexer
+    # The source is memory mapped and lexed in place, so it is never copied
+    # into a str; the mapping stays open until codegen has finished with
+    # the tokens.
+    with open(source_file, 'rb') as infile, lexer.mapped(infile) as source, \
+            open(assembly_file, 'w', buffering=OUTPUT_BUFFER_SIZE) as outfile:
+        try:
+            compile_stream(source, outfile, optimize, report, source_file,
+                           include_paths, cache_dir, tokens)
+        except BaseException:
+            # Leave no half written assembly behind.
+            outfile.close()
+            os.remove(assembly_file)
+            raise
+
+def compile_cached(source_file, assembly_file, optimize, compile_cache, report=None,
+                   include_paths=()):
+    '''Serve assembly_file from compile_cache if this source has been
+    compiled with these options before, otherwise compile it and store the
+    result. Returns 'hit' or 'miss'.
 
-    with open(source_file, 'r') as infile, open(assembly_file, 'w') as outfile:
-        source = infile.read().strip()
-        assembly = codegen(parse(tokenize(source)))
-        outfile.write(str(assembly))
+    A source that includes headers is preprocessed first, and the key
+    covers the path, mtime and size of each header it includes. On a miss
+    the compile goes on from the preprocessed tokens.
+    '''
+    import lexer
+    import preprocessor
+    tokens = None
+    with open(source_file, 'rb') as infile, lexer.mapped(infile) as source:
+        options = (optimize,)
+        if preprocessor.needs_preprocessing(source):
+            unit = preprocessor.Preprocessor(
+                include_paths, preprocessor.header_cache(compile_cache.directory))
+            with report.phase('lex') if report is not None else contextlib.nullcontext():
+                tokens = unit.preprocess(source[:].decode('utf-8'), source_file)
+            options += (tuple(unit.dependencies),)
+        key = compile_cache.key(source, options)
+    if compile_cache.fetch(key, assembly_file):
+        return 'hit'
+    compile_file(source_file, assembly_file, optimize, report, include_paths,
+                 compile_cache.directory, tokens)
+    compile_cache.store(key, assembly_file)
+    return 'miss'
+
+def compile_job(job):
+    '''Compile one source file. Runs in a worker process, so a failure only
+    affects its own file.
+
+    Returns an error message or None, the cache status: 'hit', 'miss', or
+    None when no cache is in use, and an instrument.Report if time_report
+    is set. With profile set, the compile runs under cProfile and the
+    stats are written next to the source as a .prof file.
+    '''
+    source_file, optimize, cache_dir, cache_size, time_report, profile, include_paths = job
+    report = None
+    if time_report or profile:
+        import instrument
+    if time_report:
+        report = instrument.Report()
+    import interning
+    try:
+        with contextlib.ExitStack() as stack:
+            # A worker process outlives many jobs; each has its own names.
+            stack.enter_context(interning.scope())
+            if time_report:
+                stack.enter_context(instrument.tracing())
+            if profile:
+                stack.enter_context(instrument.profiled(os.path.splitext(source_file)[0] + '.prof'))
+            if cache_dir is None:
+                compile_file(source_file, assembly_path(source_file), optimize, report,
+                             include_paths)
+                return None, None, report
+            compile_cache = cache.CompileCache(cache_dir, cache_size)
+            status = compile_cached(source_file, assembly_path(source_file), optimize,
+                                    compile_cache, report, include_paths)
+            return None, status, report
+    except Exception as error:
+        return error_message(source_file, error), None, report
+
+def collect_sources(paths):
+    '''The files named in paths, with directories replaced by every C source
+    file below them.'''
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                sources.extend(os.path.join(root, name) for name in sorted(files)
+                               if name.endswith(SOURCE_EXTENSION))
+        else:
+            sources.append(path)
+    return sources
+
+def compile_all(sources, optimize=0, jobs=1, cache_dir=None,
+                cache_size=cache.DEFAULT_MAX_BYTES, stats=None, report=None,
+                profile=False, include_paths=()):
+    '''Compile every source, in jobs worker processes if jobs > 1, and
+    return the list of error messages. Cache hits and misses are counted
+    into stats if given, and phase timings merged into report if given.'''
+    work = [(source, optimize, cache_dir, cache_size, report is not None, profile,
+             tuple(include_paths)) for source in sources]
+    if jobs == 1 or len(work) <= 1:
+        results = list(map(compile_job, work))
+    else:
+        # Hand files out in batches so that per-task overhead stays small
+        # next to the compile itself, while keeping enough batches to
+        # balance load.
+        from concurrent.futures import ProcessPoolExecutor
+        chunksize = max(1, len(work) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(compile_job, work, chunksize=chunksize))
+    if cache_dir is not None:
+        # Evict once per run rather than after every store.
+        cache.CompileCache(cache_dir, cache_size).evict()
+    if stats is not None:
+        for _, status, _ in results:
+            stats.record(status)
+    if report is not None:
+        for _, _, file_report in results:
+            report.merge(file_report)
+    return [error for error, _, _ in results if error]
+
+def main(argv=None):
+    argument_parser = argparse.ArgumentParser(
+        prog='pycc', description='Compile C to x86-64 assembly. Each .s file '
+                                 'is written next to its source.')
+    argument_parser.add_argument(
+        'sources', nargs='*', metavar='source',
+        help='C source files, or directories to search for them')
+    argument_parser.add_argument(
+        '-O', dest='optimize', type=int, choices=(0, 1, 2), default=0,
+        help='optimization level: 0 for none; 1 to fold constants, '
+             'remove unreachable code and dead stores, and run the peephole '
+             'optimizer over the instructions; 2 to also lower to IR and '
+             'allocate registers')
+    argument_parser.add_argument(
+        '-I', dest='include_paths', action='append', default=[], metavar='DIR',
+        help='search DIR for #include files; may be given more than once')
+    argument_parser.add_argument(
+        '-j', dest='jobs', type=int, default=1,
+        help='number of files to compile in parallel, 0 for one per CPU')
+    argument_parser.add_argument(
+        '--cache-dir', default=os.environ.get('PYCC_CACHE_DIR'),
+        help='reuse assembly for unchanged sources from this directory '
+             '(default: $PYCC_CACHE_DIR, no caching if unset)')
+    argument_parser.add_argument(
+        '--cache-size', type=int, default=cache.DEFAULT_MAX_BYTES,
+        help='evict least recently used cache entries beyond this many bytes')
+    argument_parser.add_argument(
+        '--cache-stats', action='store_true',
+        help='report cache hits and misses')
+    argument_parser.add_argument(
+        '--time-report', action='store_true',
+        help='report time, memory and counts per compiler phase')
+    argument_parser.add_argument(
+        '--report-format', choices=('text', 'json'), default='text',
+        help='print the time report as a table on stderr, or as JSON on stdout')
+    argument_parser.add_argument(
+        '--profile', action='store_true',
+        help='run each compile under cProfile, writing a .prof file next to '
+             'each source')
+    argument_parser.add_argument(
+        '--server', metavar='SOCKET',
+        help='run as a compile server on this Unix socket, with -j workers')
+    argument_parser.add_argument(
+        '--connect', metavar='SOCKET',
+        help='send the sources to the compile server on this Unix socket')
+    argument_parser.add_argument(
+        '--shutdown', metavar='SOCKET',
+        help='stop the compile server on this Unix socket')
+    args = argument_parser.parse_args(argv)
+    jobs = args.jobs or os.cpu_count() or 1
+
+    if args.server or args.shutdown:
+        import server
+        if args.server:
+            server.serve(args.server, jobs)
+        else:
+            server.shutdown(args.shutdown)
+        return 0
+    if not args.sources:
+        argument_parser.error('no source files given')
+
+    sources = collect_sources(args.sources)
+    stats = cache.CacheStats()
+    report = None
+    if args.time_report:
+        import instrument
+        report = instrument.Report()
+    if args.connect:
+        import server
+        errors = server.compile_remote(args.connect, sources, args.optimize, jobs,
+                                       args.include_paths)
+    else:
+        errors = compile_all(sources, args.optimize, jobs, args.cache_dir, args.cache_size,
+                             stats, report, args.profile, args.include_paths)
+    for error in errors:
+        print(error, file=sys.stderr)
+    if args.cache_stats:
+        if args.cache_dir is None:
+            print('cache: disabled', file=sys.stderr)
+        else:
+            size = cache.CompileCache(args.cache_dir, args.cache_size).size()
+            print('cache: {0}, {1} bytes in {2}'.format(stats, size, args.cache_dir),
+                  file=sys.stderr)
+    if report is not None:
+        if args.report_format == 'json':
+            print(report.to_json())
+        else:
+            print(report, file=sys.stderr)
+    if len(sources) > 1 or errors:
+        print('{0} compiled, {1} failed'.format(len(sources) - len(errors), len(errors)),
+              file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
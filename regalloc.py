@@ -0,0 +1,222 @@
+from bisect import bisect_right
+
+# Registers available to hold temporaries. %eax, %ecx and %edx are kept as
+# scratch for instruction selection. The other argument registers are
+# allocated too; codegen reads incoming arguments, and sets up outgoing
+# ones, as parallel moves.
+callee_saved_registers = ('%ebx', '%r12d', '%r13d', '%r14d', '%r15d')
+caller_saved_registers = ('%r10d', '%r11d', '%esi', '%edi', '%r8d', '%r9d')
+
+# The registers the first arguments of a call arrive in.
+argument_registers = ('%edi', '%esi', '%edx', '%ecx', '%r8d', '%r9d')
+
+registers_64 = {
+    '%ebx': '%rbx',
+    '%r12d': '%r12',
+    '%r13d': '%r13',
+    '%r14d': '%r14',
+    '%r15d': '%r15',
+    '%r10d': '%r10',
+    '%r11d': '%r11',
+    '%esi': '%rsi',
+    '%edi': '%rdi',
+    '%r8d': '%r8',
+    '%r9d': '%r9',
+}
+
+class Interval():
+    ''' The range of instruction indexes over which a temporary is live'''
+    __slots__ = ('temp', 'start', 'end', 'crosses_call', 'register', 'slot', 'hint')
+
+    def __init__(self, temp, start):
+        self.temp = temp
+        self.start = start
+        self.end = start
+        self.crosses_call = False
+        self.register = None
+        self.slot = None
+        # A register, or a temporary whose register, this one would best
+        # share, so that a move between them is left out.
+        self.hint = None
+
+    def __str__(self):
+        return "(Interval t{0} {1}-{2} {3})".format(
+            self.temp, self.start, self.end, self.register or 'slot {0}'.format(self.slot))
+
+class Allocation():
+    ''' Where each temporary of a function lives'''
+    def __init__(self, intervals, spill_count, used_callee_saved):
+        self.intervals = intervals
+        self.spill_count = spill_count
+        self.used_callee_saved = used_callee_saved
+
+    def __str__(self):
+        return '\n'.join(str(self.intervals[temp]) for temp in sorted(self.intervals))
+
+def liveness(function):
+    '''The sets of temporaries live into and out of each block, found by
+    iterating the backward dataflow equations to a fixed point.'''
+    blocks = function.blocks
+    uses = []
+    defs = []
+    for block in blocks:
+        used = set()
+        defined = set()
+        for instruction in block.instructions:
+            for temp in instruction.uses():
+                if temp not in defined:
+                    used.add(temp)
+            if instruction.dest is not None:
+                defined.add(instruction.dest)
+        uses.append(used)
+        defs.append(defined)
+    live_in = [set() for block in blocks]
+    live_out = [set() for block in blocks]
+    changed = True
+    while changed:
+        changed = False
+        for number in range(len(blocks) - 1, -1, -1):
+            out = set()
+            for successor in blocks[number].successors:
+                out |= live_in[successor]
+            new_in = uses[number] | (out - defs[number])
+            if out != live_out[number] or new_in != live_in[number]:
+                live_out[number] = out
+                live_in[number] = new_in
+                changed = True
+    return live_in, live_out
+
+def live_intervals(function, exclude=()):
+    '''Compute one interval per temporary over the instructions numbered
+    block by block, leaving out the temporaries in exclude.
+
+    An interval runs from the first to the last point the temporary is
+    mentioned or live, including the whole extent of any block it is live
+    into or out of, so it stays correct whatever shape the CFG has.
+    '''
+    intervals = {}
+    calls = []
+    live_in, live_out = liveness(function)
+
+    def extend(temp, index):
+        if temp in exclude:
+            return
+        interval = intervals.get(temp)
+        if interval is None:
+            intervals[temp] = Interval(temp, index)
+        elif index < interval.start:
+            interval.start = index
+        elif index > interval.end:
+            interval.end = index
+
+    def hint(instruction):
+        interval = intervals[instruction.dest] if instruction.dest not in exclude else None
+        if interval is None or interval.hint is not None:
+            return
+        op = instruction.op
+        if op == 'arg':
+            if instruction.args[0] < len(argument_registers):
+                interval.hint = argument_registers[instruction.args[0]]
+        elif op == 'copy':
+            # Either side may be allocated second.
+            interval.hint = instruction.args[0]
+            source = intervals.get(instruction.args[0])
+            if source is not None and source.hint is None:
+                source.hint = instruction.dest
+        elif op not in ('const', 'call') and instruction.args[0] not in exclude:
+            # Computed in place over its first operand.
+            interval.hint = instruction.args[0]
+
+    arguments = []
+    index = 0
+    for number, block in enumerate(function.blocks):
+        block_start = index
+        for temp in live_in[number]:
+            extend(temp, block_start)
+        for instruction in block.instructions:
+            if instruction.op == 'call':
+                calls.append(index)
+            elif instruction.op == 'arg':
+                arguments.append((instruction.dest, index))
+            for temp in instruction.uses():
+                extend(temp, index)
+            if instruction.dest is not None:
+                extend(instruction.dest, index)
+                hint(instruction)
+            index += 1
+        for temp in live_out[number]:
+            extend(temp, index - 1)
+    # The arguments are all read in at once, so none may share a register.
+    for temp, index in arguments:
+        extend(temp, arguments[-1][1])
+    for interval in intervals.values():
+        # A call at the start defines the temporary and one at the end reads
+        # it before the call, so only calls strictly inside clobber it.
+        first_after_start = bisect_right(calls, interval.start)
+        interval.crosses_call = (first_after_start < len(calls)
+                                 and calls[first_after_start] < interval.end)
+    return intervals
+
+def linear_scan(function,
+                callee_saved=callee_saved_registers,
+                caller_saved=caller_saved_registers,
+                exclude=()):
+    '''Assign registers to temporaries by linear scan (Poletto and Sarkar).
+
+    Intervals are visited by start point. A free register an interval is
+    hinted to is taken first. When no register is free, the active
+    interval ending last gives up its register if it outlives the new one,
+    otherwise the new one is spilled to a stack slot. Intervals live
+    across a call only get callee-saved registers. The temporaries in
+    exclude get no location at all.
+    '''
+    intervals = live_intervals(function, exclude)
+    # Registers are tried in a fixed order, caller-saved first, so that as
+    # few callee-saved registers as possible need saving.
+    preference = tuple(caller_saved) + tuple(callee_saved)
+    free = set(preference)
+    active = []
+    spill_count = 0
+    used_callee_saved = []
+
+    def spill(interval):
+        nonlocal spill_count
+        spill_count += 1
+        interval.slot = spill_count
+
+    for interval in sorted(intervals.values(), key=lambda interval: interval.start):
+        # Registers of intervals that ended are free again; one ending where
+        # this one starts is read before this one is written.
+        still_active = []
+        for other in active:
+            if other.end <= interval.start:
+                free.add(other.register)
+            else:
+                still_active.append(other)
+        active = still_active
+
+        allowed = callee_saved if interval.crosses_call else preference
+        register = interval.hint
+        if register is not None and not isinstance(register, str):
+            hinted = intervals.get(register)
+            register = None if hinted is None else hinted.register
+        if register not in allowed or register not in free:
+            register = next((r for r in allowed if r in free), None)
+        if register is not None:
+            free.remove(register)
+        else:
+            candidates = [other for other in active if other.register in allowed]
+            victim = max(candidates, key=lambda other: other.end, default=None)
+            if victim is None or victim.end <= interval.end:
+                spill(interval)
+                continue
+            register = victim.register
+            victim.register = None
+            spill(victim)
+            active.remove(victim)
+        interval.register = register
+        if register in callee_saved and register not in used_callee_saved:
+            used_callee_saved.append(register)
+        active.append(interval)
+
+    return Allocation(intervals, spill_count, used_callee_saved)
@@ -0,0 +1,173 @@
+from visitor import Visitor
+
+# Every local occupies one 8 byte slot below %rbp.
+SLOT_SIZE = 8
+
+# Arguments passed in registers by the System V AMD64 calling convention.
+# They are stored to slots of their own; later arguments stay where the
+# caller pushed them, above the return address and saved %rbp.
+REGISTER_ARGUMENTS = 6
+
+class Symbol():
+    ''' A declared variable: its name, its number among the function's
+    declarations, and its %rbp relative offset'''
+    __slots__ = ('name', 'index', 'offset')
+
+    def __init__(self, name, index, offset):
+        self.name = name
+        self.index = index
+        self.offset = offset
+
+    def __str__(self):
+        return "(Symbol {0} {1} {2})".format(self.name, self.index, self.offset)
+
+    def __repr__(self):
+        return str(self)
+
+class Scopes():
+    ''' Nested block scopes held in one dict
+
+    Each symbol id maps to the stack of symbols declaring it, innermost
+    last, and each open scope keeps the set of ids it declared. A lookup is
+    one dict access however deeply scopes nest; closing a scope pops what it
+    declared.
+    '''
+    def __init__(self):
+        self.bindings = {}
+        self.declared = []
+
+    def open(self):
+        self.declared.append(set())
+
+    def close(self):
+        bindings = self.bindings
+        for symbol_id in self.declared.pop():
+            stack = bindings[symbol_id]
+            stack.pop()
+            if not stack:
+                del bindings[symbol_id]
+
+    def declare(self, symbol_id, symbol):
+        '''Bind symbol_id in the innermost scope. Returns False if that
+        scope already declares it.'''
+        declared = self.declared[-1]
+        if symbol_id in declared:
+            return False
+        declared.add(symbol_id)
+        self.bindings.setdefault(symbol_id, []).append(symbol)
+        return True
+
+    def lookup(self, symbol_id):
+        stack = self.bindings.get(symbol_id)
+        return stack[-1] if stack else None
+
+class FunctionAnalyser(Visitor):
+    ''' Resolves the variables of one function to their stack slots
+
+    Every Variable node gets the Symbol it refers to. Slots are handed out
+    as declarations are met and given back when their block closes, so
+    sibling blocks share slots and the frame is as deep as the deepest
+    nesting, not the sum of all declarations. Return and expression
+    statements, operators and calls are walked by generic_visit.
+    '''
+    def __init__(self, function, errors):
+        self.function = function
+        self.errors = errors
+        self.scopes = Scopes()
+        self.symbol_count = 0
+        self.next_slot = 0
+        self.max_slot = 0
+
+    def error(self, message):
+        self.errors.append('{0}: {1}'.format(self.function.name.value, message))
+
+    def declare(self, variable, offset=None):
+        if offset is None:
+            self.next_slot += 1
+            self.max_slot = max(self.max_slot, self.next_slot)
+            offset = -self.next_slot * SLOT_SIZE
+        symbol = Symbol(variable.value, self.symbol_count, offset)
+        self.symbol_count += 1
+        if not self.scopes.declare(variable.id, symbol):
+            self.error("Duplicate declaration of {0}".format(variable.value))
+        variable.symbol = symbol
+
+    def resolve(self, variable):
+        symbol = self.scopes.lookup(variable.id)
+        if symbol is None:
+            self.error("Undeclared variable {0}".format(variable.value))
+        variable.symbol = symbol
+
+    def analyse(self):
+        function = self.function
+        self.scopes.open()
+        for index, argument in enumerate(function.arguments):
+            if index < REGISTER_ARGUMENTS:
+                self.declare(argument.name)
+            else:
+                self.declare(argument.name, 16 + (index - REGISTER_ARGUMENTS) * SLOT_SIZE)
+        self.analyse_statements(function.statements)
+        self.scopes.close()
+        function.symbol_count = self.symbol_count
+        frame = self.max_slot * SLOT_SIZE
+        function.frame_size = frame + -frame % 16
+
+    def analyse_statements(self, statements):
+        for stmt in statements:
+            self.visit(stmt)
+
+    def analyse_expression(self, expr):
+        self.visit(expr)
+
+    def block(self, statements):
+        self.scopes.open()
+        saved_slot = self.next_slot
+        for stmt in statements:
+            yield stmt
+        self.next_slot = saved_slot
+        self.scopes.close()
+
+    def visit_Declaration(self, stmt):
+        # As in C, the name is in scope in its own initializer.
+        self.declare(stmt.name)
+        if stmt.initializer is not None:
+            yield stmt.initializer
+
+    def visit_AssignmentStatement(self, stmt):
+        self.resolve(stmt.lhs)
+        yield stmt.rhs
+
+    def visit_IfStatement(self, stmt):
+        yield stmt.condition
+        yield from self.block(stmt.body)
+        yield from self.block(stmt.else_body)
+
+    def visit_Variable(self, expr):
+        self.resolve(expr)
+
+    def visit_Constant(self, expr):
+        pass
+
+def analyse_function(function):
+    '''Resolve the variables of a parser.Function and compute its frame
+    size, raising an Exception listing every undeclared or duplicate
+    name.'''
+    errors = []
+    FunctionAnalyser(function, errors).analyse()
+    if errors:
+        raise Exception('; '.join(errors))
+    return function
+
+def analyse(program):
+    '''Analyse every function of a parser.Program, in place.'''
+    errors = []
+    names = set()
+    for function in program.functions:
+        name = function.name.value
+        if name in names:
+            errors.append('Duplicate definition of function {0}'.format(name))
+        names.add(name)
+        FunctionAnalyser(function, errors).analyse()
+    if errors:
+        raise Exception('; '.join(errors))
+    return program
@@ -0,0 +1,192 @@
+import os
+import io
+import json
+import stat
+import socket
+import threading
+import socketserver
+
+import pycc
+
+# Requests and responses are single lines of JSON.
+#
+#   {"source": "/abs/path.c", "optimize": 0, "include": ["/abs/dir"]}
+#       -> {"ok": true, "assembly": "..."}
+#       -> {"ok": false, "error": "..."}
+#   {"command": "shutdown"}
+#       -> {"ok": true}
+
+def compile_request(source_file, optimize, include_paths=()):
+    '''Compile one file to a response dict. Runs in a server worker process,
+    whose imports and compiled token patterns stay warm between requests.'''
+    try:
+        import lexer
+        import interning
+        outfile = io.StringIO()
+        # The names of one request are dropped with it, so a long running
+        # server does not hold every name it has ever seen.
+        with interning.scope(), open(source_file, 'rb') as infile, \
+                lexer.mapped(infile) as source:
+            pycc.compile_stream(source, outfile, optimize, source_file=source_file,
+                                include_paths=include_paths)
+        return {'ok': True, 'assembly': outfile.getvalue()}
+    except Exception as error:
+        return {'ok': False, 'error': pycc.error_message(source_file, error)}
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    ''' Serves the requests sent on one client connection, in order'''
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError as error:
+                self.reply({'ok': False, 'error': 'bad request: {0}'.format(error)})
+                continue
+            if not isinstance(request, dict):
+                self.reply({'ok': False, 'error': 'bad request: not a JSON object'})
+                continue
+            if request.get('command') == 'shutdown':
+                self.reply({'ok': True})
+                # shutdown() waits for serve_forever() to return, which it
+                # cannot do while this handler holds it up.
+                threading.Thread(target=self.server.shutdown).start()
+                return
+            source = request.get('source')
+            optimize = request.get('optimize', 0)
+            include_paths = request.get('include', ())
+            if (not isinstance(source, str) or not isinstance(optimize, int)
+                    or not isinstance(include_paths, (list, tuple))
+                    or not all(isinstance(path, str) for path in include_paths)):
+                self.reply({'ok': False, 'error': 'bad request: expected a source path, '
+                            'an int optimize level and a list of include paths'})
+                continue
+            self.reply(self.server.compile(source, optimize, include_paths))
+
+    def reply(self, response):
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+        self.wfile.flush()
+
+def remove_stale_socket(socket_path):
+    '''Remove a socket left at socket_path by a server that did not exit
+    cleanly. Raises an Exception if a server still answers there, or if the
+    path is something other than a socket.'''
+    try:
+        mode = os.lstat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise Exception("{0} exists and is not a socket".format(socket_path))
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.remove(socket_path)
+        return
+    finally:
+        probe.close()
+    raise Exception("A compile server is already running on {0}".format(socket_path))
+
+class CompileServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    ''' A compile server listening on a Unix domain socket
+
+    Each connection gets a thread, and compiles are handed to a pool of
+    worker processes so that requests run in parallel. With no workers,
+    requests are compiled in the connection threads.
+    '''
+    daemon_threads = True
+
+    def __init__(self, socket_path, workers=1):
+        remove_stale_socket(socket_path)
+        super().__init__(socket_path, RequestHandler)
+        self.socket_path = socket_path
+        # The socket is only removed on close while it is still the one
+        # bound here, not one a later server put at the same path.
+        self.socket_inode = os.stat(socket_path).st_ino
+        self.executor = None
+        if workers:
+            from concurrent.futures import ProcessPoolExecutor
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def compile(self, source_file, optimize, include_paths=()):
+        if self.executor is None:
+            return compile_request(source_file, optimize, include_paths)
+        return self.executor.submit(compile_request, source_file, optimize,
+                                    include_paths).result()
+
+    def server_close(self):
+        super().server_close()
+        if self.executor is not None:
+            self.executor.shutdown()
+        try:
+            if os.stat(self.socket_path).st_ino == self.socket_inode:
+                os.remove(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+def serve(socket_path, workers=1):
+    '''Run a compile server until a client asks it to shut down.'''
+    with CompileServer(socket_path, workers) as server:
+        server.serve_forever()
+
+class Client():
+    ''' One connection to a compile server'''
+    def __init__(self, socket_path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(socket_path)
+        self.file = self.socket.makefile('rwb')
+
+    def request(self, message):
+        self.file.write(json.dumps(message).encode() + b'\n')
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            raise Exception("Compile server closed the connection")
+        return json.loads(line)
+
+    def compile(self, source_file, optimize=0, include_paths=()):
+        return self.request({'source': os.path.abspath(source_file), 'optimize': optimize,
+                             'include': [os.path.abspath(path) for path in include_paths]})
+
+    def shutdown(self):
+        return self.request({'command': 'shutdown'})
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+def compile_remote(socket_path, sources, optimize=0, jobs=1, include_paths=()):
+    '''Have the server at socket_path compile sources, writing each .s file
+    next to its source. Up to jobs requests are in flight at once, one per
+    connection. Returns the list of error messages.'''
+    local = threading.local()
+    clients = []
+
+    def compile_one(source_file):
+        if not hasattr(local, 'client'):
+            local.client = Client(socket_path)
+            clients.append(local.client)
+        response = local.client.compile(source_file, optimize, include_paths)
+        if not response['ok']:
+            return response['error']
+        with open(pycc.assembly_path(source_file), 'w') as outfile:
+            outfile.write(response['assembly'])
+        return None
+
+    try:
+        if jobs == 1:
+            results = list(map(compile_one, sources))
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(compile_one, sources))
+    finally:
+        for client in clients:
+            client.close()
+    return [error for error in results if error]
+
+def shutdown(socket_path):
+    client = Client(socket_path)
+    try:
+        client.shutdown()
+    finally:
+        client.close()
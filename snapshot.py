@@ -0,0 +1,628 @@
+'''A binary file format for token lists and ASTs, loaded lazily.
+
+A snapshot holds either the tokens lexer.lex made, or a parser.Program.
+The layout, all integers little endian:
+
+    header   magic, format version, contents (TOKENS or PROGRAM), the
+             number of strings and of tokens or units, and where the
+             string lengths, string text, body and unit index start
+    strings  the length of every distinct text, then all the texts
+             one after another in UTF-8
+    body     for TOKENS, every token in turn. For PROGRAM, one record per
+             unit, with an index of offsets: unit 0 is the root node, and
+             each node it refers to, such as a function, is a unit of its
+             own holding the whole tree below it
+
+Everything but the header and the index is a sequence of varints. A
+token is its kind, its text as a string number, and its position,
+relative to the token before it in the same unit: on the same line and
+column only the gap from the end of the last token and its length are
+stored. A unit is the type code of its first node, the number of nodes,
+the type codes of the others and then each node's fields in breadth
+first order, laid out as in arena.fields. A reference to a node is 0 for
+the next node not yet referred to, or one more than the number of a node
+already referred to; tokens are referred to the same way, and stored
+where they are first referred to. Symbol ids are only valid in the
+process that made them, so names are stored as string numbers and
+interned again when read.
+
+A Snapshot maps the file and decodes nothing up front. Tokens are all
+decoded when one is first indexed. A unit is decoded when one of its
+root's attributes is first read, after which its nodes are ordinary
+nodes of their classes. Snapshot.program(eager=True) decodes every unit
+at once, for passes that walk the whole tree.
+'''
+import os
+import re
+import sys
+import mmap
+import struct
+from array import array
+
+import arena
+import lexer
+from interning import symbols
+
+MAGIC = b'PYCCSNAP'
+
+# Bump when the layout changes; older files are then rejected.
+FORMAT_VERSION = 2
+
+TOKENS = 1
+PROGRAM = 2
+
+header_format = struct.Struct('<8sHHIIIIII')
+offset_format = struct.Struct('<I')
+
+# Tags of a 'value' field.
+INT_VALUE = 0
+FLOAT_VALUE = 1
+STR_VALUE = 2
+
+# The first varint of a token's position: its four fields stored as they
+# are, each plus one so that 0 can stand for None; on the line and column
+# the last token leaves off at; otherwise the line, relative to the last.
+EXPLICIT_POSITION = 0
+SAME_LINE = 1
+NEW_LINE = 2
+
+# The position a unit's first token is taken relative to.
+START_POSITION = (1, 1, 0, 0)
+
+def write_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+def read_varint(data, pos):
+    '''The varint at data[pos] and the position after it.'''
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+# A varint longer than a byte.
+long_varint_pattern = re.compile(rb'([\x80-\xff]+[\x00-\x7f])')
+
+def read_varints(raw):
+    '''Every varint in raw. Runs of single byte varints, below 128, are
+    copied as they are.'''
+    if raw.isascii():
+        return list(raw)
+    pieces = long_varint_pattern.split(raw)
+    values = list(pieces[0])
+    for index in range(1, len(pieces), 2):
+        values.append(read_varint(pieces[index], 0)[0])
+        values += pieces[index + 1]
+    return values
+
+def zigzag(value):
+    # Interleaves negative and positive ints so small magnitudes stay short.
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def unzigzag(value):
+    return value >> 1 if not value & 1 else -(value >> 1) - 1
+
+def node_type_of(node):
+    '''The parser class node is, or stands for as a view or lazy node.'''
+    for base in type(node).__mro__:
+        if base in arena.node_codes:
+            return base
+    raise Exception("Cannot snapshot {0}".format(node))
+
+class Writer():
+    ''' Collects the strings, tokens and units of a snapshot'''
+    def __init__(self):
+        self.string_numbers = {}
+        self.strings = []
+        self.body = bytearray()
+        self.count = 0
+        self.units = []
+        # The position of the token written last, in its unit.
+        self.last = START_POSITION
+
+    def string(self, text):
+        number = self.string_numbers.get(text)
+        if number is None:
+            number = self.string_numbers[text] = len(self.strings)
+            self.strings.append(text)
+        return number
+
+    def token(self, record, token):
+        '''Append token to record, placed relative to the token before it.'''
+        write_varint(record, token.kind)
+        write_varint(record, self.string(str(token.value)))
+        position = (token.line, token.column, token.offset, token.end)
+        if None in position:
+            write_varint(record, EXPLICIT_POSITION)
+            for value in position:
+                write_varint(record, 0 if value is None else value + 1)
+            return
+        line, column, offset, end = position
+        last_line, last_column, last_offset, last_end = self.last
+        if line == last_line and column == last_column + offset - last_offset:
+            write_varint(record, SAME_LINE)
+        else:
+            write_varint(record, NEW_LINE + zigzag(line - last_line))
+            write_varint(record, column)
+        write_varint(record, zigzag(offset - last_end))
+        write_varint(record, end - offset)
+        self.last = position
+
+    def tokens(self, tokens):
+        '''Add a token list.'''
+        for token in tokens:
+            self.token(self.body, token)
+            self.count += 1
+
+    def value(self, record, value):
+        if isinstance(value, int):
+            write_varint(record, INT_VALUE)
+            write_varint(record, zigzag(value))
+        elif isinstance(value, float):
+            write_varint(record, FLOAT_VALUE)
+            write_varint(record, self.string(repr(value)))
+        else:
+            write_varint(record, STR_VALUE)
+            write_varint(record, self.string(value))
+
+    def fields(self, record, node, node_type, reference, token):
+        '''Append the fields of node to record, referring to nodes and
+        tokens by what reference and token write.'''
+        for name, column, how in arena.fields[node_type]:
+            if how == 'name':
+                continue
+            value = getattr(node, name)
+            if how == 'node':
+                write_varint(record, reference(value))
+            elif how == 'optional':
+                write_varint(record, 0 if value is None else reference(value) + 1)
+            elif how == 'list':
+                write_varint(record, len(value))
+                for child in value:
+                    write_varint(record, reference(child))
+            elif how == 'token':
+                token(record, value)
+            elif how == 'value':
+                self.value(record, value)
+            elif how == 'constant':
+                if isinstance(value, str):
+                    write_varint(record, 0)
+                    write_varint(record, self.string(value))
+                else:
+                    write_varint(record, reference(value) + 1)
+            elif how == 'id':
+                write_varint(record, self.string(symbols.name(value)))
+
+    def unit(self, root):
+        '''The record of root and every node below it.'''
+        self.last = START_POSITION
+        numbers = {id(root): 0}
+        order = [root]
+        types = [node_type_of(root)]
+        token_numbers = {}
+        # The tokens numbered, kept alive so that their ids stay unique.
+        token_objects = []
+
+        def reference(node):
+            found = numbers.get(id(node))
+            if found is not None:
+                return found + 1
+            numbers[id(node)] = len(order)
+            order.append(node)
+            types.append(node_type_of(node))
+            return 0
+
+        def token(record, value):
+            # Nodes share token objects, so each is stored once a unit.
+            found = token_numbers.get(id(value))
+            if found is not None:
+                write_varint(record, found + 1)
+                return
+            token_numbers[id(value)] = len(token_objects)
+            token_objects.append(value)
+            write_varint(record, 0)
+            self.token(record, value)
+
+        body = bytearray()
+        index = 0
+        while index < len(order):
+            self.fields(body, order[index], types[index], reference, token)
+            index += 1
+        record = bytearray()
+        write_varint(record, arena.node_codes[types[0]])
+        write_varint(record, len(order))
+        for node_type in types[1:]:
+            write_varint(record, arena.node_codes[node_type])
+        record += body
+        return record
+
+    def program(self, root):
+        '''Add root as unit 0, and each node it refers to as a unit.'''
+        numbers = {}
+        order = []
+
+        def reference(node):
+            found = numbers.get(id(node))
+            if found is None:
+                found = numbers[id(node)] = len(order) + 1
+                order.append(node)
+            return found
+
+        def token(record, value):
+            write_varint(record, 0)
+            self.token(record, value)
+
+        node_type = node_type_of(root)
+        record = bytearray()
+        write_varint(record, arena.node_codes[node_type])
+        self.fields(record, root, node_type, reference, token)
+        self.units.append(record)
+        for node in order:
+            self.units.append(self.unit(node))
+        self.count = len(self.units)
+
+    def write(self, outfile, contents):
+        '''Write the snapshot to a binary file.'''
+        lengths = bytearray()
+        for text in self.strings:
+            write_varint(lengths, len(text))
+        text = ''.join(self.strings).encode('utf-8')
+        string_start = header_format.size
+        text_start = string_start + len(lengths)
+        body_start = text_start + len(text)
+        offsets = []
+        position = body_start + len(self.body)
+        for record in self.units:
+            offsets.append(position)
+            position += len(record)
+        offsets.append(position)
+        # The index has an offset per unit and one past the last.
+        index_start = position if self.units else 0
+        outfile.write(header_format.pack(
+            MAGIC, FORMAT_VERSION, contents, len(self.strings), self.count,
+            string_start, text_start, body_start, index_start))
+        outfile.write(lengths)
+        outfile.write(text)
+        outfile.write(self.body)
+        for record in self.units:
+            outfile.write(record)
+        if self.units:
+            outfile.write(b''.join(offset_format.pack(offset) for offset in offsets))
+
+def save_tokens(tokens, path):
+    '''Write a snapshot of a token list to path.'''
+    writer = Writer()
+    writer.tokens(tokens)
+    with open(path, 'wb') as outfile:
+        writer.write(outfile, TOKENS)
+
+def save_program(program, path):
+    '''Write a snapshot of a parser.Program, or an arena view of one, to
+    path.'''
+    writer = Writer()
+    writer.program(program)
+    with open(path, 'wb') as outfile:
+        writer.write(outfile, PROGRAM)
+
+class LazyNode():
+    ''' Base of the lazy node classes: decodes the node's unit from its
+    snapshot when an attribute is first read
+
+    Once decoded, the attributes are set on the node like any other, so
+    __getattr__ is not called for them again.
+    '''
+    def __getattr__(self, name):
+        state = self.__dict__
+        snapshot = state.pop('_snapshot', None)
+        if snapshot is None:
+            raise AttributeError(name)
+        snapshot.decode_unit(self, state.pop('_index'))
+        return getattr(self, name)
+
+def make_lazy_type(node_type):
+    # Named like node_type, so nodes print and dispatch the same.
+    return type(node_type.__name__, (LazyNode, node_type), {})
+
+lazy_types = tuple(make_lazy_type(node_type) for node_type in arena.node_types)
+
+class TokenList():
+    ''' The tokens of a snapshot, decoded when one is first indexed'''
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __len__(self):
+        return self.snapshot.count
+
+    def __getitem__(self, index):
+        return self.snapshot.all_tokens()[index]
+
+    def __iter__(self):
+        return iter(self.snapshot.all_tokens())
+
+class Snapshot():
+    ''' A snapshot file mapped into memory
+
+    Strings, tokens and units are decoded on first use and kept, so each
+    is decoded once and shared nodes stay shared. Tokens and nodes refer
+    to the snapshot, which keeps the mapping open until close().
+    '''
+    def __init__(self, path):
+        with open(path, 'rb') as infile:
+            if os.fstat(infile.fileno()).st_size < header_format.size:
+                raise Exception("{0} is not a pycc snapshot".format(path))
+            self.data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.contents, self.string_count, self.count,
+         self.string_start, self.text_start, self.body_start,
+         self.index_start) = header_format.unpack_from(self.data)
+        if magic != MAGIC:
+            self.data.close()
+            raise Exception("{0} is not a pycc snapshot".format(path))
+        if version != FORMAT_VERSION:
+            self.data.close()
+            raise Exception("{0} has snapshot format {1}, expected {2}".format(
+                path, version, FORMAT_VERSION))
+        self.strings = None
+        self.string_ids = None
+        self.tokens = None
+        self.unit_offsets = None
+        self.units = None
+        # Nodes decoded so far, to show how little a pass touches.
+        self.decoded = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.data.close()
+
+    def offsets(self, index_offset, count):
+        '''The index of the units: the offset of each of count records
+        and of the end of the last.'''
+        offsets = array('I')
+        offsets.frombytes(self.data[index_offset:index_offset + offset_format.size * (count + 1)])
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+        return offsets
+
+    def load_strings(self):
+        '''Decode every string, interning each.'''
+        lengths = read_varints(self.data[self.string_start:self.text_start])
+        text = self.data[self.text_start:self.body_start].decode('utf-8')
+        intern = symbols.intern
+        names = symbols.names
+        ids = []
+        start = 0
+        for length in lengths:
+            ids.append(intern(text[start:start + length]))
+            start += length
+        self.string_ids = ids
+        self.strings = [names[symbol] for symbol in ids]
+
+    def read_token(self, values, position, last):
+        '''The token whose record starts at values[position], the position
+        after it and the position of the token in the source.'''
+        strings = self.strings
+        kind = values[position]
+        text = strings[values[position + 1]]
+        form = values[position + 2]
+        if form == EXPLICIT_POSITION:
+            line, column, offset, end = [value - 1 if value else None
+                                         for value in values[position + 3:position + 7]]
+            token = lexer.make_token(lexer.all_token_types[kind], text,
+                                     offset, end, line, column)
+            return token, position + 7, last
+        last_line, last_column, last_offset, last_end = last
+        if form == SAME_LINE:
+            line = last_line
+            position += 3
+            offset = last_end + unzigzag(values[position])
+            column = last_column + offset - last_offset
+        else:
+            line = last_line + unzigzag(form - NEW_LINE)
+            column = values[position + 3]
+            position += 4
+            offset = last_end + unzigzag(values[position])
+        end = offset + values[position + 1]
+        token = lexer.make_token(lexer.all_token_types[kind], text,
+                                 offset, end, line, column)
+        return token, position + 2, (line, column, offset, end)
+
+    def all_tokens(self):
+        '''The token list, decoded at its first use.'''
+        if self.tokens is None:
+            if self.strings is None:
+                self.load_strings()
+            values = read_varints(self.data[self.body_start:self.index_start or len(self.data)])
+            tokens = []
+            position = 0
+            last = START_POSITION
+            for number in range(self.count):
+                token, position, last = self.read_token(values, position, last)
+                tokens.append(token)
+            self.tokens = tokens
+        return self.tokens
+
+    def token_list(self):
+        if self.contents != TOKENS:
+            raise Exception("Snapshot holds a program, not tokens")
+        return TokenList(self)
+
+    def unit(self, number):
+        '''The root node of a unit, made lazily.'''
+        node = self.units[number]
+        if node is None:
+            # Type codes are below 128, so the first byte is the whole varint.
+            lazy_type = lazy_types[self.data[self.unit_offsets[number]]]
+            node = self.units[number] = lazy_type.__new__(lazy_type)
+            state = node.__dict__
+            state['_snapshot'] = self
+            state['_index'] = number
+        return node
+
+    def program(self, eager=False):
+        '''The root of the program, with every unit decoded if eager is
+        set, as for a pass over the whole tree.'''
+        if self.contents != PROGRAM:
+            raise Exception("Snapshot holds tokens, not a program")
+        if self.units is None:
+            self.unit_offsets = self.offsets(self.index_start, self.count)
+            self.units = [None] * self.count
+        root = self.unit(0)
+        if eager:
+            for number in range(self.count):
+                node = self.unit(number)
+                state = node.__dict__
+                if state.pop('_snapshot', None) is not None:
+                    self.decode_unit(node, state.pop('_index'))
+        return root
+
+    def decode_unit(self, node, number):
+        '''Set the attributes of node, the root of a unit, and of every node
+        below it in the unit.'''
+        if self.strings is None:
+            self.load_strings()
+        offsets = self.unit_offsets
+        values = read_varints(self.data[offsets[number]:offsets[number + 1]])
+        if number == 0:
+            self.decode_root(node, values)
+            return
+        count = values[1]
+        codes = values[2:count + 1]
+        nodes = [node]
+        for code in codes:
+            node_type = arena.node_types[code]
+            nodes.append(node_type.__new__(node_type))
+        codes.insert(0, values[0])
+        position = count + 1
+        strings = self.strings
+        string_ids = self.string_ids
+        read_token = self.read_token
+        name_of = symbols.name
+        node_types = arena.node_types
+        fields = arena.fields
+        defaults = arena.defaults
+        tokens = []
+        last = START_POSITION
+        # The number the next node not yet referred to has.
+        fresh = 1
+        for index in range(count):
+            node_type = node_types[codes[index]]
+            state = nodes[index].__dict__
+            default = defaults.get(node_type)
+            if default:
+                state.update(default)
+            for name, column, how in fields[node_type]:
+                if how == 'name':
+                    state[name] = name_of(state['id'])
+                    continue
+                value = values[position]
+                position += 1
+                if how == 'node':
+                    if value:
+                        value = nodes[value - 1]
+                    else:
+                        value = nodes[fresh]
+                        fresh += 1
+                elif how == 'token':
+                    if value:
+                        value = tokens[value - 1]
+                    else:
+                        value, position, last = read_token(values, position, last)
+                        tokens.append(value)
+                elif how == 'constant':
+                    if not value:
+                        value = strings[values[position]]
+                        position += 1
+                    elif value > 1:
+                        value = nodes[value - 2]
+                    else:
+                        value = nodes[fresh]
+                        fresh += 1
+                elif how == 'id':
+                    value = string_ids[value]
+                elif how == 'value':
+                    raw = values[position]
+                    position += 1
+                    if value == INT_VALUE:
+                        value = unzigzag(raw)
+                    elif value == FLOAT_VALUE:
+                        value = float(strings[raw])
+                    else:
+                        value = strings[raw]
+                elif how == 'list':
+                    references = values[position:position + value]
+                    position += value
+                    value = []
+                    for reference in references:
+                        if reference:
+                            value.append(nodes[reference - 1])
+                        else:
+                            value.append(nodes[fresh])
+                            fresh += 1
+                elif how == 'optional':
+                    if not value:
+                        value = None
+                    elif value > 1:
+                        value = nodes[value - 2]
+                    else:
+                        value = nodes[fresh]
+                        fresh += 1
+                state[name] = value
+        self.decoded += count
+
+    def decode_root(self, node, values):
+        '''Set the attributes of the root, which refers to nodes by their
+        unit numbers.'''
+        node_type = arena.node_types[values[0]]
+        state = node.__dict__
+        state.update(arena.defaults.get(node_type, {}))
+        position = 1
+        last = START_POSITION
+        for name, column, how in arena.fields[node_type]:
+            if how == 'name':
+                state[name] = symbols.name(state['id'])
+                continue
+            value = values[position]
+            position += 1
+            if how == 'node':
+                value = self.unit(value)
+            elif how == 'optional':
+                value = self.unit(value - 1) if value else None
+            elif how == 'list':
+                value = [self.unit(unit) for unit in values[position:position + value]]
+                position += len(value)
+            elif how == 'token':
+                value, position, last = self.read_token(values, position, last)
+            elif how == 'value':
+                raw = values[position]
+                position += 1
+                if value == INT_VALUE:
+                    value = unzigzag(raw)
+                elif value == FLOAT_VALUE:
+                    value = float(self.strings[raw])
+                else:
+                    value = self.strings[raw]
+            elif how == 'constant':
+                if value:
+                    value = self.unit(value - 1)
+                else:
+                    value = self.strings[values[position]]
+                    position += 1
+            elif how == 'id':
+                value = self.string_ids[value]
+            state[name] = value
+        self.decoded += 1
+
+def load(path):
+    '''Map the snapshot at path.'''
+    return Snapshot(path)
@@ -0,0 +1,5 @@
+int main() {
+  int a = 7;
+  int b = 3;
+  return a * b - a / b + a % b + (a - b) * 2;
+}
@@ -0,0 +1,11 @@
+int add(int a, int b) {
+  return a + b;
+}
+
+int twice(int x) {
+  return add(x, x);
+}
+
+int main(void) {
+  return add(3, 4) * twice(5);
+}
@@ -0,0 +1,5 @@
+int main() {
+  int a = 3;
+  int b = 4;
+  return (a < b) + (a > b) * 2 + (a <= 3) * 4 + (b >= 5) * 8 + (a == 3) * 16 + (a != b) * 32;
+}
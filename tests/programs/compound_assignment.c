@@ -0,0 +1,14 @@
+int main() {
+  int a = 10;
+  a += 5;
+  a -= 2;
+  a *= 3;
+  a /= 2;
+  a %= 7;
+  a <<= 4;
+  a >>= 1;
+  a |= 3;
+  a &= 29;
+  a ^= 6;
+  return a;
+}
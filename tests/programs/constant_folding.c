@@ -0,0 +1,12 @@
+int seven() {
+  return 7;
+}
+
+int main() {
+  int x = seven();
+  int wrapped = 2147483647 + 1;
+  int a = 2 * 60 * 60 + x * 1 + 0 * x + (x + 0);
+  int b = -7 / 2 + -7 % 2 * 10 + 7 / -2 * 100;
+  int c = (0 && seven()) + (1 || seven()) + !(3 > 2) + (wrapped < 0) * 2;
+  return (a + b + c) % 256;
+}
@@ -0,0 +1,30 @@
+int count(int n) {
+  return n + 1;
+}
+
+int pick(int a) {
+  int b = a * 2;
+  int c = count(a);
+  b = 3;
+  if (0) {
+    a = 5;
+  } else {
+    c = c + b;
+  }
+  if (1) {
+    int d = 4;
+    a = a + d;
+  }
+  if (a > 5) {
+    return c + a;
+  } else {
+    return 1;
+  }
+  a = 7;
+  return a;
+}
+
+int main() {
+  int unused = count(1);
+  return pick(2) * 10 + pick(0);
+}
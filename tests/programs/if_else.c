@@ -0,0 +1,15 @@
+int classify(int n) {
+  if (n < 0) {
+    return 1;
+  } else if (n == 0) {
+    return 2;
+  } else {
+    if (n > 100)
+      return 3;
+  }
+  return 4;
+}
+
+int main() {
+  return classify(-5) + classify(0) * 10 + classify(500) * 100 + classify(7);
+}
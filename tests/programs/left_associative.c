@@ -0,0 +1,5 @@
+int main() {
+  int a = 100 - 10 - 1;
+  int b = 100 / 10 / 2;
+  return a - b - 4;
+}
@@ -0,0 +1,11 @@
+int check(int a, int b) {
+  return (a && b) + (a || b) * 2 + (!a && !b) * 4;
+}
+
+int zero() {
+  return 0;
+}
+
+int main() {
+  return check(0, 0) + check(1, 0) * 8 + check(3, 7) * 64 + (zero() || 5) + (zero() && 5);
+}
@@ -0,0 +1,7 @@
+int weigh(int a, int b, int c, int d, int e, int f, int g, int h) {
+  return a + 2 * b + 3 * c + 4 * d + 5 * e + 6 * f + 7 * g + 8 * h;
+}
+
+int main() {
+  return weigh(1, 2, 3, 4, 5, 6, 7, 8) - 2 * weigh(8, 7, 6, 5, 4, 3, 2, 1) + 1 + weigh(0, 0, 0, 0, 0, 0, 1, 2);
+}
@@ -0,0 +1,12 @@
+int mix(int a, int b, int c) {
+  return a * 100 + b * 10 + c;
+}
+
+int inc(int x) {
+  return x + 1;
+}
+
+int main() {
+  int x = 1;
+  return mix(inc(x), mix(0, 0, inc(inc(x))), 3) % 256 + inc(mix(1, 2, 3)) / 100;
+}
@@ -0,0 +1,9 @@
+int rotate(int n, int a, int b, int c) {
+  if (n < 1)
+    return a + 2 * b + 3 * c;
+  return rotate(n - 1, c, a, b) + rotate(n - 1, b, a, c) % 7;
+}
+
+int main() {
+  return rotate(5, 1, 2, 3) % 256;
+}
@@ -0,0 +1,18 @@
+int id(int x) {
+  return x;
+}
+
+int main() {
+  int a = id(1);
+  int b = id(2);
+  int c = id(3);
+  int d = id(4);
+  int e = id(5);
+  int f = id(6);
+  int g = id(7);
+  int h = id(8);
+  int i = id(9);
+  int j = id(10);
+  int k = a * b + c * d - e * f + g * h - i * j;
+  return (k + a + b + c + d + e + f + g + h + i + j + id(k)) % 256;
+}
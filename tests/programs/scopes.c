@@ -0,0 +1,9 @@
+int main() {
+  int a = 1;
+  int b = 0;
+  if (a) {
+    int a = 2;
+    b = a;
+  }
+  return a * 10 + b;
+}
@@ -0,0 +1,4 @@
+int main() {
+  int a = 5;
+  return -(-a) + !0 + !a + - -3;
+}
@@ -0,0 +1,82 @@
+import os
+import glob
+import unittest
+
+from lexer import lex
+from parser import parse, Variable, BinaryOperationExpression, Constant, Int
+from codegen import codegen
+from optimizer import optimize
+import semantic
+import arena
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'programs')
+
+class TestArena(unittest.TestCase):
+    def sources(self):
+        for path in sorted(glob.glob(os.path.join(PROGRAMS, '*.c'))):
+            with open(path) as f:
+                yield os.path.basename(path), f.read()
+
+    def test_views_print_like_objects(self):
+        for name, source in self.sources():
+            with self.subTest(program=name):
+                self.assertEqual(str(parse(lex(source))), str(arena.parse(lex(source))))
+
+    def test_passes_run_on_views(self):
+        for name, source in self.sources():
+            for level in (0, 1, 2):
+                with self.subTest(program=name, level=level):
+                    expected = codegen(optimize(parse(lex(source)), level), level=level)
+                    view = arena.parse(lex(source))
+                    self.assertEqual(expected, codegen(optimize(view, level), level=level))
+
+    def test_views_are_node_types(self):
+        program = arena.parse(lex('int main() { return a + 1; }'))
+        expression = program.functions[0].statements[0].expression
+        self.assertTrue(isinstance(expression, BinaryOperationExpression))
+        self.assertTrue(isinstance(expression.lhs, Variable))
+        self.assertEqual('a', expression.lhs.value)
+        self.assertEqual('+', expression.operator.value)
+
+    def test_assignment(self):
+        program = arena.from_program(parse(lex('int main() { return 1 + 2; }')))
+        statement = program.functions[0].statements[0]
+        size = len(program.arena)
+        statement.expression = Constant(Int(3))
+        self.assertEqual(size + 2, len(program.arena))
+        self.assertEqual('(ReturnStatement (Constant (Int 3)))',
+                         str(program.functions[0].statements[0]))
+
+    def test_list_assignment_reuses_range(self):
+        program = arena.parse(lex('int main() { int a = 1; a = 2; return a; }'))
+        function = program.functions[0]
+        size = len(program.arena.children)
+        statements = function.statements
+        function.statements = statements[1:]
+        function.statements = statements[::-1]
+        self.assertEqual(size, len(program.arena.children))
+        self.assertEqual([str(statement) for statement in statements[::-1]],
+                         [str(statement) for statement in function.statements])
+        # A longer list needs a new range.
+        function.statements = statements + statements[:1]
+        self.assertEqual(size + 4, len(program.arena.children))
+        self.assertEqual(4, len(function.statements))
+
+    def test_side_table(self):
+        program = semantic.analyse(arena.parse(lex('int f(int a) { return a; }')))
+        function = program.functions[0]
+        self.assertEqual(16, function.frame_size)
+        use = function.statements[0].expression
+        self.assertEqual(-8, use.symbol.offset)
+        self.assertIsNone(arena.parse(lex('int f(int a) { return a; }')).functions[0].frame_size)
+
+    def test_count_kinds(self):
+        program = arena.parse(lex('int f(int a) { return a * 2 + a; }'))
+        counts = program.arena.count_kinds()
+        self.assertEqual(1, counts['Function'])
+        self.assertEqual(3, counts['Variable'])
+        self.assertEqual(2, counts['BinaryOperationExpression'])
+        self.assertEqual(len(program.arena), sum(counts.values()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+from lexer import lex
+from parser import parse
+from bench import generator, suite
+
+class TestGenerator(unittest.TestCase):
+    def test_deterministic(self):
+        for shape in generator.SHAPES:
+            self.assertEqual(generator.generate(shape, 10, seed=3),
+                             generator.generate(shape, 10, seed=3))
+        self.assertNotEqual(generator.generate('functions', 10, seed=1),
+                            generator.generate('functions', 10, seed=2))
+
+    def test_sizes(self):
+        program = parse(lex(generator.generate('functions', 12)))
+        # The generated functions and main.
+        self.assertEqual(13, len(program.functions))
+        program = parse(lex(generator.generate('statements', 40)))
+        self.assertGreaterEqual(len(program.functions[0].statements), 40)
+
+class TestSuite(unittest.TestCase):
+    def test_compare(self):
+        baseline = {'functions/10': {'lex tokens/s': 1000.0, 'parse nodes/s': 1000.0}}
+        results = {'functions/10': {'lex tokens/s': 850.0, 'parse nodes/s': 950.0},
+                   'functions/20': {'lex tokens/s': 1.0}}
+        self.assertEqual([('functions/10', 'lex tokens/s', 1000.0, 850.0)],
+                         suite.compare(baseline, results, 0.1))
+        self.assertEqual([], suite.compare(baseline, results, 0.2))
+
+    def test_run(self):
+        results = suite.run({'statements': (5,)}, repeat=1)
+        self.assertEqual(set(suite.METRICS), set(results['statements/5']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import sys
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from cache import CacheStats, CompileCache
+
+def store_many(args):
+    directory, key, content, path = args
+    with open(path, 'w') as f:
+        f.write(content)
+    compile_cache = CompileCache(directory)
+    for _ in range(20):
+        compile_cache.store(key, path)
+    return True
+
+class TestCompileCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = CompileCache(os.path.join(self.tmp, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_key_depends_on_source_and_options(self):
+        key = self.cache.key(b'int main() {}', (0,))
+        self.assertEqual(key, self.cache.key(b'int main() {}', (0,)))
+        self.assertNotEqual(key, self.cache.key(b'int main() { }', (0,)))
+        self.assertNotEqual(key, self.cache.key(b'int main() {}', (2,)))
+
+    def test_store_and_fetch(self):
+        key = self.cache.key(b'source', (0,))
+        destination = os.path.join(self.tmp, 'out.s')
+        self.assertFalse(self.cache.fetch(key, destination))
+        self.cache.store(key, self.write('a.s', 'assembly'))
+        self.assertTrue(self.cache.fetch(key, destination))
+        self.assertEqual('assembly', self.read(destination))
+
+    def test_evict_least_recently_used(self):
+        keys = [self.cache.key(str(i).encode(), ()) for i in range(4)]
+        for index, key in enumerate(keys):
+            self.cache.store(key, self.write('e{0}.s'.format(index), 'x' * 100))
+            os.utime(self.cache.path(key), (1000 + index, 1000 + index))
+        # Using the oldest entry makes it the most recent.
+        self.assertTrue(self.cache.fetch(keys[0], os.path.join(self.tmp, 'out.s')))
+        self.cache.max_bytes = 250
+        self.assertEqual(2, self.cache.evict())
+        present = [os.path.exists(self.cache.path(key)) for key in keys]
+        self.assertEqual([True, False, False, True], present)
+        self.assertEqual(200, self.cache.size())
+
+    def test_concurrent_stores(self):
+        key = self.cache.key(b'shared', ())
+        content = 'line\n' * 20000
+        work = [(self.cache.directory, key, content, os.path.join(self.tmp, 'w{0}.s'.format(i)))
+                for i in range(4)]
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            self.assertTrue(all(executor.map(store_many, work)))
+        self.assertEqual(content, self.read(self.cache.path(key)))
+        # No temporary files are left behind.
+        self.assertEqual(1, len(self.cache.entries()))
+        subdirectory = os.path.dirname(self.cache.path(key))
+        self.assertEqual(1, len(os.listdir(subdirectory)))
+
+    def test_stats(self):
+        stats = CacheStats()
+        for status in ('hit', 'miss', 'hit', None):
+            stats.record(status)
+        self.assertEqual('2 hits, 1 misses (66.7% hit rate)', str(stats))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import sys
+import os
+import glob
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from lexer import lex
+from parser import parse
+from codegen import codegen
+from optimizer import optimize
+from bench.generator import generate
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'programs')
+
+def compile_source(source, level=0):
+    return codegen(optimize(parse(lex(source)), level), level=level)
+
+def run_binary(path):
+    return subprocess.run([path]).returncode
+
+@unittest.skipUnless(shutil.which('gcc'), 'gcc is needed to assemble the output')
+class TestCodegen(unittest.TestCase):
+    '''Each program in tests/programs is built twice, once by gcc from the C
+    source and once by assembling our output, and both must exit with the
+    same status.'''
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def build(self, name, source_path=None, assembly=None):
+        binary = os.path.join(self.tmp, name)
+        if assembly is not None:
+            source_path = binary + '.s'
+            with open(source_path, 'w') as f:
+                f.write(assembly)
+        subprocess.run(['gcc', '-w', '-o', binary, source_path], check=True)
+        return binary
+
+    def assertSameExitCode(self, path, level=0):
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path) as f:
+            assembly = compile_source(f.read(), level)
+        expected = run_binary(self.build(name + '_gcc', source_path=path))
+        actual = run_binary(self.build(name, assembly=assembly))
+        self.assertEqual(expected, actual, name)
+
+    def test_programs(self):
+        paths = sorted(glob.glob(os.path.join(PROGRAMS, '*.c')))
+        self.assertTrue(paths)
+        for path in paths:
+            with self.subTest(program=os.path.basename(path)):
+                self.assertSameExitCode(path)
+
+    def test_programs_optimized(self):
+        for path in sorted(glob.glob(os.path.join(PROGRAMS, '*.c'))):
+            with self.subTest(program=os.path.basename(path)):
+                self.assertSameExitCode(path, level=1)
+
+    def test_programs_register_allocated(self):
+        for path in sorted(glob.glob(os.path.join(PROGRAMS, '*.c'))):
+            with self.subTest(program=os.path.basename(path)):
+                self.assertSameExitCode(path, level=2)
+
+    def test_generated_programs(self):
+        for seed in range(4):
+            source = generate('functions', 6, seed)
+            path = os.path.join(self.tmp, 'generated{0}.c'.format(seed))
+            with open(path, 'w') as f:
+                f.write(source)
+            for level in (0, 1, 2):
+                with self.subTest(seed=seed, level=level):
+                    self.assertSameExitCode(path, level)
+
+    def test_return_constant(self):
+        assembly = compile_source('int main() { return 42; }')
+        self.assertEqual(42, run_binary(self.build('main', assembly=assembly)))
+
+    def test_codegen_writes_to_file(self):
+        path = os.path.join(self.tmp, 'out.s')
+        with open(path, 'w') as outfile:
+            result = codegen(parse(lex('int main() { return 3; }')), outfile)
+        self.assertTrue(result is None)
+        with open(path) as f:
+            self.assertIn('movl $3, %eax', f.read())
+
+class TestRegisterAllocatedCodegen(unittest.TestCase):
+    def test_comparison_feeding_branch_is_fused(self):
+        assembly = compile_source('int f(int a) { if (a < 10) return 1; return 2; }', level=2)
+        self.assertIn('cmpl $10, %edi', assembly)
+        self.assertIn('jge ', assembly)
+        self.assertNotIn('setl', assembly)
+
+    def test_stored_comparison_is_set(self):
+        assembly = compile_source('int f(int a, int b) { return a < b; }', level=2)
+        self.assertIn('setl', assembly)
+
+class TestCodegenErrors(unittest.TestCase):
+    def test_undeclared_variable(self):
+        self.assertRaises(Exception, compile_source, 'int main() { return a; }')
+
+if __name__ == '__main__':
+    unittest.main()
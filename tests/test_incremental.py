@@ -0,0 +1,100 @@
+import unittest
+
+from lexer import lex
+from parser import parse, ParseError
+from codegen import codegen
+from optimizer import optimize
+import incremental
+
+SOURCE = '''int add(int a, int b) {
+  return a + b;
+}
+
+int twice(int a) {
+  if (a > 3) {
+    return add(a, a);
+  }
+  return 0;
+}
+
+int main() {
+  return twice(4);
+}
+'''
+
+def full_compile(source, level=0):
+    return codegen(optimize(parse(lex(source)), level), level=level)
+
+class TestIncremental(unittest.TestCase):
+    def assertMatchesFullCompile(self, compiler):
+        self.assertEqual(full_compile(compiler.source, compiler.level), compiler.assembly())
+
+    def test_initial_compile(self):
+        for level in (0, 1, 2):
+            compiler = incremental.IncrementalCompiler(SOURCE, level)
+            self.assertEqual(['add', 'twice', 'main'],
+                             [unit.function.name.value for unit in compiler.units])
+            self.assertMatchesFullCompile(compiler)
+
+    def test_edit_reparses_one_function(self):
+        compiler = incremental.IncrementalCompiler(SOURCE)
+        add, twice, main = compiler.units
+        offset = SOURCE.index('return 0')
+        self.assertEqual(1, compiler.edit(offset, offset + len('return 0'), 'return 1 + 2'))
+        self.assertIs(add, compiler.units[0])
+        self.assertIsNot(twice, compiler.units[1])
+        # Functions after the edit are shifted, not reparsed.
+        self.assertIs(main, compiler.units[2])
+        self.assertEqual('int main()', compiler.source[main.start:main.start + 10])
+        self.assertMatchesFullCompile(compiler)
+
+    def test_update_adds_and_removes_functions(self):
+        compiler = incremental.IncrementalCompiler(SOURCE, 2)
+        added = SOURCE.replace('int main', 'int three() {\n  return 3;\n}\n\nint main')
+        self.assertEqual(1, compiler.update(added))
+        self.assertEqual(4, len(compiler.units))
+        self.assertMatchesFullCompile(compiler)
+        self.assertEqual(0, compiler.update(SOURCE))
+        self.assertEqual(3, len(compiler.units))
+        self.assertMatchesFullCompile(compiler)
+
+    def test_edit_across_functions(self):
+        compiler = incremental.IncrementalCompiler(SOURCE)
+        start = SOURCE.index('a + b')
+        end = SOURCE.index('a > 3')
+        self.assertEqual(1, compiler.edit(start, end, 'a - b;\n}\n\nint twice(int a) {\n  if ('))
+        self.assertMatchesFullCompile(compiler)
+
+    def test_failed_edit_changes_nothing(self):
+        compiler = incremental.IncrementalCompiler(SOURCE)
+        units = list(compiler.units)
+        offset = SOURCE.index('{')
+        self.assertRaises(Exception, compiler.edit, offset, offset + 1, '')
+        self.assertEqual(SOURCE, compiler.source)
+        self.assertEqual(units, compiler.units)
+        self.assertMatchesFullCompile(compiler)
+
+    def test_error_reports_line_in_source(self):
+        source = 'int f(){return 1;}\nint g(){return 2;}\nint h(){return 3;}\n'
+        compiler = incremental.IncrementalCompiler(source)
+        offset = source.index('3;')
+        with self.assertRaises(ParseError) as context:
+            compiler.edit(offset + 1, offset + 2, '')
+        diagnostic = context.exception.diagnostics[0]
+        # The closing brace of h, now where the semicolon was.
+        self.assertEqual((3, 17), (diagnostic.line, diagnostic.column))
+        # A function starting on the line another ends on.
+        compiler.edit(offset + 3, offset + 3, ' int k(){return 4;}')
+        offset = compiler.source.index('4;')
+        with self.assertRaises(ParseError) as context:
+            compiler.edit(offset + 1, offset + 2, '')
+        diagnostic = context.exception.diagnostics[0]
+        self.assertEqual((3, 36), (diagnostic.line, diagnostic.column))
+
+    def test_changed_range(self):
+        self.assertEqual((2, 3, 'XY'), incremental.changed_range('abcde', 'abXYde'))
+        self.assertEqual((3, 3, 'd'), incremental.changed_range('abc', 'abcd'))
+        self.assertEqual((0, 3, ''), incremental.changed_range('abc', ''))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+import tracemalloc
+
+from lexer import lex
+from parser import parse
+import instrument
+
+class TestInstrument(unittest.TestCase):
+    def test_phases_accumulate(self):
+        report = instrument.Report()
+        for run in range(2):
+            with report.phase('lex') as phase:
+                phase.count('tokens', 3)
+        with report.phase('parse'):
+            pass
+        self.assertEqual(['lex', 'parse'], list(report.phases))
+        self.assertEqual({'tokens': 6}, report.phases['lex'].counts)
+        self.assertGreaterEqual(report.total().wall, report.phases['lex'].wall)
+
+    def test_merge(self):
+        first = instrument.Report()
+        second = instrument.Report()
+        first.files = second.files = 1
+        with first.phase('lex') as phase:
+            phase.count('tokens', 2)
+        with second.phase('lex') as phase:
+            phase.count('tokens', 5)
+        first.merge(second)
+        self.assertEqual(2, first.files)
+        self.assertEqual({'tokens': 7}, first.phases['lex'].counts)
+        self.assertIn('tokens=7', str(first))
+
+    def test_peak_memory(self):
+        report = instrument.Report()
+        with instrument.tracing():
+            with report.phase('allocate'):
+                data = bytearray(1 << 20)
+                del data
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertGreaterEqual(report.phases['allocate'].peak_memory, 1 << 20)
+
+    def test_counts(self):
+        ast = parse(lex('int main() { return 1 + 2; }'))
+        # Program, Function, ReturnStatement, the binary expression and two
+        # Constants wrapping an Int each.
+        self.assertEqual(8, instrument.count_nodes(ast))
+        self.assertEqual(2, instrument.count_instructions(
+            '    .text\nmain:\n    movl $3, %eax\n    ret\n'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import server
+import incremental
+from lexer import lex
+from parser import parse, Variable, Call
+from preprocessor import Preprocessor, HeaderCache
+from interning import SymbolTable, symbols, scope
+
+class TestSymbolTable(unittest.TestCase):
+    def test_intern(self):
+        table = SymbolTable()
+        first = table.intern('count')
+        self.assertEqual(first, table.intern('co' + 'unt'))
+        self.assertNotEqual(first, table.intern('total'))
+        self.assertEqual('count', table.name(first))
+        self.assertIs(table.canonical('co' + 'unt'), table.name(first))
+        self.assertEqual(2, len(table))
+        self.assertIn('total', table)
+
+class TestSharedSymbols(unittest.TestCase):
+    def test_tokens_share_ids(self):
+        for source in ('alpha + alpha', b'alpha + alpha'):
+            t = lex(source)
+            self.assertEqual(t[0].id, t[2].id)
+            self.assertIs(t[0].value, t[2].value)
+            self.assertEqual('alpha', symbols.name(t[0].id))
+
+    def test_nodes_carry_ids(self):
+        program = parse(lex('int f(int n) { return g(n) + n; }'))
+        call = program.functions[0].statements[0].expression.lhs
+        variable = program.functions[0].statements[0].expression.rhs
+        self.assertEqual(symbols.intern('g'), call.id)
+        self.assertEqual(program.functions[0].arguments[0].name.id, variable.id)
+        self.assertEqual(Variable('n').id, variable.id)
+        self.assertEqual(Call('g').id, call.id)
+
+class TestScopes(unittest.TestCase):
+    def test_scope(self):
+        outer = symbols.table
+        with scope() as table:
+            self.assertIs(table, symbols.table)
+            token = lex('scoped_only_name')[0]
+            self.assertEqual('scoped_only_name', table.name(token.id))
+        self.assertIs(outer, symbols.table)
+        self.assertNotIn('scoped_only_name', symbols)
+        mine = SymbolTable()
+        with scope(mine):
+            lex('kept_name')
+        self.assertIn('kept_name', mine)
+
+    def test_threads_have_their_own_tables(self):
+        tables = []
+        thread = threading.Thread(target=lambda: tables.append(symbols.table))
+        thread.start()
+        thread.join()
+        self.assertIsNot(symbols.table, tables[0])
+
+    def test_compile_request_frees_its_names(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'a.c')
+            with open(path, 'w') as f:
+                f.write('int request_only_name() { return 1; }\n'
+                        'int main() { return request_only_name(); }\n')
+            before = len(symbols)
+            response = server.compile_request(path, 0)
+        finally:
+            shutil.rmtree(tmp)
+        self.assertTrue(response['ok'])
+        self.assertEqual(before, len(symbols))
+        self.assertNotIn('request_only_name', symbols)
+
+    def test_incremental_compiler_has_its_own_table(self):
+        compiler = incremental.IncrementalCompiler('int main() { return 1; }\n')
+        compiler.update('int main() { int edit_only_name = 2; return edit_only_name; }\n')
+        self.assertIn('edit_only_name', compiler.symbols)
+        self.assertNotIn('edit_only_name', symbols)
+
+    def test_headers_shared_between_scopes(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(tmp, 'a.h'), 'w') as f:
+                f.write('int header_name = 1;\n')
+            headers = HeaderCache()
+            for _ in range(2):
+                with scope() as table:
+                    # The ids of a new table count from 0 again.
+                    table.intern('filler')
+                    tokens = Preprocessor([tmp], headers).preprocess('#include <a.h>\n')
+                    self.assertEqual('header_name', table.name(tokens[1].id))
+            self.assertEqual(1, headers.reads)
+        finally:
+            shutil.rmtree(tmp)
+
+if __name__ == '__main__':
+    unittest.main()
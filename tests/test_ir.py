@@ -0,0 +1,93 @@
+import sys
+import os
+import unittest
+
+from lexer import lex
+from parser import parse
+from ir import (
+    BasicBlock,
+    Instruction,
+    IRFunction,
+    build_cfg,
+    lower,
+    remove_unreachable_blocks,
+    verify,
+)
+
+def lower_source(source):
+    return lower(parse(lex(source))).functions[0]
+
+class TestIR(unittest.TestCase):
+    def test_lower_straight_line(self):
+        function = lower_source('int f(int a) { int b = a * 2; return b + 1; }')
+        self.assertEqual(1, len(function.blocks))
+        self.assertEqual(
+            [str(instruction) for instruction in function.blocks[0].instructions],
+            [
+                't0 = arg 0',
+                't1 = const 2',
+                't2 = mul t0, t1',
+                't3 = copy t2',
+                't4 = const 1',
+                't5 = add t3, t4',
+                'ret t5',
+            ]
+        )
+
+    def test_if_else_cfg(self):
+        function = verify(lower_source(
+            'int f(int a) { int b = 0; if (a) { b = 1; } else { b = 2; } return b; }'))
+        entry, then_block, else_block, end_block = function.blocks
+        self.assertEqual([1, 2], entry.successors)
+        self.assertEqual([0], then_block.predecessors)
+        self.assertEqual([0], else_block.predecessors)
+        self.assertEqual([1, 2], end_block.predecessors)
+        self.assertEqual('branch', entry.terminator().op)
+
+    def test_if_without_else_branches_to_end(self):
+        function = verify(lower_source('int f(int a) { if (a) a = 2; return a; }'))
+        entry, then_block, end_block = function.blocks
+        self.assertEqual([1, 2], entry.successors)
+        self.assertEqual([0, 1], end_block.predecessors)
+
+    def test_logical_and_short_circuits(self):
+        function = verify(lower_source('int f(int a, int b) { return a && b; }'))
+        self.assertEqual(4, len(function.blocks))
+        entry = function.blocks[0]
+        self.assertEqual(['.Lf_1', '.Lf_3'], list(entry.terminator().targets()))
+
+    def test_remove_unreachable_blocks(self):
+        function = lower_source('int f(int a) { if (a) return 1; else return 2; }')
+        labels = [block.label for block in function.blocks]
+        remove_unreachable_blocks(function)
+        self.assertEqual(labels[:3], [block.label for block in function.blocks])
+        verify(function)
+
+    def test_every_block_has_a_terminator(self):
+        function = lower_source('int f(int a) { return a; a = 2; }')
+        for block in function.blocks:
+            self.assertTrue(block.terminator() is not None)
+
+    def test_verify_missing_terminator(self):
+        function = IRFunction('f', [])
+        block = BasicBlock('.Lf_entry')
+        block.instructions.append(Instruction('const', 0, (1,)))
+        function.blocks.append(block)
+        self.assertRaises(Exception, verify, function)
+
+    def test_verify_unknown_target(self):
+        function = IRFunction('f', [])
+        block = BasicBlock('.Lf_entry')
+        block.instructions.append(Instruction('jump', None, ('.Lf_nowhere',)))
+        function.blocks.append(block)
+        self.assertRaises(Exception, verify, function)
+
+    def test_printer(self):
+        function = lower_source('int f() { return 1; }')
+        self.assertEqual(
+            str(function),
+            'function f()\n; block 0\n.Lf_entry:  ; preds [] succs []\n    t0 = const 1\n    ret t0'
+        )
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 import sys
 import os
+import glob
+import tempfile
 import unittest
+from io import StringIO
 
 from lexer import (
     TokenKeyword,
@@ -21,6 +24,8 @@ from lexer import (
     TokenFloat,
     TokenString,
     lex,
+    iter_tokens,
+    mapped,
 )
 
 class TestLexer(unittest.TestCase):
@@ -104,5 +109,86 @@ class TestLexer(unittest.TestCase):
         tks = [str(tk) for tk in t]
         self.assertEqual(tks, expected)
 
+    def testLexKeywordPrefixIsIdentifier(self):
+        t = lex('integer')
+        self.assertEqual([str(tk) for tk in t], ['TokenIdentifier integer'])
+
+    def testLexMultiDigitFloat(self):
+        t = lex('12.5')
+        self.assertEqual([str(tk) for tk in t], ['TokenFloat 12.5'])
+
+    def testLexNotEqual(self):
+        t = lex('a!=1')[1]
+        self.assertIsInstance(t, TokenEqualityOperator)
+        self.assertEqual(t.value, '!=')
+
+    def testLexZero(self):
+        t = lex('return 0;')[1]
+        self.assertIsInstance(t, TokenInteger)
+        self.assertEqual(t.value, 0)
+
+    def testLexLargeInput(self):
+        source = 'int f() { return a + 1; }\n' * 2000
+        self.assertEqual(len(lex(source)), 11 * 2000)
+
+    def testIterTokensAcrossChunks(self):
+        source = 'int main() {\n  int abc=12.5;\n  a <<= 2; b != c;\n  return abc;\n}'
+        expected = [(str(tk), tk.line, tk.column) for tk in lex(source)]
+        for chunk_size in (1, 2, 3, 7):
+            t = iter_tokens(StringIO(source), chunk_size=chunk_size)
+            self.assertEqual([(str(tk), tk.line, tk.column) for tk in t], expected)
+
+    def testIterTokensCorpusAtEveryChunkSize(self):
+        programs = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'programs')
+        sources = ['x = "hello"; y', 's = "a" "bc" + "unterminated; z = 1;']
+        for path in sorted(glob.glob(os.path.join(programs, '*.c'))):
+            with open(path) as f:
+                sources.append(f.read())
+        for source in sources:
+            expected = [(str(tk), tk.line, tk.column, tk.offset, tk.end) for tk in lex(source)]
+            for chunk_size in range(1, 9):
+                with self.subTest(source=source[:20], chunk_size=chunk_size):
+                    t = iter_tokens(StringIO(source), chunk_size=chunk_size)
+                    self.assertEqual(
+                        [(str(tk), tk.line, tk.column, tk.offset, tk.end) for tk in t], expected)
+
+    def testIterTokensOffsets(self):
+        t = list(iter_tokens(StringIO('int  abc;'), chunk_size=2))
+        self.assertEqual([(tk.offset, tk.end) for tk in t], [(0, 3), (5, 8), (8, 9)])
+
+    def testTokenPositions(self):
+        t = lex('int main() {\n  return 2;\n}')
+        positions = [(tk.line, tk.column) for tk in t]
+        self.assertEqual(positions[5:], [(2, 3), (2, 10), (2, 11), (3, 1)])
+
+    def testTokenHasNoDict(self):
+        t = lex('a')[0]
+        self.assertFalse(hasattr(t, '__dict__'))
+        self.assertEqual(t.kind, TokenIdentifier.kind)
+
+    def testLexBytesMatchesStr(self):
+        source = 'int main() {\n  int abc=12.5;\n  a <<= 2; b != c;\n  return abc + 5. + 7;\n}'
+        expected = [(str(tk), tk.offset, tk.end, tk.line, tk.column) for tk in lex(source)]
+        t = lex(source.encode())
+        self.assertEqual([(str(tk), tk.offset, tk.end, tk.line, tk.column) for tk in t], expected)
+        self.assertTrue(isinstance(t[0], TokenKeyword))
+
+    def testLexBytesValuesAreLazyAndInterned(self):
+        t = lex(b'abc + abc')
+        self.assertIsNone(t[0].cached)
+        self.assertIs(t[0].value, t[2].value)
+        self.assertEqual(t[0].cached, 'abc')
+        self.assertFalse(hasattr(t[0], '__dict__'))
+
+    def testLexMappedFile(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(b'int main() { return 0; }')
+            f.flush()
+            with mapped(f) as data:
+                values = [tk.value for tk in iter_tokens(data)]
+        self.assertEqual(values, [tk.value for tk in lex('int main() { return 0; }')])
+        with tempfile.TemporaryFile() as f, mapped(f) as data:
+            self.assertEqual(lex(data), [])
+
 if __name__ == '__main__':
     unittest.main()
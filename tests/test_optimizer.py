@@ -0,0 +1,123 @@
+import sys
+import os
+import unittest
+
+from lexer import lex
+from parser import parse, parse_expression
+from optimizer import fold_constants, fold_expression, eliminate_dead_code, optimize, wrap
+import arena
+
+def fold(source):
+    return str(fold_expression(parse_expression(lex(source))))
+
+class TestConstantFolding(unittest.TestCase):
+    def test_fold_arithmetic(self):
+        self.assertEqual(fold('2 * 60 * 60'), "(Constant (Int 7200))")
+
+    def test_fold_nested(self):
+        self.assertEqual(fold('(1 + 2) * (10 - 4) / 4'), "(Constant (Int 4))")
+
+    def test_fold_comparison_and_logical(self):
+        self.assertEqual(fold('1 < 2 && 3 == 3 || 0'), "(Constant (Int 1))")
+
+    def test_fold_unary(self):
+        self.assertEqual(fold('-(2 + 3)'), "(Constant (Int -5))")
+        self.assertEqual(fold('!5'), "(Constant (Int 0))")
+
+    def test_wraparound(self):
+        self.assertEqual(fold('2147483647 + 1'), "(Constant (Int -2147483648))")
+        self.assertEqual(fold('65536 * 65536'), "(Constant (Int 0))")
+        self.assertEqual(wrap(-2147483649), 2147483647)
+
+    def test_division_truncates_toward_zero(self):
+        self.assertEqual(fold('-7 / 2'), "(Constant (Int -3))")
+        self.assertEqual(fold('7 / -2'), "(Constant (Int -3))")
+        self.assertEqual(fold('-7 % 2'), "(Constant (Int -1))")
+        self.assertEqual(fold('7 % -2'), "(Constant (Int 1))")
+
+    def test_division_by_zero_not_folded(self):
+        self.assertEqual(
+            fold('1 / 0'),
+            "(BinaryOp / (Constant (Int 1)) (Constant (Int 0)))"
+        )
+
+    def test_identities(self):
+        self.assertEqual(fold('x * 1'), "(Variable x)")
+        self.assertEqual(fold('1 * x'), "(Variable x)")
+        self.assertEqual(fold('x + 0'), "(Variable x)")
+        self.assertEqual(fold('0 + x'), "(Variable x)")
+        self.assertEqual(fold('x - 0'), "(Variable x)")
+        self.assertEqual(fold('x * 0'), "(Constant (Int 0))")
+        self.assertEqual(fold('x * (3 - 2)'), "(Variable x)")
+
+    def test_call_not_removed_by_identity(self):
+        self.assertEqual(
+            fold('f() * 0'),
+            "(BinaryOp * (Call f ([])) (Constant (Int 0)))"
+        )
+
+    def test_fold_program(self):
+        program = fold_constants(parse(lex('int main() { int a = 2 * 3; if (1 + 1) a = a * 1; return a + 4 * 2; }')))
+        self.assertEqual(
+            str(program.functions[0].statements),
+            "[(Declaration int (Variable a) (Constant (Int 6))), "
+            "(IfStatement (Constant (Int 2)) [(AssignmentStatement = (Variable a) (Variable a))] []), "
+            "(ReturnStatement (BinaryOp + (Variable a) (Constant (Int 8))))]"
+        )
+
+def eliminate(body):
+    program = fold_constants(parse(lex('int f(int a) { ' + body + ' }')))
+    return [str(stmt) for stmt in eliminate_dead_code(program).functions[0].statements]
+
+class TestDeadCode(unittest.TestCase):
+    def test_statements_after_return(self):
+        self.assertEqual(eliminate('return a; a = 1; f(a);'), ['(ReturnStatement (Variable a))'])
+        self.assertEqual(
+            eliminate('if (a) return 1; else { return 2; } f(a);'),
+            ["(IfStatement (Variable a) [(ReturnStatement (Constant (Int 1)))] "
+             "[(ReturnStatement (Constant (Int 2)))])"])
+
+    def test_constant_conditions(self):
+        self.assertEqual(eliminate('if (2 > 1) f(1); else f(2); if (0) f(3); return 0;'),
+                         ['(ExpressionStatement (Call f ([(Constant (Int 1))])))',
+                          '(ReturnStatement (Constant (Int 0)))'])
+        # An arm with declarations keeps its block.
+        self.assertEqual(eliminate('if (0) f(1); else { int a = 2; return a; }'),
+                         ['(IfStatement (Constant (Int 1)) [(Declaration int (Variable a) '
+                          '(Constant (Int 2))), (ReturnStatement (Variable a))] [])'])
+
+    def test_dead_stores(self):
+        self.assertEqual(eliminate('int b = a; b = 2; a = b; return b;'),
+                         ['(Declaration int (Variable b) None)',
+                          '(AssignmentStatement = (Variable b) (Constant (Int 2)))',
+                          '(ReturnStatement (Variable b))'])
+        # Calls are kept.
+        self.assertEqual(eliminate('int b = f(1); a += f(2); return 0;'),
+                         ['(Declaration int (Variable b) None)',
+                          '(ExpressionStatement (Call f ([(Constant (Int 1))])))',
+                          '(ExpressionStatement (Call f ([(Constant (Int 2))])))',
+                          '(ReturnStatement (Constant (Int 0)))'])
+
+    def test_liveness_through_branches(self):
+        self.assertEqual(
+            eliminate('int b = 1; int c = 2; if (a) { c = 3; } else { b = 4; } '
+                      'if (a) { a = c; } return b;'),
+            ['(Declaration int (Variable b) (Constant (Int 1)))',
+             '(Declaration int (Variable c) None)',
+             '(IfStatement (Variable a) [] [(AssignmentStatement = (Variable b) (Constant (Int 4)))])',
+             '(ReturnStatement (Variable b))'])
+
+    def test_shadowed_names(self):
+        self.assertEqual(
+            eliminate('int b = 1; if (a) { int b = 2; a = b; } return b;'),
+            ['(Declaration int (Variable b) (Constant (Int 1)))',
+             '(IfStatement (Variable a) [(Declaration int (Variable b) None)] [])',
+             '(ReturnStatement (Variable b))'])
+
+    def test_views(self):
+        source = 'int f(int a) { int b = 2; if (0) a = 1; return a; b = 3; }'
+        self.assertEqual(str(optimize(arena.parse(lex(source)))),
+                         str(optimize(parse(lex(source)))))
+
+if __name__ == '__main__':
+    unittest.main()
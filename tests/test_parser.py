@@ -22,6 +22,8 @@ from lexer import (
     TokenString,
 )
 
+from lexer import iter_tokens, lex
+
 from parser import (
     Constant,
     Variable,
@@ -32,6 +34,7 @@ from parser import (
     Argument,
     Function,
     Program,
+    TokenStream,
     accept,
     accept_value,
     parse_constant,
@@ -48,6 +51,8 @@ from parser import (
     parse_comparison,
     parse_equality,
     parse,
+    parse_recovering,
+    ParseError,
 )
 
 class TestParser(unittest.TestCase):
@@ -243,8 +248,182 @@ class TestParser(unittest.TestCase):
 
         self.assertEqual(
             str(expr),
-            "(BinaryOp + (Variable a) (BinaryOp + (Constant (Int 1)) (Constant (Int 2))))"
+            "(BinaryOp + (BinaryOp + (Variable a) (Constant (Int 1))) (Constant (Int 2)))"
+        )
+
+    def test_parse_subtraction_left_associative(self):
+        tokens = lex('a - b - c')
+        expr = parse_expression(tokens)
+        self.assertEqual(
+            str(expr),
+            "(BinaryOp - (BinaryOp - (Variable a) (Variable b)) (Variable c))"
         )
 
+    def test_parse_precedence(self):
+        tokens = lex('a || b && c == 1 + 2 * 3 < 4')
+        expr = parse_expression(tokens)
+        self.assertEqual(
+            str(expr),
+            "(BinaryOp || (Variable a) (BinaryOp && (Variable b) "
+            "(BinaryOp == (Variable c) (BinaryOp < (BinaryOp + (Constant (Int 1)) "
+            "(BinaryOp * (Constant (Int 2)) (Constant (Int 3)))) (Constant (Int 4))))))"
+        )
+
+    def test_parse_equality_stops_at_logical(self):
+        tokens = lex('a == b && c')
+        expr = parse_equality(tokens)
+        self.assertEqual(str(expr), "(BinaryOp == (Variable a) (Variable b))")
+        self.assertEqual(2, len(tokens))
+
+    def test_parse_long_chain(self):
+        tokens = lex(' - '.join(['x'] * 20000))
+        expr = parse_expression(tokens)
+        depth = 0
+        while isinstance(expr, BinaryOperationExpression):
+            self.assertIsInstance(expr.rhs, Variable)
+            expr = expr.lhs
+            depth += 1
+        self.assertEqual(19999, depth)
+
+    def test_parse_deep_parentheses(self):
+        expr = parse_expression(lex('(' * 20000 + '-x' + ')' * 20000))
+        self.assertEqual(str(expr), "(UnaryOp - (Variable x))")
+        # 1 - (1 - (1 - ...)) nests to the right.
+        tokens = lex('1 - (' * 20000 + '1' + ')' * 20000 + ';')
+        expr = parse_expression(tokens)
+        depth = 0
+        while isinstance(expr, BinaryOperationExpression):
+            self.assertIsInstance(expr.lhs, Constant)
+            expr = expr.rhs
+            depth += 1
+        self.assertEqual(20000, depth)
+        self.assertEqual(1, len(tokens))
+        for source in ('(a', '()', '(a + )'):
+            with self.assertRaises(ParseError):
+                parse_expression(lex(source))
+
+    def test_parse_token_stream(self):
+        tokens = TokenStream(iter_tokens('int main() { return 2; } int f() { return 3; }'))
+        prog = parse(tokens)
+        self.assertEqual(
+            str(prog.functions[1]),
+            "(Function TokenKeyword int TokenIdentifier f ([]) [(ReturnStatement (Constant (Int 3)))])"
+        )
+
+    def test_token_stream_peek(self):
+        tokens = TokenStream(iter([TokenIdentifier('a'), TokenSemicolon(';')]))
+        self.assertEqual('a', tokens.peek().value)
+        self.assertIsInstance(tokens.peek(1), TokenSemicolon)
+        self.assertTrue(tokens.peek(2) is None)
+
+    def test_token_stream_mark_reset(self):
+        tokens = TokenStream([TokenIdentifier('a'), TokenSemicolon(';')])
+        mark = tokens.mark()
+        tokens.expect(TokenIdentifier)
+        tokens.reset(mark)
+        self.assertEqual('a', tokens.accept(TokenIdentifier).value)
+        self.assertRaises(Exception, tokens.expect, TokenIdentifier)
+
+    def test_list_consumed(self):
+        tokens = [TokenIdentifier('a'), TokenIdentifier('b')]
+        accept(TokenIdentifier, tokens)
+        self.assertEqual(1, len(tokens))
+        self.assertEqual('b', accept(TokenIdentifier, tokens).value)
+        self.assertEqual([], tokens)
+
+    def test_parse_declaration(self):
+        stmt = parse_statement(lex('int a = 1;'))
+        self.assertEqual(str(stmt), "(Declaration int (Variable a) (Constant (Int 1)))")
+
+    def test_parse_if_else(self):
+        stmt = parse_statement(lex('if (a) return 1; else { a = 2; }'))
+        self.assertEqual(
+            str(stmt),
+            "(IfStatement (Variable a) [(ReturnStatement (Constant (Int 1)))] "
+            "[(AssignmentStatement = (Variable a) (Constant (Int 2)))])"
+        )
+
+    def test_parse_call(self):
+        expr = parse_expression(lex('f(a, 1 + 2)'))
+        self.assertEqual(
+            str(expr),
+            "(Call f ([(Variable a), (BinaryOp + (Constant (Int 1)) (Constant (Int 2)))]))"
+        )
+
+    def test_parse_function_arguments(self):
+        func = parse_function_declaration(lex('int f(int a, int b) { return a; }'))
+        self.assertEqual(
+            [str(arg) for arg in func.arguments],
+            ["(Argument TokenKeyword int (Variable a))", "(Argument TokenKeyword int (Variable b))"]
+        )
+
+ERRORS = '''int f(int a) {
+    int x = ;
+    if (x) { y = 2 } else { return 1; }
+    return x
+}
+int g(int a b) { return a; }
+int h() { return 1; }
+'''
+
+class TestRecovery(unittest.TestCase):
+    def diagnostics(self, source, max_errors=20):
+        program, diagnostics = parse_recovering(TokenStream(lex(source), max_errors))
+        return program, [str(diagnostic) for diagnostic in diagnostics]
+
+    def test_all_errors_reported(self):
+        program, diagnostics = self.diagnostics(ERRORS)
+        self.assertEqual([
+            '2:13: Expected expression after =',
+            '3:20: Expected token ;',
+            '5:1: Expected token ;',
+            '6:13: Expected token )',
+        ], diagnostics)
+        self.assertEqual(['f', 'h'], [function.name.value for function in program.functions])
+        # Statements after an error are still parsed, inside blocks too.
+        self.assertEqual('(IfStatement (Variable x) [] [(ReturnStatement (Constant (Int 1)))])',
+                         str(program.functions[0].statements[-1]))
+
+    def test_parse_raises_every_error(self):
+        with self.assertRaises(ParseError) as raised:
+            parse(lex(ERRORS))
+        self.assertEqual(4, len(raised.exception.diagnostics))
+        self.assertEqual(3, raised.exception.diagnostics[1].line)
+        self.assertEqual(4, len(str(raised.exception).splitlines()))
+
+    def test_no_errors(self):
+        source = 'int main() { if (1) { return 2; } else return 3; }'
+        program, diagnostics = self.diagnostics(source)
+        self.assertEqual([], diagnostics)
+        self.assertEqual(str(parse(lex(source))), str(program))
+
+    def test_stray_braces_and_end_of_input(self):
+        program, diagnostics = self.diagnostics('}\nint m() { return 3; }\nint n() {')
+        self.assertEqual(['1:1: Expected return type declaration',
+                          '3:10: Expected token } at end of input'], diagnostics)
+        self.assertEqual(['m'], [function.name.value for function in program.functions])
+
+    def test_end_of_input_located(self):
+        for tokens in (lex('int main() { x = 1;'), iter_tokens('int main() { x = 1;')):
+            with self.assertRaises(ParseError) as raised:
+                parse(TokenStream(tokens))
+            diagnostic = raised.exception.diagnostics[0]
+            self.assertEqual((1, 20), (diagnostic.line, diagnostic.column))
+        with self.assertRaises(ParseError) as raised:
+            parse(TokenStream(lex('int main() {\n  return 1 +')))
+        self.assertEqual(['2:13: Expected expression after + at end of input',
+                          '2:13: Expected token } at end of input'],
+                         str(raised.exception).splitlines())
+
+    def test_error_cap(self):
+        source = 'int main() {' + ' x = ;' * 100 + ' }'
+        program, diagnostics = self.diagnostics(source, max_errors=5)
+        self.assertEqual(6, len(diagnostics))
+        self.assertEqual('Too many errors, stopping after 5', diagnostics[-1])
+
+    def test_single_parsers_still_raise(self):
+        self.assertRaises(ParseError, parse_function_declaration,
+                          lex('int f() { x = ; return 1; }'))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+
+from lexer import lex
+from parser import parse
+from codegen import codegen
+from optimizer import optimize
+from peephole import LABEL, DIRECTIVE, PeepholeEmitter
+import peephole
+
+def rewrite(lines):
+    hits = {}
+    return peephole.optimize(lines, hits), hits
+
+class TestRules(unittest.TestCase):
+    def test_push_pop(self):
+        self.assertEqual(rewrite([('pushq', '%rax'), ('popq', '%rdi')]),
+                         ([('movq', '%rax', '%rdi')], {'push-pop': 1}))
+        self.assertEqual(rewrite([('pushq', '%rax'), ('popq', '%rax')]), ([], {'push-pop': 1}))
+
+    def test_push_operand_pop(self):
+        lines = [('pushq', '%rax'), ('movl', '-8(%rbp)', '%eax'), ('movl', '%eax', '%ecx'),
+                 ('popq', '%rax'), ('addl', '%ecx', '%eax')]
+        self.assertEqual(rewrite(lines)[0],
+                         [('movl', '-8(%rbp)', '%ecx'), ('addl', '%ecx', '%eax')])
+        # A call's result is not a constant or a local, so it stays on the stack.
+        lines[1] = ('movl', '%edx', '%eax')
+        self.assertEqual(rewrite(lines), (lines, {}))
+
+    def test_moves(self):
+        lines = [('movl', '%eax', '%eax'), ('movl', '%eax', '-8(%rbp)'),
+                 ('movl', '-8(%rbp)', '%eax'), ('ret',)]
+        self.assertEqual(rewrite(lines),
+                         ([('movl', '%eax', '-8(%rbp)'), ('ret',)],
+                          {'self-move': 1, 'move-back': 1}))
+
+    def test_zero_register(self):
+        lines = [('movl', '$0', '%eax'), ('leave',), ('ret',)]
+        self.assertEqual(rewrite(lines)[0][0], ('xorl', '%eax', '%eax'))
+        # xorl would clobber flags that are still to be read.
+        lines = [('cmpl', '%ecx', '%eax'), ('movl', '$0', '%eax'), ('sete', '%al')]
+        self.assertEqual(rewrite(lines), (lines, {}))
+        lines = [('movl', '$0', '-8(%rbp)')]
+        self.assertEqual(rewrite(lines), (lines, {}))
+
+    def test_jumps(self):
+        lines = [('jmp', '.L2'), ('movl', '$1', '%eax'), (LABEL, '.L1'), (LABEL, '.L2'),
+                 ('je', '.L3'), (LABEL, '.L3'), ('ret',)]
+        self.assertEqual(rewrite(lines),
+                         ([(LABEL, '.L1'), (LABEL, '.L2'), (LABEL, '.L3'), ('ret',)],
+                          {'unreachable': 1, 'jump-to-next': 2}))
+
+    def test_emitter(self):
+        written = []
+        class Recorder():
+            def instruction(self, op, *operands):
+                written.append((op,) + operands)
+            def label(self, name):
+                written.append((LABEL, name))
+            def directive(self, text):
+                written.append((DIRECTIVE, text))
+            def flush(self):
+                written.append('flush')
+        emitter = PeepholeEmitter(Recorder())
+        emitter.directive('.globl f')
+        emitter.label('f')
+        emitter.instruction('pushq', '%rax')
+        emitter.instruction('popq', '%rax')
+        emitter.instruction('ret')
+        self.assertEqual([], written)
+        emitter.flush()
+        self.assertEqual([(DIRECTIVE, '.globl f'), (LABEL, 'f'), ('ret',), 'flush'], written)
+        self.assertEqual({'push-pop': 1}, emitter.hits)
+
+class TestCodegen(unittest.TestCase):
+    def test_enabled_at_level_one(self):
+        source = 'int f(int a) { int b = a + 1; return f(b) * 2; } int main() { return f(1); }'
+        unoptimized = codegen(optimize(parse(lex(source)), 0), level=0)
+        hits = {}
+        optimized = codegen(optimize(parse(lex(source)), 1), level=1, hits=hits)
+        self.assertLess(len(optimized.splitlines()), len(unoptimized.splitlines()))
+        self.assertNotIn('popq %rdi', optimized)
+        self.assertGreater(hits['push-operand-pop'], 0)
+        self.assertEqual(optimized, codegen(optimize(parse(lex(source)), 1), level=1))
+
+if __name__ == '__main__':
+    unittest.main()
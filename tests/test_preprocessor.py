@@ -0,0 +1,231 @@
+import os
+import io
+import json
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+
+import pycc
+import cache
+import preprocessor
+from preprocessor import Preprocessor, HeaderCache, find_guard, scan
+
+def values(tokens):
+    return ' '.join(str(token.value) for token in tokens)
+
+def run(source, **kwargs):
+    return values(Preprocessor(headers=HeaderCache(), **kwargs).preprocess(source))
+
+class TestMacros(unittest.TestCase):
+    def test_object_macro(self):
+        self.assertEqual(run('#define N 10\nint x = N * N;'), 'int x = 10 * 10 ;')
+
+    def test_function_macro(self):
+        self.assertEqual(run('#define ADD(a, b) a + b\nADD(f(1, 2), (3, 4))'),
+                         'f ( 1 , 2 ) + ( 3 , 4 )')
+        self.assertEqual(run('#define GT(a, b) ((a) > (b))\n#define SQ(x) x * x\nSQ(GT(1, 2))'),
+                         '( ( 1 ) > ( 2 ) ) * ( ( 1 ) > ( 2 ) )')
+
+    def test_function_macro_needs_arguments(self):
+        self.assertEqual(run('#define F() 1\nF F()'), 'F 1')
+
+    def test_recursive_macro_stops(self):
+        self.assertEqual(run('#define a a + b\n#define b a\na'), 'a + a')
+
+    def test_undef(self):
+        self.assertEqual(run('#define N 1\n#undef N\nN'), 'N')
+
+    def test_argument_count(self):
+        with self.assertRaises(Exception):
+            run('#define F(a, b) a\nF(1)')
+
+class TestConditionals(unittest.TestCase):
+    def test_if_elif_else(self):
+        source = ('#define LEVEL 2\n'
+                  '#if LEVEL == 1\none\n#elif LEVEL == 2 && defined(LEVEL)\ntwo\n'
+                  '#else\nother\n#endif')
+        self.assertEqual(run(source), 'two')
+
+    def test_ifdef_nested(self):
+        source = ('#ifdef A\n#if 1\na\n#else\nb\n#endif\n#else\n'
+                  '#ifndef B\nc\n#endif\n#endif')
+        self.assertEqual(run(source), 'c')
+        self.assertEqual(run('#define A\n' + source), 'a')
+
+    def test_undefined_names_are_zero(self):
+        self.assertEqual(run('#if UNKNOWN\nx\n#else\ny\n#endif'), 'y')
+
+    def test_skipped_directives_are_ignored(self):
+        self.assertEqual(run('#if 0\n#error no\n#include "missing.h"\n#endif\nok'), 'ok')
+
+    def test_errors(self):
+        for source in ('#if 1\nx', '#endif', '#error stop', '#if 1 +\n#endif', '#bogus'):
+            with self.subTest(source=source):
+                with self.assertRaises(Exception):
+                    run(source)
+
+    def test_comments_and_lines(self):
+        tokens = Preprocessor(headers=HeaderCache()).preprocess(
+            '/* a\n comment */ int // #define x\n#define N \\\n  5\nx = N;')
+        self.assertEqual(values(tokens), 'int x = 5 ;')
+        self.assertEqual(tokens[0].line, 2)
+        self.assertEqual(tokens[1].line, 5)
+
+class TestIncludes(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_find_guard(self):
+        self.assertEqual(find_guard(scan('#ifndef G\n#define G\n#if X\n#endif\nint a;\n#endif\n')), 'G')
+        self.assertEqual(find_guard(scan('#if !defined(G)\n#define G\n#endif')), 'G')
+        self.assertIsNone(find_guard(scan('int a;\n#ifndef G\n#define G\n#endif')))
+        self.assertIsNone(find_guard(scan('#ifndef G\n#define G\n#endif\nint a;')))
+        self.assertIsNone(find_guard(scan('#ifndef G\n#else\n#endif')))
+
+    def test_repeated_headers_are_skipped(self):
+        self.write('include/guarded.h', '#ifndef GUARDED\n#define GUARDED\nint g;\n#endif\n')
+        self.write('include/once.h', '#pragma once\nint o;\n')
+        self.write('include/plain.h', 'int p;\n')
+        main = self.write('main.c', '#include <guarded.h>\n#include "include/once.h"\n' * 50
+                          + '#include <plain.h>\n#include <plain.h>\n')
+        headers = HeaderCache()
+        unit = Preprocessor([os.path.join(self.tmp, 'include')], headers)
+        with open(main) as f:
+            tokens = unit.preprocess(f.read(), main)
+        self.assertEqual(values(tokens), 'int g ; int o ; int p ; int p ;')
+        self.assertEqual(headers.reads, 3)
+        self.assertEqual(unit.skipped, 98)
+        self.assertEqual(len(unit.dependencies), 4)
+
+    def test_missing_include(self):
+        with self.assertRaises(Exception) as raised:
+            run('\n#include "missing.h"')
+        self.assertIn('<source>:2: Cannot find include file missing.h', str(raised.exception))
+
+    def test_include_cycle(self):
+        path = self.write('loop.h', '#include "loop.h"\n')
+        with self.assertRaises(Exception) as raised:
+            Preprocessor(headers=HeaderCache()).preprocess('#include "loop.h"', path)
+        self.assertIn('nested too deeply', str(raised.exception))
+
+    def test_header_cache(self):
+        header = self.write('a.h', '#define A 1\nint a = A;\n')
+        cache_dir = os.path.join(self.tmp, 'cache')
+        first = HeaderCache(cache_dir)
+        first.load(header)
+        first.load(header)
+        self.assertEqual(first.reads, 1)
+        # A new process finds the header on disk.
+        second = HeaderCache(cache_dir)
+        unit = Preprocessor([self.tmp], second)
+        self.assertEqual(values(unit.preprocess('#include <a.h>\nA')), 'int a = 1 ; 1')
+        self.assertEqual(second.reads, 0)
+        # A changed header is read again.
+        self.write('a.h', '#define A 22\n')
+        os.utime(header, ns=(0, os.stat(header).st_mtime_ns + 10 ** 9))
+        unit = Preprocessor([self.tmp], second)
+        self.assertEqual(values(unit.preprocess('#include <a.h>\nA')), '22')
+        self.assertEqual(second.reads, 1)
+
+    def test_header_cache_files(self):
+        header = self.write('a.h', '#define A 1\nint a = A;\n')
+        cache_dir = os.path.join(self.tmp, 'cache')
+        HeaderCache(cache_dir).load(header)
+        key = HeaderCache(cache_dir).load(header).key
+        path = HeaderCache(cache_dir).entry_path(key)
+        with open(path) as f:
+            json.load(f)
+        # A hit keeps the file from being evicted as unused.
+        os.utime(path, (0, 0))
+        headers = HeaderCache(cache_dir)
+        headers.load(header)
+        self.assertEqual(headers.reads, 0)
+        self.assertGreater(os.stat(path).st_mtime, 0)
+        # A damaged file is a miss.
+        with open(path, 'w') as f:
+            f.write('{')
+        headers = HeaderCache(cache_dir)
+        headers.load(header)
+        self.assertEqual(headers.reads, 1)
+
+    def test_driver(self):
+        self.write('include/defs.h', '#ifndef DEFS\n#define DEFS\n#define ANSWER 42\n'
+                   'int twice(int x) { return x + x; }\n#endif\n')
+        source = self.write('src/main.c', '#include <defs.h>\n#include <defs.h>\n'
+                            '// The answer\nint main() { return twice(ANSWER); }\n')
+        cache_dir = os.path.join(self.tmp, 'cache')
+        argv = ['-I', os.path.join(self.tmp, 'include'), '--cache-dir', cache_dir,
+                '--cache-stats', source]
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            self.assertEqual(0, pycc.main(argv))
+            self.assertEqual(0, pycc.main(argv))
+        self.assertIn('1 hits, 0 misses', stderr.getvalue())
+        with open(os.path.join(self.tmp, 'src', 'main.s')) as f:
+            self.assertIn('movl $42, %eax', f.read())
+        # Editing the header misses the cache.
+        header = self.write('include/defs.h', '#pragma once\n#define ANSWER 7\n'
+                            'int twice(int x) { return x + x; }\n')
+        os.utime(header, ns=(0, os.stat(header).st_mtime_ns + 10 ** 9))
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            self.assertEqual(0, pycc.main(argv))
+        self.assertIn('0 hits, 1 misses', stderr.getvalue())
+        with open(os.path.join(self.tmp, 'src', 'main.s')) as f:
+            self.assertIn('movl $7, %eax', f.read())
+
+    def test_cached_compile_preprocesses_once(self):
+        self.write('include/defs.h', '#define ANSWER 42\n')
+        source = self.write('main.c', '#include <defs.h>\nint main() { return ANSWER; }\n')
+        assembly = os.path.join(self.tmp, 'main.s')
+        compile_cache = cache.CompileCache(os.path.join(self.tmp, 'cache'))
+        calls = []
+        preprocess = Preprocessor.preprocess
+        def counting(unit, text, path=None):
+            calls.append(path)
+            return preprocess(unit, text, path)
+        Preprocessor.preprocess = counting
+        try:
+            status = pycc.compile_cached(source, assembly, 0, compile_cache,
+                                         include_paths=[os.path.join(self.tmp, 'include')])
+        finally:
+            Preprocessor.preprocess = preprocess
+        self.assertEqual('miss', status)
+        self.assertEqual([source], calls)
+        with open(assembly) as f:
+            self.assertIn('movl $42, %eax', f.read())
+
+    def test_file_sources(self):
+        reads = []
+        class File(io.StringIO):
+            def read(self, size=-1):
+                reads.append(size)
+                return super().read(size)
+        plain = File('int main() { return 1 / 2; }\n')
+        tokens = preprocessor.source_tokens(plain)
+        # Lexed a chunk at a time from where the scan left it.
+        self.assertNotIn(-1, reads)
+        self.assertEqual(values(tokens), 'int main ( ) { return 1 / 2 ; }')
+        self.assertNotIn(-1, reads)
+        commented = File('int x = 1; /* a\n b */\n#define Y 2\nint y = Y;\n')
+        self.assertEqual(values(preprocessor.source_tokens(commented)),
+                         'int x = 1 ; int y = 2 ;')
+        # A marker split across chunks is still found.
+        for size in range(1, 4):
+            self.assertTrue(preprocessor.file_needs_preprocessing(io.StringIO('a / /b //'), size))
+            self.assertTrue(preprocessor.file_needs_preprocessing(io.StringIO('1 /* 2 */'), size))
+            self.assertFalse(preprocessor.file_needs_preprocessing(io.StringIO('1 / 2 * 3'), size))
+
+if __name__ == '__main__':
+    unittest.main()
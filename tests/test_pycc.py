@@ -0,0 +1,131 @@
+import sys
+import os
+import io
+import shutil
+import tempfile
+import json
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+
+import pycc
+from lexer import lex
+
+GOOD = 'int main() { return 1 + 2; }'
+BAD = 'int main() { return ; ; }'
+
+class TestDriver(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, source):
+        path = os.path.join(self.tmp, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(source)
+        return path
+
+    def read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def run_main(self, argv):
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            status = pycc.main(argv)
+        return status, stderr.getvalue()
+
+    def test_single_file(self):
+        path = self.write('a.c', GOOD)
+        status, output = self.run_main([path])
+        self.assertEqual(0, status)
+        self.assertEqual('', output)
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, 'a.s')))
+
+    def test_collect_sources(self):
+        self.write('b/two.c', GOOD)
+        self.write('a/one.c', GOOD)
+        self.write('a/notes.txt', '')
+        sources = pycc.collect_sources([self.tmp])
+        self.assertEqual(
+            [os.path.join(self.tmp, 'a', 'one.c'), os.path.join(self.tmp, 'b', 'two.c')],
+            sources)
+
+    def test_errors_are_isolated(self):
+        for jobs in ('1', '2'):
+            good = [self.write('good{0}.c'.format(i), GOOD) for i in range(4)]
+            bad = self.write('bad.c', BAD)
+            status, output = self.run_main(['-j', jobs, self.tmp])
+            self.assertEqual(1, status)
+            self.assertIn(bad + ': error:', output)
+            self.assertIn('4 compiled, 1 failed', output)
+            for path in good:
+                self.assertTrue(os.path.exists(pycc.assembly_path(path)))
+            self.assertFalse(os.path.exists(pycc.assembly_path(bad)))
+
+    def test_every_syntax_error_reported(self):
+        path = self.write('bad.c', 'int main() {\n  x = ;\n  return 1 +;\n}\n')
+        status, output = self.run_main([path])
+        self.assertEqual(1, status)
+        self.assertIn(path + ': error: 2:7: Expected expression after =', output)
+        self.assertIn(path + ': error: 3:13: Expected expression after +', output)
+
+    def test_parallel_matches_serial(self):
+        paths = [self.write('f{0}.c'.format(i), 'int main() {{ return {0}; }}'.format(i))
+                 for i in range(8)]
+        self.run_main(['-j', '1'] + paths)
+        serial = [self.read(pycc.assembly_path(path)) for path in paths]
+        self.run_main(['-j', '3', '-O', '2'] + paths)
+        self.run_main(['-j', '3'] + paths)
+        parallel = [self.read(pycc.assembly_path(path)) for path in paths]
+        self.assertEqual(serial, parallel)
+
+    def test_cache_hit_skips_compile(self):
+        paths = [self.write('c{0}.c'.format(i), 'int main() {{ return {0}; }}'.format(i))
+                 for i in range(3)]
+        cache_dir = os.path.join(self.tmp, 'cache')
+        argv = ['--cache-dir', cache_dir, '--cache-stats'] + paths
+        status, output = self.run_main(argv)
+        self.assertIn('0 hits, 3 misses', output)
+        expected = self.read(pycc.assembly_path(paths[0]))
+        for path in paths:
+            os.remove(pycc.assembly_path(path))
+        compile_file = pycc.compile_file
+        pycc.compile_file = None
+        try:
+            status, output = self.run_main(argv)
+        finally:
+            pycc.compile_file = compile_file
+        self.assertEqual(0, status)
+        self.assertIn('3 hits, 0 misses', output)
+        self.assertEqual(expected, self.read(pycc.assembly_path(paths[0])))
+
+    def test_cache_keyed_on_options(self):
+        path = self.write('c.c', GOOD)
+        cache_dir = os.path.join(self.tmp, 'cache')
+        self.run_main(['--cache-dir', cache_dir, path])
+        status, output = self.run_main(['--cache-dir', cache_dir, '--cache-stats', '-O', '1', path])
+        self.assertIn('0 hits, 1 misses', output)
+
+    def test_time_report(self):
+        paths = [self.write('t{0}.c'.format(i), GOOD) for i in range(2)]
+        stdout = io.StringIO()
+        with redirect_stdout(stdout):
+            status, output = self.run_main(['--time-report', '--report-format', 'json',
+                                            '-O', '1', '--profile'] + paths)
+        self.assertEqual(0, status)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(2, report['files'])
+        phases = {phase['name']: phase for phase in report['phases']}
+        self.assertEqual(['lex', 'parse', 'analyse', 'optimize', 'codegen', 'write'], list(phases))
+        self.assertEqual(2 * len(lex(GOOD)), phases['lex']['counts']['tokens'])
+        self.assertGreater(phases['codegen']['counts']['instructions'], 0)
+        # The return leaves the epilogue for falling off the end unreachable.
+        self.assertEqual(2, phases['codegen']['counts']['peephole:unreachable'])
+        for path in paths:
+            self.assertTrue(os.path.exists(os.path.splitext(path)[0] + '.prof'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import sys
+import os
+import unittest
+
+from lexer import lex
+from parser import parse
+from ir import lower
+from regalloc import (
+    argument_registers,
+    liveness,
+    callee_saved_registers,
+    caller_saved_registers,
+    live_intervals,
+    linear_scan,
+)
+
+def lower_source(source):
+    return lower(parse(lex(source))).functions[0]
+
+class TestRegalloc(unittest.TestCase):
+    def test_live_intervals(self):
+        function = lower_source('int f(int a) { int b = a + 1; return b * a; }')
+        intervals = live_intervals(function)
+        # a is read by the multiplication, the last use before the return.
+        a = intervals[0]
+        self.assertEqual(0, a.start)
+        self.assertEqual('mul', list(function.instructions())[a.end].op)
+
+    def test_liveness_across_blocks(self):
+        function = lower_source('int f(int a) { int b = a; if (a) b = 2; return b; }')
+        live_in, live_out = liveness(function)
+        entry, then_block, end_block = range(3)
+        b = 1
+        self.assertIn(b, live_out[entry])
+        self.assertIn(b, live_in[end_block])
+        self.assertNotIn(b, live_in[then_block])
+
+    def test_no_spills_without_pressure(self):
+        function = lower_source('int f(int a, int b) { return a * b + a - b; }')
+        allocation = linear_scan(function)
+        self.assertEqual(0, allocation.spill_count)
+        for interval in allocation.intervals.values():
+            self.assertTrue(interval.register is not None)
+
+    def test_live_across_call_gets_callee_saved(self):
+        function = lower_source('int f(int a) { int b = g(a); return a + b; }')
+        allocation = linear_scan(function)
+        a = allocation.intervals[0]
+        self.assertTrue(a.crosses_call)
+        self.assertIn(a.register, callee_saved_registers)
+        self.assertEqual([a.register], allocation.used_callee_saved)
+
+    def test_arguments_stay_in_their_registers(self):
+        function = lower_source('int f(int a, int b) { return a - b; }')
+        allocation = linear_scan(function)
+        self.assertEqual(argument_registers[0], allocation.intervals[0].register)
+        self.assertEqual(argument_registers[1], allocation.intervals[1].register)
+
+    def test_spill_under_pressure(self):
+        names = ['v{0}'.format(i) for i in range(12)]
+        source = 'int f() {{ {0} return {1}; }}'.format(
+            ' '.join('int {0} = {1};'.format(name, i) for i, name in enumerate(names)),
+            ' + '.join(names))
+        function = lower_source(source)
+        allocation = linear_scan(function)
+        self.assertTrue(allocation.spill_count > 0)
+        # No two intervals that overlap share a register.
+        assigned = [i for i in allocation.intervals.values() if i.register]
+        for first in assigned:
+            for second in assigned:
+                if first is not second and first.register == second.register:
+                    self.assertTrue(first.end <= second.start or second.end <= first.start)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from lexer import lex
+from parser import parse, IfStatement
+import semantic
+
+def analyse(source):
+    return semantic.analyse(parse(lex(source)))
+
+class TestSemantic(unittest.TestCase):
+    def test_slots(self):
+        function = analyse('int f(int a, int b) { int c = a; return c + b; }').functions[0]
+        a, b = [argument.name.symbol for argument in function.arguments]
+        c = function.statements[0].name.symbol
+        self.assertEqual([-8, -16, -24], [a.offset, b.offset, c.offset])
+        self.assertEqual(32, function.frame_size)
+        self.assertEqual(3, function.symbol_count)
+        # Uses resolve to the declaring symbol.
+        ret = function.statements[1].expression
+        self.assertIs(c, ret.lhs.symbol)
+        self.assertIs(b, ret.rhs.symbol)
+
+    def test_stack_arguments(self):
+        function = analyse('int f(int a, int b, int c, int d, int e, int g, int h, int i) '
+                           '{ return i; }').functions[0]
+        self.assertEqual(24, function.statements[0].expression.symbol.offset)
+        self.assertEqual(48, function.frame_size)
+
+    def test_sibling_blocks_share_slots(self):
+        function = analyse('''int f() {
+            int a = 1;
+            if (a) { int b = 2; int c = 3; } else { int d = 4; }
+            return a;
+        }''').functions[0]
+        body, else_body = function.statements[1].body, function.statements[1].else_body
+        self.assertEqual(body[0].name.symbol.offset, else_body[0].name.symbol.offset)
+        self.assertEqual(32, function.frame_size)
+        self.assertEqual(4, function.symbol_count)
+
+    def test_shadowing(self):
+        function = analyse('''int f(int a) {
+            if (a) { int a = 2; return a; }
+            return a;
+        }''').functions[0]
+        inner = function.statements[0].body
+        self.assertIs(inner[0].name.symbol, inner[1].expression.symbol)
+        self.assertIs(function.arguments[0].name.symbol, function.statements[1].expression.symbol)
+
+    def test_errors(self):
+        with self.assertRaises(Exception) as raised:
+            analyse('int f(int a) { int a = 1; int b; int b; return c + d; }')
+        message = str(raised.exception)
+        for name in ('Duplicate declaration of a', 'Duplicate declaration of b',
+                     'Undeclared variable c', 'Undeclared variable d'):
+            self.assertIn(name, message)
+        self.assertRaisesRegex(Exception, 'Duplicate definition of function f',
+                               analyse, 'int f() { return 0; } int f() { return 1; }')
+
+    def test_deep_nesting(self):
+        depth = 50
+        source = 'int f(int x) {' + ' if (x) {' * depth + ' x = x + 1;' + ' }' * depth + ' return x; }'
+        function = analyse(source).functions[0]
+        stmt = function.statements[0]
+        while isinstance(stmt, IfStatement):
+            stmt = stmt.body[0]
+        self.assertIs(function.arguments[0].name.symbol, stmt.lhs.symbol)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import json
+import socket
+import shutil
+import tempfile
+import threading
+import unittest
+
+import server
+
+GOOD = 'int main() { return 1 + 2; }'
+BAD = 'int main() { return ; ; }'
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tmp, 'pycc.sock')
+        # No worker processes, so the test runs quickly; the pool is the same
+        # code path with the compile moved into another process.
+        self.server = server.CompileServer(self.socket_path, workers=0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        if self.thread.is_alive():
+            self.server.shutdown()
+            self.thread.join()
+        self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, source):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'w') as f:
+            f.write(source)
+        return path
+
+    def test_compile(self):
+        client = server.Client(self.socket_path)
+        try:
+            response = client.compile(self.write('a.c', GOOD))
+        finally:
+            client.close()
+        self.assertTrue(response['ok'])
+        self.assertIn('main:', response['assembly'])
+
+    def test_diagnostics(self):
+        path = self.write('bad.c', BAD)
+        client = server.Client(self.socket_path)
+        try:
+            response = client.compile(path)
+            # The connection stays usable after a failed compile.
+            second = client.compile(self.write('a.c', GOOD))
+        finally:
+            client.close()
+        self.assertFalse(response['ok'])
+        self.assertTrue(response['error'].startswith(path + ': error:'))
+        self.assertTrue(second['ok'])
+
+    def test_compile_remote(self):
+        sources = [self.write('f{0}.c'.format(i), GOOD) for i in range(8)]
+        sources.append(self.write('bad.c', BAD))
+        errors = server.compile_remote(self.socket_path, sources, optimize=1, jobs=4)
+        self.assertEqual(1, len(errors))
+        for source in sources[:-1]:
+            self.assertTrue(os.path.exists(source[:-2] + '.s'))
+        self.assertFalse(os.path.exists(sources[-1][:-2] + '.s'))
+
+    def test_bad_requests(self):
+        client = server.Client(self.socket_path)
+        try:
+            responses = [client.request(message) for message in
+                         ({'optimize': 1}, [1, 2], {'source': 'a.c', 'include': 'dir'})]
+            client.file.write(b'not json\n')
+            client.file.flush()
+            responses.append(json.loads(client.file.readline()))
+            # The connection stays usable.
+            last = client.compile(self.write('a.c', GOOD))
+        finally:
+            client.close()
+        for response in responses:
+            self.assertFalse(response['ok'])
+            self.assertTrue(response['error'].startswith('bad request'))
+        self.assertTrue(last['ok'])
+
+    def test_worker_pool(self):
+        socket_path = os.path.join(self.tmp, 'pool.sock')
+        pool = server.CompileServer(socket_path, workers=1)
+        thread = threading.Thread(target=pool.serve_forever)
+        thread.start()
+        try:
+            client = server.Client(socket_path)
+            try:
+                response = client.compile(self.write('a.c', GOOD))
+            finally:
+                client.close()
+        finally:
+            pool.shutdown()
+            thread.join()
+            pool.server_close()
+        self.assertTrue(response['ok'])
+        self.assertIn('main:', response['assembly'])
+        self.assertFalse(os.path.exists(socket_path))
+
+    def test_socket_path_in_use(self):
+        with self.assertRaises(Exception):
+            server.CompileServer(self.socket_path, workers=0)
+        # The running server is still reachable.
+        client = server.Client(self.socket_path)
+        client.close()
+        path = self.write('notes.txt', 'keep')
+        with self.assertRaises(Exception):
+            server.CompileServer(path, workers=0)
+        self.assertTrue(os.path.exists(path))
+
+    def test_stale_socket_replaced(self):
+        socket_path = os.path.join(self.tmp, 'stale.sock')
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(socket_path)
+        stale.close()
+        replacement = server.CompileServer(socket_path, workers=0)
+        replacement.server_close()
+        self.assertFalse(os.path.exists(socket_path))
+
+    def test_close_keeps_a_newer_socket(self):
+        socket_path = os.path.join(self.tmp, 'other.sock')
+        first = server.CompileServer(socket_path, workers=0)
+        os.remove(socket_path)
+        second = server.CompileServer(socket_path, workers=0)
+        first.server_close()
+        self.assertTrue(os.path.exists(socket_path))
+        second.server_close()
+        self.assertFalse(os.path.exists(socket_path))
+
+    def test_shutdown(self):
+        server.shutdown(self.socket_path)
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+
+if __name__ == '__main__':
+    unittest.main()
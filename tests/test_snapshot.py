@@ -0,0 +1,129 @@
+import os
+import glob
+import shutil
+import tempfile
+import unittest
+
+from lexer import lex
+from parser import parse, Int, Function
+from codegen import codegen
+from optimizer import optimize
+from bench import generator
+from visitor import walk
+import arena
+import snapshot
+
+PROGRAMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'programs')
+
+def describe(token):
+    return (str(token), token.line, token.column, token.offset, token.end)
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def sources(self):
+        for path in sorted(glob.glob(os.path.join(PROGRAMS, '*.c'))):
+            with open(path) as f:
+                yield os.path.basename(path), f.read()
+        yield 'generated', generator.generate('functions', 10, seed=4)
+
+    def test_varint(self):
+        for value in (0, 1, 127, 128, 300, 1 << 40):
+            out = bytearray()
+            snapshot.write_varint(out, value)
+            self.assertEqual((value, len(out)), snapshot.read_varint(out, 0))
+        for value in (0, -1, 1, -(1 << 31), 1 << 70):
+            self.assertEqual(value, snapshot.unzigzag(snapshot.zigzag(value)))
+
+    def test_tokens_round_trip(self):
+        for name, source in self.sources():
+            with self.subTest(program=name):
+                tokens = lex(source)
+                snapshot.save_tokens(tokens, self.path)
+                with snapshot.load(self.path) as loaded:
+                    loaded_tokens = loaded.token_list()
+                    self.assertEqual(len(tokens), len(loaded_tokens))
+                    self.assertEqual(describe(tokens[-1]), describe(loaded_tokens[-1]))
+                    self.assertEqual([describe(token) for token in tokens],
+                                     [describe(token) for token in loaded_tokens])
+                    self.assertEqual(str(parse(tokens)), str(parse(list(loaded_tokens))))
+
+    def test_program_round_trip(self):
+        for name, source in self.sources():
+            with self.subTest(program=name):
+                snapshot.save_program(parse(lex(source)), self.path)
+                with snapshot.load(self.path) as loaded:
+                    self.assertEqual(str(parse(lex(source))), str(loaded.program()))
+
+    def test_passes_run_on_loaded_programs(self):
+        for name, source in self.sources():
+            for level in (0, 2):
+                with self.subTest(program=name, level=level):
+                    expected = codegen(optimize(parse(lex(source)), level), level=level)
+                    snapshot.save_program(parse(lex(source)), self.path)
+                    with snapshot.load(self.path) as loaded:
+                        program = optimize(loaded.program(), level)
+                        self.assertEqual(expected, codegen(program, level=level))
+
+    def test_nodes_are_decoded_lazily(self):
+        source = generator.generate('functions', 20)
+        snapshot.save_program(parse(lex(source)), self.path)
+        with snapshot.load(self.path) as loaded:
+            program = loaded.program()
+            self.assertEqual(0, loaded.decoded)
+            last = program.functions[-1]
+            self.assertIsInstance(last, Function)
+            self.assertEqual('main', last.name.value)
+            # The program, and the last function with every node below it.
+            self.assertEqual(1 + len(list(walk(last))), loaded.decoded)
+            self.assertIs(last, program.functions[-1])
+            self.assertEqual(None, last.frame_size)
+            self.assertIn('_snapshot', program.functions[0].__dict__)
+
+    def test_eager_program(self):
+        for name, source in self.sources():
+            with self.subTest(program=name):
+                snapshot.save_program(parse(lex(source)), self.path)
+                with snapshot.load(self.path) as loaded:
+                    program = loaded.program(eager=True)
+                    self.assertEqual(len(list(walk(program))), loaded.decoded)
+                    self.assertEqual(str(parse(lex(source))), str(program))
+
+    def test_values(self):
+        source = 'int f() { x = 2147483648; y = -1; z = 1.5; s = "str"; return 0; }'
+        program = parse(lex(source))
+        program.functions[0].statements[1].rhs.operand.value = Int(-7)
+        snapshot.save_program(program, self.path)
+        with snapshot.load(self.path) as loaded:
+            self.assertEqual(str(program), str(loaded.program()))
+
+    def test_views(self):
+        source = generator.generate('statements', 30, seed=2)
+        snapshot.save_program(arena.parse(lex(source)), self.path)
+        with snapshot.load(self.path) as loaded:
+            self.assertEqual(str(parse(lex(source))), str(loaded.program()))
+
+    def test_deep_tree(self):
+        source = 'int main() { return ' + ' + '.join(['1'] * 100000) + '; }'
+        snapshot.save_program(parse(lex(source)), self.path)
+        with snapshot.load(self.path) as loaded:
+            self.assertEqual(str(optimize(loaded.program())),
+                             str(optimize(parse(lex('int main() { return 100000; }')))))
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'int main() { return 0; }')
+        with self.assertRaises(Exception):
+            snapshot.load(self.path)
+        snapshot.save_tokens(lex('int'), self.path)
+        with snapshot.load(self.path) as loaded:
+            with self.assertRaises(Exception):
+                loaded.program()
+
+if __name__ == '__main__':
+    unittest.main()
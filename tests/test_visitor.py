@@ -0,0 +1,150 @@
+import io
+import unittest
+
+import arena
+import codegen
+import semantic
+from lexer import lex, TokenAdditionOperator, TokenAssignmentOperator, TokenKeyword
+from parser import (
+    parse,
+    parse_expression,
+    Int,
+    Constant,
+    Variable,
+    BinaryOperationExpression,
+    IfStatement,
+    AssignmentStatement,
+    ReturnStatement,
+    Argument,
+    Function,
+    Program,
+)
+from optimizer import fold_expression
+from visitor import Visitor, Transformer, walk, format_tree
+
+DEPTH = 100000
+
+class Order(Visitor):
+    ''' Records the nodes of a tree entered and left'''
+    def __init__(self):
+        self.events = []
+
+    def visit_BinaryOperationExpression(self, node):
+        self.events.append('pre ' + node.operator.value)
+        yield node.lhs
+        self.events.append('in ' + node.operator.value)
+        yield node.rhs
+        self.events.append('post ' + node.operator.value)
+
+    def visit_Variable(self, node):
+        self.events.append(node.value)
+
+class Rename(Transformer):
+    ''' Replaces every variable a by b'''
+    def visit_Variable(self, node):
+        if node.value == 'a':
+            return Variable('b')
+        return node
+
+def plus(lhs, rhs):
+    return BinaryOperationExpression(TokenAdditionOperator('+'), lhs, rhs)
+
+def one():
+    return Constant(Int(1))
+
+def right_chain(depth):
+    # 1 + (1 + (1 + ...)), which the parser would build by recursing.
+    expr = one()
+    for level in range(depth):
+        expr = plus(one(), expr)
+    return expr
+
+def function(statements, arguments=()):
+    int_type = TokenKeyword('int')
+    return Function(int_type, lex('f')[0],
+                    [Argument(int_type, Variable(name)) for name in arguments],
+                    statements)
+
+class TestVisitor(unittest.TestCase):
+    def test_orders(self):
+        visitor = Order()
+        visitor.visit(parse_expression(lex('a + b * c')))
+        self.assertEqual(visitor.events,
+                         ['pre +', 'a', 'in +', 'pre *', 'b', 'in *', 'c', 'post *', 'post +'])
+
+    def test_results(self):
+        class Depth(Visitor):
+            def visit_BinaryOperationExpression(self, node):
+                lhs = yield node.lhs
+                rhs = yield node.rhs
+                return 1 + max(lhs, rhs)
+
+            def visit_Constant(self, node):
+                return 0
+
+            def visit_Variable(self, node):
+                return 0
+
+        self.assertEqual(Depth().visit(parse_expression(lex('1 + 2 * (3 - x)'))), 3)
+
+    def test_transformer(self):
+        program = parse(lex('int f(int b) { int a = 1; if (a) { return a + b; } return a; }'))
+        Rename().visit(program)
+        self.assertNotIn('(Variable a)', str(program))
+        self.assertEqual(str(program).count('(Variable b)'), 6)
+
+    def test_dispatch_follows_subclasses(self):
+        view = arena.from_program(parse(lex('int f(int a) { return a + 1; }')))
+        self.assertIsNot(type(view), Program)
+        visitor = Order()
+        visitor.visit(view.functions[0].statements[0].expression)
+        self.assertEqual(visitor.events, ['pre +', 'a', 'in +', 'post +'])
+        self.assertIs(Order.dispatch(arena.view_types[arena.node_codes[Variable]]),
+                      Order.visit_Variable)
+        Rename().visit(view)
+        self.assertEqual(str(view), str(parse(lex('int f(int b) { return b + 1; }'))))
+
+    def test_walk(self):
+        names = [type(node).__name__ for node in walk(parse_expression(lex('-a + f(b)')))]
+        self.assertEqual(names, ['BinaryOperationExpression', 'UnaryOperationExpression',
+                                 'Variable', 'Call', 'Variable'])
+
+    def test_format_tree(self):
+        source = 'int f(int a) { int b; if (a) { b = "s"; } else { f(a, 1); } return; }'
+        program = parse(lex(source))
+        self.assertEqual(format_tree(program), str(program))
+        self.assertIn('(Declaration int (Variable b) None)', str(program))
+        self.assertIn('(Call f ([(Variable a), (Constant (Int 1))]))', str(program))
+
+class TestDeepTrees(unittest.TestCase):
+    def test_deep_left_chain(self):
+        program = parse(lex('int main() { int a = 1; return ' + ' + '.join(['a'] * DEPTH) + '; }'))
+        text = str(program)
+        self.assertTrue(text.endswith('(Variable a)))])])'))
+        self.assertEqual(text.count('(BinaryOp +'), DEPTH - 1)
+        out = io.StringIO()
+        codegen.codegen(program, out)
+        self.assertEqual(out.getvalue().count('addl'), DEPTH - 1)
+
+    def test_deep_right_chain(self):
+        expr = right_chain(DEPTH)
+        self.assertEqual(str(expr).count('(BinaryOp +'), DEPTH)
+        self.assertEqual(str(fold_expression(expr)), '(Constant (Int {0}))'.format(DEPTH + 1))
+        out = io.StringIO()
+        codegen.codegen(Program([function([ReturnStatement(right_chain(DEPTH))])]), out)
+        self.assertEqual(out.getvalue().count('pushq %rax'), DEPTH)
+
+    def test_deep_nested_ifs(self):
+        assign = TokenAssignmentOperator('+=')
+        body = [AssignmentStatement(assign, Variable('x'), one())]
+        for level in range(DEPTH):
+            body = [IfStatement(Variable('x'), body, [])]
+        program = Program([function(body + [ReturnStatement(Variable('x'))], ['x'])])
+        semantic.analyse(program)
+        self.assertEqual(str(program).count('(IfStatement'), DEPTH)
+        out = io.StringIO()
+        codegen.codegen(program, out)
+        self.assertEqual(out.getvalue().count('je '), DEPTH)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,289 @@
+'''Passes over the AST that keep their place on an explicit stack.
+
+A pass is a Visitor subclass with a visit_<Class> method for each kind of
+node it handles. A method for a leaf returns its result. A method for a
+node with children is a generator: it yields each child it wants visited,
+receives that child's result back from the yield, and returns its own
+result. Code before the first yield runs in pre-order, code after the last
+in post-order, and code in between sees the children done so far. The
+generators of the nodes being visited are kept on a list instead of the
+Python call stack, so a tree may be as deep as memory allows.
+'''
+from types import GeneratorType
+
+# The attributes holding each node class's children, and how:
+#
+#   node      a node
+#   optional  a node or None
+#   list      a list of nodes
+#   constant  a node, or a str that is not visited
+#
+# Classes are named rather than imported so that parser.py can format its
+# nodes with this module.
+children = {
+    'Int': (),
+    'Float': (),
+    'Constant': (('value', 'constant'),),
+    'Variable': (),
+    'UnaryOperationExpression': (('operand', 'node'),),
+    'BinaryOperationExpression': (('lhs', 'node'), ('rhs', 'node')),
+    'IfStatement': (('condition', 'node'), ('body', 'list'), ('else_body', 'list')),
+    'Declaration': (('name', 'node'), ('initializer', 'optional')),
+    'AssignmentStatement': (('lhs', 'node'), ('rhs', 'node')),
+    'ExpressionStatement': (('expression', 'optional'),),
+    'ReturnStatement': (('expression', 'optional'),),
+    'Argument': (('name', 'node'),),
+    'Function': (('arguments', 'list'), ('statements', 'list')),
+    'Call': (('arguments', 'list'),),
+    'Program': (('functions', 'list'),),
+}
+
+# children, resolved for each class met, including subclasses like the
+# arena's views.
+class_children = {}
+
+def child_fields(node_type):
+    fields = class_children.get(node_type)
+    if fields is None:
+        fields = ()
+        for base in node_type.__mro__:
+            if base.__name__ in children:
+                fields = children[base.__name__]
+                break
+        class_children[node_type] = fields
+    return fields
+
+def iter_children(node):
+    '''The child nodes of node, in order.'''
+    for name, how in child_fields(type(node)):
+        value = getattr(node, name)
+        if how == 'list':
+            yield from value
+        elif value is not None and not isinstance(value, str):
+            yield value
+
+def walk(root):
+    '''Every node below and including root, in pre-order.'''
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(list(iter_children(node))))
+
+class Visitor():
+    ''' Calls a visit_<Class> method for each node, without recursing
+
+    Methods are looked up along the node class's MRO once per class and
+    kept in a table, so subclasses of the node classes, like the arena's
+    views, are visited as the class they extend. A class with no method is
+    handed to generic_visit, which visits its children.
+    '''
+    methods = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.methods = {}
+
+    @classmethod
+    def dispatch(cls, node_type):
+        '''The function visiting nodes of node_type.'''
+        method = cls.methods.get(node_type)
+        if method is None:
+            method = cls.generic_visit
+            for base in node_type.__mro__:
+                found = getattr(cls, 'visit_' + base.__name__, None)
+                if found is not None:
+                    method = found
+                    break
+            cls.methods[node_type] = method
+        return method
+
+    def visit(self, root):
+        '''Visit root and return its method's result.'''
+        methods = self.methods
+        dispatch = self.dispatch
+        value = (methods.get(type(root)) or dispatch(type(root)))(self, root)
+        if type(value) is not GeneratorType:
+            return value
+        stack = [value]
+        value = None
+        while stack:
+            try:
+                node = stack[-1].send(value)
+            except StopIteration as stop:
+                stack.pop()
+                value = stop.value
+                continue
+            value = (methods.get(type(node)) or dispatch(type(node)))(self, node)
+            if type(value) is GeneratorType:
+                stack.append(value)
+                value = None
+        return value
+
+    def generic_visit(self, node):
+        if child_fields(type(node)):
+            return self.visit_children(node)
+        return None
+
+    def visit_children(self, node):
+        for child in iter_children(node):
+            yield child
+
+class Transformer(Visitor):
+    ''' A Visitor whose methods return the node to put in place of the one
+    visited
+
+    generic_visit stores each child's replacement back in its parent, so a
+    pass only needs methods for the nodes it rewrites. Attributes are only
+    assigned when a child was replaced, and lists are assigned whole, which
+    is how the arena's views take changes.
+    '''
+    def generic_visit(self, node):
+        if child_fields(type(node)):
+            return self.visit_children(node)
+        return node
+
+    def visit_children(self, node):
+        for name, how in child_fields(type(node)):
+            value = getattr(node, name)
+            if how == 'list':
+                replaced = []
+                for child in value:
+                    replaced.append((yield child))
+                if any(new is not old for new, old in zip(replaced, value)):
+                    setattr(node, name, replaced)
+            elif value is not None and not isinstance(value, str):
+                replacement = yield value
+                if replacement is not value:
+                    setattr(node, name, replacement)
+        return node
+
+class Printer(Visitor):
+    ''' Formats a tree as nested parenthesised text
+
+    Pieces are appended to one list as they are reached, so the cost is
+    linear in the size of the text however deeply the tree nests.
+    '''
+    def __init__(self):
+        self.parts = []
+
+    def format(self, node):
+        self.parts = []
+        self.visit(node)
+        return ''.join(self.parts)
+
+    def sequence(self, nodes):
+        write = self.parts.append
+        write('[')
+        for index, node in enumerate(nodes):
+            if index:
+                write(', ')
+            yield node
+        write(']')
+
+    def optional(self, node):
+        if node is None:
+            self.parts.append('None')
+        else:
+            yield node
+
+    def generic_visit(self, node):
+        self.parts.append(str(node))
+
+    def visit_Int(self, node):
+        self.parts.append("(Int {0})".format(node.value))
+
+    def visit_Float(self, node):
+        self.parts.append("(Float {0})".format(node.value))
+
+    def visit_Constant(self, node):
+        write = self.parts.append
+        if isinstance(node.value, str):
+            write("(Constant {0})".format(node.value))
+            return
+        write("(Constant ")
+        yield node.value
+        write(")")
+
+    def visit_Variable(self, node):
+        self.parts.append("(Variable {0})".format(node.value))
+
+    def visit_UnaryOperationExpression(self, node):
+        write = self.parts.append
+        write("(UnaryOp {0} ".format(node.operator.value))
+        yield node.operand
+        write(")")
+
+    def visit_BinaryOperationExpression(self, node):
+        write = self.parts.append
+        write("(BinaryOp {0} ".format(node.operator.value))
+        yield node.lhs
+        write(" ")
+        yield node.rhs
+        write(")")
+
+    def visit_IfStatement(self, node):
+        write = self.parts.append
+        write("(IfStatement ")
+        yield node.condition
+        write(" ")
+        yield from self.sequence(node.body)
+        write(" ")
+        yield from self.sequence(node.else_body)
+        write(")")
+
+    def visit_Declaration(self, node):
+        write = self.parts.append
+        write("(Declaration {0} ".format(node.type_name.value))
+        yield node.name
+        write(" ")
+        yield from self.optional(node.initializer)
+        write(")")
+
+    def visit_AssignmentStatement(self, node):
+        write = self.parts.append
+        write("(AssignmentStatement {0} ".format(node.op.value))
+        yield node.lhs
+        write(" ")
+        yield node.rhs
+        write(")")
+
+    def visit_ExpressionStatement(self, node):
+        self.parts.append("(ExpressionStatement ")
+        yield from self.optional(node.expression)
+        self.parts.append(")")
+
+    def visit_ReturnStatement(self, node):
+        self.parts.append("(ReturnStatement ")
+        yield from self.optional(node.expression)
+        self.parts.append(")")
+
+    def visit_Argument(self, node):
+        write = self.parts.append
+        write("(Argument {0} ".format(node.type_name))
+        yield node.name
+        write(")")
+
+    def visit_Function(self, node):
+        write = self.parts.append
+        write("(Function {0} {1} (".format(node.return_type, node.name))
+        yield from self.sequence(node.arguments)
+        write(") ")
+        yield from self.sequence(node.statements)
+        write(")")
+
+    def visit_Call(self, node):
+        write = self.parts.append
+        write("(Call {0} (".format(node.name))
+        yield from self.sequence(node.arguments)
+        write("))")
+
+    def visit_Program(self, node):
+        write = self.parts.append
+        write("(Program ")
+        yield from self.sequence(node.functions)
+        write(")")
+
+def format_tree(node):
+    '''The text of node and everything below it.'''
+    return Printer().format(node)